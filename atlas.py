@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图集输出 - 将一张全景图的所有视角渲染到同一张图集（sprite sheet）中，
+各视角的采样坐标拼接成一张大网格，只调用一次 cv2.remap；
+同时写出 JSON 索引记录每个视角的角度和在图集中的位置，可用 AtlasReader 取回单个视角
+
+大批量处理时每张全景图只产生两个文件，显著减少文件系统元数据操作
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from encoders import write_buffer
+from interpolation import resolve_interpolation
+from projection import compute_perspective_maps, get_base_grid
+from roi import REMAP_MAX_SIDE, get_remap_plan, remap_with_plan
+
+ATLAS_INDEX_VERSION = 1
+# cv2.remap 要求网格的宽高小于 SHRT_MAX
+_MAX_MAP_SIDE = 32767
+
+
+def atlas_grid(n_views, out_size, columns=None):
+    """
+    计算图集的列数和行数，默认接近正方形
+    返回: (columns, rows)，图集尺寸超出 cv2.remap 限制时抛出 ValueError
+    """
+    if columns is None:
+        columns = max(1, int(math.ceil(math.sqrt(n_views))))
+    rows = max(1, int(math.ceil(n_views / columns)))
+    out_w, out_h = out_size
+    if columns * out_w > _MAX_MAP_SIDE or rows * out_h > _MAX_MAP_SIDE:
+        raise ValueError(f"图集尺寸 {columns * out_w}x{rows * out_h} 超出上限 {_MAX_MAP_SIDE}，请减小输出尺寸或视角数")
+    return columns, rows
+
+
+def _compute_atlas_maps(src_w, src_h, fov, views, out_size, flip_vertical, map_cache, columns):
+    out_w, out_h = out_size
+    columns, rows = atlas_grid(len(views), out_size, columns)
+    map_x = np.zeros((rows * out_h, columns * out_w), dtype=np.float32)
+    map_y = np.zeros_like(map_x)
+    tiles = []
+    for i, (view_index, theta, phi) in enumerate(views):
+        x, y = (i % columns) * out_w, (i // columns) * out_h
+        base_grid = get_base_grid(fov, phi, out_size, map_cache)
+        vx, vy = compute_perspective_maps(src_w, src_h, fov, theta, phi, out_size, base_grid, flip_vertical)
+        map_x[y:y + out_h, x:x + out_w] = vx
+        map_y[y:y + out_h, x:x + out_w] = vy
+        tiles.append((view_index, theta, phi, x, y))
+    map_x.flags.writeable = False
+    map_y.flags.writeable = False
+    return map_x, map_y, tuple(tiles)
+
+
+def get_atlas_maps(src_w, src_h, fov, views, out_size, flip_vertical=False, map_cache=None, columns=None):
+    """
+    获取图集的拼接采样坐标，提供 map_cache（RemapCache）时同一布局只计算一次
+    views: [(view_index, theta, phi), ...]
+    返回: (map_x, map_y, tiles)，tiles 为 ((view_index, theta, phi, x, y), ...)
+    """
+    if map_cache is None:
+        return _compute_atlas_maps(src_w, src_h, fov, views, out_size, flip_vertical, map_cache, columns)
+    key = ('atlas', src_w, src_h, round(float(fov), 6), tuple((i, float(t), float(p)) for i, t, p in views),
+           tuple(out_size), bool(flip_vertical), columns)
+    return map_cache.get_or_compute(
+        key, lambda: _compute_atlas_maps(src_w, src_h, fov, views, out_size, flip_vertical, map_cache, columns))
+
+
+def render_atlas(img, fov, views, out_size, flip_vertical=False, map_cache=None, interpolation='lanczos',
+                 columns=None):
+    """
+    将所有视角渲染到一张图集中（一次 cv2.remap）
+    返回: (atlas, index)，index 为图集索引字典（不含图集文件名）
+    """
+    h, w = img.shape[:2]
+    out_w, out_h = out_size
+    interpolation = resolve_interpolation(interpolation, w, fov, out_size)
+    if max(w, h) > REMAP_MAX_SIDE:
+        # 超出 cv2.remap 尺寸限制的全景图无法一次渲染整张图集，逐个视角分块渲染后拼入图集
+        n_columns, n_rows = atlas_grid(len(views), out_size, columns)
+        atlas = np.zeros((n_rows * out_h, n_columns * out_w) + img.shape[2:], dtype=img.dtype)
+        tiles = []
+        for i, (view_index, theta, phi) in enumerate(views):
+            x, y = (i % n_columns) * out_w, (i // n_columns) * out_h
+            plan = get_remap_plan(w, h, fov, theta, phi, out_size, map_cache, None, flip_vertical, interpolation)
+            atlas[y:y + out_h, x:x + out_w] = remap_with_plan(img, plan, interpolation)
+            tiles.append((view_index, theta, phi, x, y))
+    else:
+        map_x, map_y, tiles = get_atlas_maps(w, h, fov, views, out_size, flip_vertical, map_cache, columns)
+        atlas = cv2.remap(img, map_x, map_y, interpolation=interpolation, borderMode=cv2.BORDER_WRAP)
+        n_columns, n_rows = map_x.shape[1] // out_w, map_x.shape[0] // out_h
+        # 最后一行未使用的格子填充为黑色
+        for i in range(len(tiles), n_columns * n_rows):
+            x, y = (i % n_columns) * out_w, (i // n_columns) * out_h
+            atlas[y:y + out_h, x:x + out_w] = 0
+    index = {
+        'version': ATLAS_INDEX_VERSION,
+        'fov': fov,
+        'tile_width': out_w,
+        'tile_height': out_h,
+        'columns': n_columns,
+        'rows': n_rows,
+        'views': [{'view_index': v, 'theta': t, 'phi': p, 'x': x, 'y': y, 'width': out_w, 'height': out_h}
+                  for v, t, p, x, y in tiles],
+    }
+    return atlas, index
+
+
+def atlas_output_names(input_path, encoder):
+    """图集图片和索引的文件名: 图片名_atlas.jpg / 图片名_atlas.json"""
+    base_name = Path(input_path).stem
+    return f"{base_name}_atlas{encoder.extension}", f"{base_name}_atlas.json"
+
+
+def write_atlas(output_dir, input_path, atlas, index, encoder):
+    """
+    编码并写出图集及其索引（均为先写临时文件再重命名）
+    返回: [图集路径, 索引路径]
+    """
+    image_name, index_name = atlas_output_names(input_path, encoder)
+    image_path = os.path.join(output_dir, image_name)
+    index_path = os.path.join(output_dir, index_name)
+    write_buffer(image_path, encoder.encode(atlas))
+    index = dict(index, image=image_name, source=os.path.basename(input_path))
+    write_buffer(index_path, json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8'))
+    return [image_path, index_path]
+
+
+class AtlasReader:
+    """
+    从图集中取回单个视角
+    index_path: 图集索引（*_atlas.json）路径
+    OpenCV 无法只解码 JPEG/PNG/WebP 的局部区域，图集在第一次读取视角时整体解码一次并缓存，
+    之后取各个视角只是数组切片（不复制）
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        if self.index.get('version') != ATLAS_INDEX_VERSION:
+            raise ValueError(f"不支持的图集索引版本 {self.index.get('version')}")
+        self.image_path = os.path.join(os.path.dirname(index_path), self.index['image'])
+        self._tiles = {v['view_index']: v for v in self.index['views']}
+        self._atlas = None
+
+    def view_indices(self):
+        return sorted(self._tiles)
+
+    def pose(self, view_index):
+        """返回视角的 (theta, phi)"""
+        tile = self._tiles[view_index]
+        return tile['theta'], tile['phi']
+
+    def _load(self):
+        if self._atlas is None:
+            self._atlas = cv2.imread(self.image_path, cv2.IMREAD_UNCHANGED)
+            if self._atlas is None:
+                raise ValueError(f"无法读取图集 {self.image_path}")
+        return self._atlas
+
+    def view(self, view_index):
+        """返回指定视角的图像（图集数组的切片视图）"""
+        tile = self._tiles.get(view_index)
+        if tile is None:
+            raise KeyError(f"图集中没有视角 {view_index}")
+        x, y = tile['x'], tile['y']
+        return self._load()[y:y + tile['height'], x:x + tile['width']]
+
+
+def read_atlas_view(index_path, view_index):
+    """读取图集中的单个视角"""
+    return AtlasReader(index_path).view(view_index)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自动调优 - 用开头几张图片做一次简短的标定，测量不同渲染线程数和 OpenCV 内部线程数（cv2.setNumThreads）
+组合下的吞吐量（每秒视角数），选用最快的组合
+
+最优组合取决于 CPU、全景图和输出尺寸以及插值方式，固定的推荐表无法兼顾；
+标定结果可按主机保存到文件（同一文件可供多台机器共用），之后相同的任务直接使用，不再标定
+"""
+
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import cv2
+
+from decoding import read_panorama
+from encoders import write_buffer
+from probe import probe_image_size
+
+AUTOTUNE_VERSION = 1
+# 标定使用的图片数
+CALIBRATION_IMAGES = 2
+# 每个组合的测量时长（秒）
+TRIAL_SECONDS = 1.0
+
+
+def candidate_configs(cpu_count=None):
+    """
+    候选的 (渲染线程数, OpenCV 线程数) 组合
+    渲染线程数取 1、2、4… 直到核心数；OpenCV 线程数取 1（只靠渲染线程并行）和核心数平均分给各渲染线程的值
+    """
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+    workers = {cpu_count}
+    w = 1
+    while w < cpu_count:
+        workers.add(w)
+        w *= 2
+    configs = []
+    for w in sorted(workers):
+        for c in sorted({1, max(1, cpu_count // w)}):
+            configs.append((w, c))
+    return configs
+
+
+def job_signature(src_size, out_size, interpolation, n_views, backend, reduced_decode=False):
+    """影响最优组合的任务参数，作为保存结果的 key"""
+    return (f"{src_size[0]}x{src_size[1]}|{out_size[0]}x{out_size[1]}|{interpolation}|{n_views}views|"
+            f"{backend}|{'reduced' if reduced_decode else 'full'}")
+
+
+class AutotuneCache:
+    """
+    按主机保存的标定结果
+    path: JSON 文件路径；同一主机的结果在 CPU 核心数或 OpenCV 版本变化后失效
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.host = socket.gethostname()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {'version': AUTOTUNE_VERSION, 'hosts': {}}
+        if data.get('version') != AUTOTUNE_VERSION:
+            return {'version': AUTOTUNE_VERSION, 'hosts': {}}
+        return data
+
+    def _host_entry(self, data):
+        entry = data['hosts'].get(self.host)
+        if entry is None or entry.get('cpu_count') != os.cpu_count() or entry.get('opencv') != cv2.__version__:
+            return None
+        return entry
+
+    def load(self, signature):
+        """返回该任务已保存的结果，没有时返回 None"""
+        entry = self._host_entry(self._read())
+        if entry is None:
+            return None
+        return entry['jobs'].get(signature)
+
+    def latest(self):
+        """返回本机最近一次的标定结果，没有时返回 None"""
+        entry = self._host_entry(self._read())
+        if entry is None or not entry['jobs']:
+            return None
+        return max(entry['jobs'].values(), key=lambda r: r.get('calibrated_at', 0))
+
+    def save(self, signature, result):
+        data = self._read()
+        entry = self._host_entry(data)
+        if entry is None:
+            entry = {'cpu_count': os.cpu_count(), 'opencv': cv2.__version__, 'jobs': {}}
+            data['hosts'][self.host] = entry
+        entry['jobs'][signature] = result
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        write_buffer(self.path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def _measure(render, tasks, workers, cv2_threads, trial_seconds):
+    """
+    以 workers 个线程持续执行 render(*task)，测量 trial_seconds 秒（至少完成每个线程两个任务）
+    返回: 每秒完成的任务数
+    """
+    cv2.setNumThreads(cv2_threads)
+    completed = 0
+    submitted = 0
+    start = time.perf_counter()
+    deadline = start + trial_seconds
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        while time.perf_counter() < deadline or submitted < 2 * workers:
+            while len(pending) < 2 * workers:
+                pending.add(executor.submit(render, *tasks[submitted % len(tasks)]))
+                submitted += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+                completed += 1
+        for future in pending:
+            future.result()
+            completed += 1
+    return completed / (time.perf_counter() - start)
+
+
+def calibrate(render, tasks, candidates=None, trial_seconds=TRIAL_SECONDS):
+    """
+    依次测量各候选组合的吞吐量
+    render: render(*task) 渲染（并编码）一个视角
+    tasks: 标定任务列表，循环使用
+    candidates: [(渲染线程数, OpenCV 线程数), ...]，默认见 candidate_configs
+    返回: {'workers', 'cv2_threads', 'views_per_second', 'results': [[渲染线程数, OpenCV 线程数, 每秒视角数], ...]}，
+        没有标定任务（例如全部视角都被排除）时返回 None
+    """
+    if not tasks:
+        return None
+    if candidates is None:
+        candidates = candidate_configs()
+    previous = cv2.getNumThreads()
+    try:
+        # 预热：每个任务先执行一次，采样网格进入缓存，不计入测量
+        for task in tasks:
+            render(*task)
+        results = []
+        for workers, cv2_threads in candidates:
+            rate = _measure(render, tasks, workers, cv2_threads, trial_seconds)
+            results.append([workers, cv2_threads, round(rate, 2)])
+    finally:
+        cv2.setNumThreads(previous)
+    best = max(results, key=lambda r: r[2])
+    return {'workers': best[0], 'cv2_threads': best[1], 'views_per_second': best[2], 'results': results,
+            'calibrated_at': time.time()}
+
+
+def autotune_batch(sample_paths, fov, out_size, view_plan, flip_vertical, map_cache, map_store, interpolation,
+                   encoder, reduced_decode=False, decode_oversample=None, backend='thread', cache_path=None,
+                   trial_seconds=TRIAL_SECONDS):
+    """
+    为批量处理选择渲染线程数和 OpenCV 线程数
+    sample_paths: 标定用的图片（批量处理开头的几张）
+    其余参数同 batch_process.batch_process_images；标定时视角渲染后只编码、不写出
+    标定在当前进程的线程池中进行，结果只适用于线程池和流水线后端（backend 为 'thread' 或 'pipeline'）
+    cache_path: 保存标定结果的文件，已有本机相同任务的结果时直接使用
+    返回: (渲染线程数, OpenCV 线程数)，样本图片都无法读取或没有要渲染的视角时返回 None
+    """
+    from batch_process import equirectangular_to_perspective
+
+    views = view_plan[0]
+    if not sample_paths or not views:
+        return None
+    cache = AutotuneCache(cache_path) if cache_path else None
+    images = []
+    src_size = probe_image_size(sample_paths[0])
+    if cache is not None and src_size is not None:
+        saved = cache.load(job_signature(src_size, out_size, interpolation, len(views), backend, reduced_decode))
+        if saved is not None:
+            print(f"自动调优: 使用已保存的结果（{cache.path}）")
+            return saved['workers'], saved['cv2_threads']
+
+    for path in sample_paths:
+        img = read_panorama(path, fov, out_size, reduced_decode, decode_oversample)
+        if img is not None:
+            images.append(img)
+            if src_size is None:
+                src_size = (img.shape[1], img.shape[0])
+    if not images:
+        return None
+
+    def render(img, theta, phi):
+        out = equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical, map_cache, map_store,
+                                             interpolation)
+        encoder.encode(out)
+
+    candidates = candidate_configs()
+    print(f"自动调优: 用 {len(images)} 张图片测量 {len(candidates)} 种线程组合（每种约 {trial_seconds:g} 秒）...")
+    tasks = [(img, theta, phi) for img in images for _, theta, phi in views]
+    result = calibrate(render, tasks, candidates, trial_seconds)
+    for workers, cv2_threads, rate in result['results']:
+        print(f"  渲染线程 {workers:>3}，OpenCV 线程 {cv2_threads:>3}: {rate:.1f} 视角/秒")
+    if cache is not None:
+        cache.save(job_signature(src_size, out_size, interpolation, len(views), backend, reduced_decode), result)
+        print(f"自动调优结果已保存到 {cache.path}")
+    return result['workers'], result['cv2_threads']
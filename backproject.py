@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+反投影 - 将（编辑过的）透视视角贴回 equirectangular 全景图，是 generate_views_for_image 的逆操作
+
+每个视角只影响全景图上的一块区域（足迹）：先由视角边界计算足迹的包围框（考虑左右环绕和包含天顶/天底的情况），
+逆映射坐标只在包围框内计算并缓存；贴回时按行分段处理，只读写足迹覆盖的行，
+视角重叠处按到视角边缘的距离羽化加权混合（任一视角覆盖的像素完全由视角决定，立方体贴图等不重叠的布局在面与面的
+接缝处也不会透出原图），只在所有视角足迹并集的外缘与原全景图羽化过渡，没有可见接缝
+"""
+
+import argparse
+import math
+import os
+
+import cv2
+import numpy as np
+
+from config import DEFAULT_CONFIG, validate_angle_ranges
+from encoders import OUTPUT_FORMATS, OutputEncoder, write_buffer
+from interpolation import INTERPOLATION_MODES
+from remap_cache import get_default_map_cache
+from views import VIEW_LAYOUTS, load_pose_list, plan_ring_views, plan_views, view_output_filename
+
+# 足迹包围框的余量（像素），容纳插值和边界采样的误差
+FOOTPRINT_MARGIN = 2
+# 默认羽化宽度：视角短边的这一比例内权重从 0 线性增加到 1
+DEFAULT_FEATHER = 0.1
+# 混合时每段的像素数（累加缓冲区的大小上限）
+BLEND_BAND_PIXELS = 1 << 22
+# 视角边缘像素的最小混合权重，保证视角覆盖的像素权重和大于 0
+EDGE_WEIGHT = 1e-3
+# 计算足迹并集外缘的羽化时，羽化宽度对应的低分辨率覆盖网格像素数
+COVERAGE_SAMPLES_PER_FEATHER = 16
+
+
+def _view_edge_coords(src_w, src_h, fov, theta, phi, out_size, flip_vertical):
+    """
+    视角外边缘（像素边界）在全景图上的坐标，按顺时针方向依次经过四条边
+    计算方式与 projection.compute_base_grid / compute_perspective_maps 一致
+    返回: (列坐标, 行坐标)，float64
+    """
+    w_out, h_out = out_size
+    t = math.tan(math.radians(fov) / 2)
+    # 第 j 列像素中心在 x = -t + 2t·j/(w-1)，外边缘在 j = -0.5 和 j = w-0.5
+    tx = t * w_out / max(1, w_out - 1)
+    ty = t * h_out / max(1, h_out - 1)
+    xs = np.linspace(-tx, tx, w_out + 1)
+    ys = np.linspace(ty, -ty, h_out + 1)
+    px = np.concatenate([xs, np.full(h_out, tx), xs[::-1][1:], np.full(h_out - 1, -tx)])
+    py = np.concatenate([np.full(w_out + 1, ty), ys[1:], np.full(w_out, -ty), ys[::-1][1:-1]])
+
+    c, s = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+    z = s * py + c
+    lon = np.arctan2(px, z)
+    lat = np.arctan2(c * py - s, np.hypot(px, z))
+    cols = np.mod(lon / (2 * math.pi) + 0.5 + (theta % 360) / 360.0, 1.0) * src_w
+    rows = (0.5 - lat / math.pi) * src_h
+    if flip_vertical:
+        rows = src_h - 1 - rows
+    return cols, rows
+
+
+def view_footprint(src_w, src_h, fov, theta, phi, out_size, flip_vertical=False, margin=FOOTPRINT_MARGIN):
+    """
+    视角在全景图上的包围框
+    经纬度在天顶/天底以外没有极值点，足迹不含极点时包围框由视角边缘决定；
+    沿边缘累计经度变化，绕行一周说明视角包含极点，此时包围框占满整个宽度并延伸到顶部或底部
+    返回: (起始行, 结束行, 起始列, 列数)，起始列可能使区间跨越右边界环绕回 0
+    """
+    cols, rows = _view_edge_coords(src_w, src_h, fov, theta, phi, out_size, flip_vertical)
+    steps = np.diff(np.append(cols, cols[0]))
+    steps = np.mod(steps + src_w / 2, src_w) - src_w / 2
+    unwrapped = cols[0] + np.concatenate([[0.0], np.cumsum(steps)])
+
+    row_lo, row_hi = rows.min(), rows.max()
+    if abs(unwrapped[-1] - unwrapped[0]) > src_w / 2:
+        x0, length = 0, src_w
+        if rows.mean() < src_h / 2:
+            row_lo = 0
+        else:
+            row_hi = src_h
+    else:
+        lo = int(math.floor(unwrapped.min())) - margin
+        length = int(math.ceil(unwrapped.max())) + margin + 1 - lo
+        if length >= src_w:
+            x0, length = 0, src_w
+        else:
+            x0 = lo % src_w
+    r0 = max(0, int(math.floor(row_lo)) - margin)
+    r1 = min(src_h, int(math.ceil(row_hi)) + margin + 1)
+    return r0, max(r0, r1), x0, length
+
+
+def compute_inverse_maps(src_w, src_h, fov, theta, phi, out_size, flip_vertical=False):
+    """
+    计算全景图像素在视角图上的采样坐标（只计算足迹包围框内的像素）
+    返回: (footprint, map_x, map_y)
+        footprint: view_footprint 的结果 (r0, r1, x0, length)
+        map_x, map_y: float32，形状 (r1-r0, length)，第 k 列对应全景图第 (x0+k) % src_w 列；
+            位于视角相机背面的像素坐标为 -1（权重为 0）
+    """
+    footprint = view_footprint(src_w, src_h, fov, theta, phi, out_size, flip_vertical)
+    r0, r1, x0, length = footprint
+    w_out, h_out = out_size
+    t = math.tan(math.radians(fov) / 2)
+    c, s = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+
+    # 经度（相对视角的水平角）只与列有关，纬度只与行有关
+    cols = (x0 + np.arange(length)) % src_w
+    lon = (cols / src_w - 0.5 - (theta % 360) / 360.0) * (2 * math.pi)
+    sin_lon = np.sin(lon).astype(np.float32)
+    c_cos_lon = (c * np.cos(lon)).astype(np.float32)
+    s_cos_lon = (s * np.cos(lon)).astype(np.float32)
+    rows = np.arange(r0, r1, dtype=np.float64)
+    if flip_vertical:
+        rows = src_h - 1 - rows
+    lat = (0.5 - rows / src_h) * math.pi
+    cos_lat = np.cos(lat).astype(np.float32)[:, None]
+    sin_lat = np.sin(lat)
+    s_sin_lat = (s * sin_lat).astype(np.float32)[:, None]
+    c_sin_lat = (c * sin_lat).astype(np.float32)[:, None]
+
+    # 方向 (X, Y, Z) 绕 X 轴转回 -phi 后为 (X, c·Y + s·Z, c·Z - s·Y) = k·(x, y, 1)
+    kx = np.float32((w_out - 1) / (2 * t))
+    ky = np.float32((h_out - 1) / (2 * t))
+    map_x = np.empty((r1 - r0, length), dtype=np.float32)
+    map_y = np.empty_like(map_x)
+    strip_rows = max(1, BLEND_BAND_PIXELS // 16 // max(1, length))
+    for a in range(0, r1 - r0, strip_rows):
+        b = min(r1 - r0, a + strip_rows)
+        mx, my = map_x[a:b], map_y[a:b]
+        z = np.multiply(cos_lat[a:b], c_cos_lon)
+        z -= s_sin_lat[a:b]
+        behind = z <= 0
+        z[behind] = 1
+        np.multiply(cos_lat[a:b], sin_lon, out=mx)
+        mx /= z
+        mx *= kx
+        mx += np.float32((w_out - 1) / 2)
+        np.multiply(cos_lat[a:b], s_cos_lon, out=my)
+        my += c_sin_lat[a:b]
+        my /= z
+        my *= -ky
+        my += np.float32((h_out - 1) / 2)
+        mx[behind] = -1
+        my[behind] = -1
+    return footprint, map_x, map_y
+
+
+def inverse_map_key(src_w, src_h, fov, theta, phi, out_size, flip_vertical=False):
+    """逆映射坐标的缓存 key"""
+    return ('inverse', int(src_w), int(src_h), float(fov), float(theta), float(phi), int(out_size[0]),
+            int(out_size[1]), bool(flip_vertical))
+
+
+def get_inverse_maps(src_w, src_h, fov, theta, phi, out_size, flip_vertical=False, map_cache=None):
+    """获取逆映射坐标，提供 map_cache（RemapCache）时同一视角只计算一次"""
+    def factory():
+        footprint, map_x, map_y = compute_inverse_maps(src_w, src_h, fov, theta, phi, out_size, flip_vertical)
+        map_x.flags.writeable = False
+        map_y.flags.writeable = False
+        return footprint, map_x, map_y
+
+    if map_cache is None:
+        return factory()
+    return map_cache.get_or_compute(inverse_map_key(src_w, src_h, fov, theta, phi, out_size, flip_vertical),
+                                    factory)
+
+
+def _edge_distance(map_x, map_y, out_size):
+    """采样点到视角边缘的距离（视角像素），视角以外为负"""
+    w_out, h_out = out_size
+    distance = map_x + np.float32(0.5)
+    np.minimum(distance, np.float32(w_out - 0.5) - map_x, out=distance)
+    np.minimum(distance, map_y + np.float32(0.5), out=distance)
+    np.minimum(distance, np.float32(h_out - 0.5) - map_y, out=distance)
+    return distance
+
+
+def _feather_weights(map_x, map_y, out_size, feather):
+    """
+    视角之间的混合权重：按采样点到视角边缘的距离，羽化宽度以内从 EDGE_WEIGHT 线性增加到 1，视角以外为 0
+    视角覆盖的像素权重都大于 0，混合时按权重和归一化，不与原全景图混合
+    """
+    distance = _edge_distance(map_x, map_y, out_size)
+    inside = distance > 0
+    distance *= np.float32(1 / max(1.0, feather * min(out_size)))
+    np.clip(distance, EDGE_WEIGHT, 1, out=distance)
+    distance *= inside
+    return distance
+
+
+def _coverage_alpha(layers, src_w, src_h, feather_px):
+    """
+    足迹并集外缘的羽化：在低分辨率网格上标记所有视角覆盖的位置，按到未覆盖位置的距离计算视角的不透明度
+    （并集内部为 1，外缘 feather_px 个全景图像素以内线性降到 0），左右环绕，全景图上下边缘（两极）不羽化
+    返回: (低分辨率不透明度, 网格间距)；feather_px 小于 1 像素时返回 None（硬边，视角覆盖处完全不透明）
+    """
+    if feather_px < 1:
+        return None
+    step = max(1, int(feather_px // COVERAGE_SAMPLES_PER_FEATHER))
+    grid_h, grid_w = -(-src_h // step), -(-src_w // step)
+    coverage = np.zeros((grid_h, grid_w), dtype=np.uint8)
+    for view, out_size, (r0, r1, x0, length), map_x, map_y in layers:
+        # 取行、列都落在网格点（step 的整数倍）上的采样点
+        row_offset = -r0 % step
+        col_offset = -x0 % step
+        inside = _edge_distance(map_x[row_offset::step, col_offset::step],
+                                map_y[row_offset::step, col_offset::step], out_size) > 0
+        rows = np.arange(r0 + row_offset, r1, step) // step
+        cols = ((x0 + col_offset + np.arange(inside.shape[1]) * step) % src_w) // step
+        block = np.ix_(rows[:inside.shape[0]], cols)
+        coverage[block] = np.maximum(coverage[block], inside)
+    # 左右按环绕补齐，上下补为已覆盖（两极不是足迹的外缘）
+    pad = min(grid_w, int(feather_px // step) + 2)
+    padded = np.concatenate([coverage[:, -pad:], coverage, coverage[:, :pad]], axis=1)
+    padded = np.pad(padded, ((1, 1), (0, 0)), constant_values=1)
+    distance = cv2.distanceTransform(padded, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)[1:-1, pad:-pad]
+    alpha = distance * np.float32(step / feather_px)
+    np.clip(alpha, 0, 1, out=alpha)
+    return alpha, step
+
+
+def _column_segments(x0, length, src_w):
+    """包围框各列在全景图中的位置，跨越右边界时分为两段: [(全景图列切片, 包围框列切片), ...]"""
+    if x0 + length <= src_w:
+        return [(slice(x0, x0 + length), slice(0, length))]
+    split = src_w - x0
+    return [(slice(x0, src_w), slice(0, split)), (slice(0, length - split), slice(split, length))]
+
+
+def paste_views(panorama, views, fov, flip_vertical=False, map_cache=None, interpolation='linear',
+                feather=DEFAULT_FEATHER, dst=None):
+    """
+    将视角贴回全景图
+    panorama: 原全景图，未被视角覆盖的区域保持不变
+    views: [(theta, phi, 视角图), ...]，角度与生成视角时相同，视角图尺寸可以各不相同
+    fov, flip_vertical: 同生成视角时的设置
+    interpolation: 从视角图采样的插值方式（见 interpolation.INTERPOLATION_MODES）或 cv2.INTER_* 标志
+    feather: 羽化宽度（视角短边的比例）
+    dst: 可选的输出数组（可以就是 panorama，就地修改）；默认复制 panorama
+    返回: 贴回后的全景图，只有视角足迹覆盖的行被改写
+    """
+    src_h, src_w = panorama.shape[:2]
+    channels = panorama.shape[2] if panorama.ndim == 3 else 1
+    if isinstance(interpolation, str):
+        interpolation = INTERPOLATION_MODES[interpolation]
+    if dst is None:
+        dst = panorama.copy()
+
+    layers = []
+    for theta, phi, view in views:
+        out_size = (view.shape[1], view.shape[0])
+        footprint, map_x, map_y = get_inverse_maps(src_w, src_h, fov, theta, phi, out_size, flip_vertical,
+                                                   map_cache)
+        layers.append((view, out_size, footprint, map_x, map_y))
+    if not layers:
+        return dst
+
+    row_start = min(layer[2][0] for layer in layers)
+    row_stop = max(layer[2][1] for layer in layers)
+    # 羽化宽度换算为全景图像素（视角短边对应的角度 × 全景图每度的像素数）
+    first_size = layers[0][1]
+    feather_px = feather * fov * min(first_size) / first_size[0] * src_w / 360
+    coverage = _coverage_alpha(layers, src_w, src_h, feather_px)
+    band_rows = max(1, BLEND_BAND_PIXELS // (src_w * channels))
+    for b0 in range(row_start, row_stop, band_rows):
+        b1 = min(row_stop, b0 + band_rows)
+        acc = np.zeros((b1 - b0, src_w, channels), dtype=np.float32)
+        weight_sum = np.zeros((b1 - b0, src_w), dtype=np.float32)
+        for view, out_size, (r0, r1, x0, length), map_x, map_y in layers:
+            lo, hi = max(b0, r0), min(b1, r1)
+            if lo >= hi:
+                continue
+            mx, my = map_x[lo - r0:hi - r0], map_y[lo - r0:hi - r0]
+            weight = _feather_weights(mx, my, out_size, feather)
+            sample = cv2.remap(view, mx, my, interpolation, borderMode=cv2.BORDER_REPLICATE)
+            sample = sample.reshape(hi - lo, length, channels).astype(np.float32)
+            sample *= weight[:, :, None]
+            for pano_cols, box_cols in _column_segments(x0, length, src_w):
+                acc[lo - b0:hi - b0, pano_cols] += sample[:, box_cols]
+                weight_sum[lo - b0:hi - b0, pano_cols] += weight[:, box_cols]
+
+        # 视角覆盖的像素按权重和归一化；只有足迹并集的外缘与原全景图按不透明度混合，足迹以外保持原值
+        covered = weight_sum > 0
+        alpha = covered.astype(np.float32)
+        if coverage is not None:
+            grid, step = coverage
+            g0, g1 = b0 // step, min(grid.shape[0], -(-b1 // step) + 1)
+            band_alpha = cv2.resize(grid[g0:g1], (grid.shape[1] * step, (g1 - g0) * step),
+                                    interpolation=cv2.INTER_LINEAR)
+            alpha *= band_alpha[b0 - g0 * step:b1 - g0 * step, :src_w]
+        acc *= (alpha / np.maximum(weight_sum, EDGE_WEIGHT))[:, :, None]
+        background = panorama[b0:b1].reshape(b1 - b0, src_w, channels).astype(np.float32)
+        background *= (1 - alpha)[:, :, None]
+        acc += background
+        if np.issubdtype(dst.dtype, np.integer):
+            info = np.iinfo(dst.dtype)
+            np.rint(acc, out=acc)
+            np.clip(acc, info.min, info.max, out=acc)
+        dst[b0:b1] = acc.reshape(dst[b0:b1].shape)
+    return dst
+
+
+def backproject_views_for_image(input_path, views_dir, output_path, fov=90, overlap=0.2, pitch_angle=0,
+                                flip_vertical=False, exclude_angle_ranges=None, enable_angle_exclusion=False,
+                                view_plan=None, encoder=None, map_cache=None, interpolation='linear',
+                                feather=DEFAULT_FEATHER):
+    """
+    读取 generate_views_for_image 生成的（编辑过的）视角，贴回原全景图后写入 output_path
+    视角按相同的参数规划（view_plan 见 views.plan_views，默认单圈水平视角），按文件名在 views_dir 中查找，
+    缺失的视角跳过（对应区域保持原图）
+    encoder: 视角文件使用的编码器（决定文件名和扩展名），默认使用配置文件中的输出设置
+    """
+    if map_cache is None:
+        map_cache = get_default_map_cache()
+    if encoder is None:
+        encoder = OutputEncoder()
+    try:
+        panorama = cv2.imread(input_path)
+        if panorama is None:
+            print(f"错误：无法读取图片 {input_path}")
+            return False
+        if view_plan is None:
+            view_plan = plan_ring_views(fov, overlap, pitch_angle, exclude_angle_ranges, enable_angle_exclusion)
+
+        views = []
+        missing = 0
+        for view_index, theta, phi in view_plan[0]:
+            view_path = os.path.join(views_dir, view_output_filename(input_path, view_index, encoder))
+            view = cv2.imread(view_path) if os.path.exists(view_path) else None
+            if view is None:
+                missing += 1
+                continue
+            views.append((theta, phi, view))
+        if not views:
+            print(f"错误：{views_dir} 中没有找到 {os.path.basename(input_path)} 的视角")
+            return False
+
+        result = paste_views(panorama, views, fov, flip_vertical, map_cache, interpolation, feather, dst=panorama)
+        output_encoder = OutputEncoder({**encoder.options, 'output_format': os.path.splitext(output_path)[1][1:]})
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        write_buffer(output_path, output_encoder.encode(result))
+        if missing:
+            print(f"完成反投影 {os.path.basename(input_path)}: 贴回 {len(views)} 个视角，缺失 {missing} 个")
+        else:
+            print(f"完成反投影 {os.path.basename(input_path)}: 贴回 {len(views)} 个视角")
+        return True
+
+    except Exception as e:
+        print(f"反投影 {input_path} 时出错: {str(e)}")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将编辑过的透视视角贴回全景图（batch_process.py 的逆操作）')
+    parser.add_argument('input_path', help='原全景图路径')
+    parser.add_argument('views_dir', help='该全景图的视角目录（batch_process.py 输出目录下以图片名命名的子目录）')
+    parser.add_argument('output_path', help='输出全景图路径（扩展名决定格式：jpg/webp/png）')
+    parser.add_argument('--fov', type=int, default=90, help='视场角（度），默认90')
+    parser.add_argument('--overlap', type=float, default=0.2, help='重叠比例（0-1），默认0.2')
+    parser.add_argument('--pitch-angle', type=float, default=0, help='俯仰角度（度），默认0（水平）')
+    parser.add_argument('--exclude-angles', type=float, nargs=2, action='append',
+                       metavar=('START', 'END'), help='排除的角度范围，格式: START END，可多次使用')
+    parser.add_argument('--enable-exclusion', action='store_true', help='启用角度排除功能')
+    parser.add_argument('--flip-vertical', action='store_true', help='生成视角时启用了垂直翻转')
+    parser.add_argument('--layout', choices=VIEW_LAYOUTS, default='ring', help='视角布局，同 batch_process.py，默认ring')
+    parser.add_argument('--ring-pitches', type=float, nargs='+', default=None, metavar='PITCH',
+                       help='rings 布局各圈的俯仰角')
+    parser.add_argument('--poses', default=None, metavar='FILE', help='poses 布局的视角列表文件')
+    parser.add_argument('--format', choices=['jpg', 'webp', 'png'], default=DEFAULT_CONFIG['output_format'],
+                       help='视角文件的格式，默认jpg')
+    parser.add_argument('--quality', type=int, default=None, help='输出 JPEG/WebP 质量（0-100），默认使用配置文件中的值')
+    parser.add_argument('--interpolation', choices=list(INTERPOLATION_MODES), default='linear',
+                       help='从视角采样的插值方式，默认linear')
+    parser.add_argument('--feather', type=float, default=DEFAULT_FEATHER,
+                       help=f'重叠处的羽化宽度（视角短边的比例），默认{DEFAULT_FEATHER}')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_path):
+        print(f"错误：输入图片 {args.input_path} 不存在")
+        return
+    if not os.path.isdir(args.views_dir):
+        print(f"错误：视角目录 {args.views_dir} 不存在")
+        return
+    if os.path.splitext(args.output_path)[1][1:].lower() not in OUTPUT_FORMATS:
+        print(f"错误：不支持的输出格式，扩展名可选: {', '.join(sorted(set(OUTPUT_FORMATS)))}")
+        return
+    if args.overlap < 0 or args.overlap >= 1:
+        print("错误：重叠比例必须在0到1之间")
+        return
+    if not 0 <= args.feather <= 0.5:
+        print("错误：羽化宽度必须在0到0.5之间")
+        return
+
+    exclude_angle_ranges = args.exclude_angles or []
+    # 与 batch_process.py 相同：指定了排除范围即启用角度排除，保证两个工具规划出相同的视角
+    enable_angle_exclusion = args.enable_exclusion or bool(exclude_angle_ranges)
+    if exclude_angle_ranges:
+        is_valid, error_msg = validate_angle_ranges(exclude_angle_ranges)
+        if not is_valid:
+            print(f"错误：{error_msg}")
+            return
+    poses = None
+    if args.layout == 'poses':
+        if not args.poses:
+            print("错误：poses 布局需要使用 --poses 指定视角列表文件")
+            return
+        try:
+            poses = load_pose_list(args.poses)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print(f"错误：无法读取视角列表 {args.poses}: {str(e)}")
+            return
+    fov = 90 if args.layout == 'cubemap' else args.fov
+    view_plan = plan_views(args.layout, fov, args.overlap, args.pitch_angle, exclude_angle_ranges,
+                           enable_angle_exclusion, args.ring_pitches, poses)
+
+    options = {'output_format': args.format}
+    if args.quality is not None:
+        options['jpeg_quality'] = args.quality
+        options['webp_quality'] = args.quality
+    try:
+        encoder = OutputEncoder(options)
+    except ValueError as e:
+        print(f"错误：{str(e)}")
+        return
+
+    backproject_views_for_image(args.input_path, args.views_dir, args.output_path, fov, args.overlap,
+                                args.pitch_angle, args.flip_vertical, exclude_angle_ranges, enable_angle_exclusion,
+                                view_plan, encoder, interpolation=args.interpolation, feather=args.feather)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
 import cv2
-import numpy as np
-import math
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
 from pathlib import Path
 import argparse
+import itertools
+import signal
 
-def equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical=False):
+from roi import get_remap_plan, remap_with_plan
+from config import DEFAULT_CONFIG
+from remap_cache import RemapCache, get_default_map_cache
+from map_store import FixedPointMapStore
+from views import VIEW_LAYOUTS, image_output_dir, load_pose_list, plan_ring_views, plan_views, view_output_filename
+from decoding import read_panorama
+from interpolation import INTERPOLATION_CHOICES, resolve_interpolation
+from encoders import OutputEncoder, EncoderPool, validate_output_options, write_buffers
+from tracing import get_tracer, span
+from manifest import BatchManifest
+from scanner import iter_image_files, parse_shard
+from atlas import atlas_grid, render_atlas, write_atlas
+from tensor_store import TensorStore
+from watcher import FolderWatcher
+from autotune import CALIBRATION_IMAGES, autotune_batch
+from memory_budget import MemoryBudget, estimate_job_bytes, parse_size
+from planner import describe_orientation, image_orientation, metadata_exclusion, orient_views, plan_inputs
+
+def equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical=False, map_cache=None,
+                                   map_store=None, interpolation='lanczos', dst=None):
     """
     从 equirectangular 全景图生成一个透视图
     img: 输入 equirectangular (H×W×3)，比例 2:1
@@ -17,105 +36,125 @@ def equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical
     phi: 垂直方向旋转角度（度，0=水平，正数向上）
     out_size: 输出图像大小 (w,h)
     flip_vertical: 是否垂直翻转图像（用于处理倒置拍摄的全景图）
+    map_cache: 可选的 RemapCache，相同参数的采样网格只计算一次
+    map_store: 可选的 FixedPointMapStore，使用磁盘缓存的定点采样网格（remap 更快）
+    interpolation: 插值方式 'nearest' / 'linear' / 'cubic' / 'lanczos' / 'auto'，或 cv2.INTER_* 标志
+    dst: 可选的输出数组（out_h × out_w × 通道数，与 img 类型相同），提供时直接渲染到其中
     """
     h, w = img.shape[:2]
     
-    # 如果需要进行垂直翻转，先翻转输入图像
-    if flip_vertical:
-        img = cv2.flip(img, 0)  # 0表示垂直翻转
-    
-    fov_rad = math.radians(fov)
-    w_out, h_out = out_size
-
-    # 构建透视相机坐标
-    x = np.linspace(-math.tan(fov_rad/2), math.tan(fov_rad/2), w_out)
-    y = np.linspace(-math.tan(fov_rad/2), math.tan(fov_rad/2), h_out)
-    x, y = np.meshgrid(x, -y)  # 注意 y 反向
-
-    z = np.ones_like(x)
-    xyz = np.stack([x, y, z], axis=-1)
-    xyz = xyz / np.linalg.norm(xyz, axis=-1, keepdims=True)
-
-    # 旋转矩阵（先绕 Y=theta，再绕 X=phi）
-    def rot_matrix(axis, angle):
-        a = math.radians(angle)
-        if axis == 'y':
-            return np.array([[ math.cos(a), 0, math.sin(a)],
-                             [0, 1, 0],
-                             [-math.sin(a), 0, math.cos(a)]])
-        if axis == 'x':
-            return np.array([[1, 0, 0],
-                             [0, math.cos(a), -math.sin(a)],
-                             [0, math.sin(a), math.cos(a)]])
-    R = rot_matrix('y', theta) @ rot_matrix('x', phi)
+    # 垂直翻转直接体现在采样坐标中，无需复制翻转整张全景图
+    # 只对视角实际用到的全景图区域 remap；超出 cv2.remap 尺寸限制的全景图分块渲染
+    interpolation = resolve_interpolation(interpolation, w, fov, out_size)
+    with span('maps', theta=theta):
+        plan = get_remap_plan(w, h, fov, theta, phi, out_size, map_cache, map_store, flip_vertical, interpolation)
 
-    xyz = xyz @ R.T
-
-    # 转换到经纬度
-    lon = np.arctan2(xyz[...,0], xyz[...,2])
-    lat = np.arcsin(np.clip(xyz[...,1], -1, 1))
-
-    # 映射到图像坐标
-    u = (lon / math.pi + 1) * 0.5 * w
-    v = (0.5 - lat / math.pi) * h
-
-    map_x = u.astype(np.float32)
-    map_y = v.astype(np.float32)
-
-    persp = cv2.remap(img, map_x, map_y, interpolation=cv2.INTER_LANCZOS4,
-                      borderMode=cv2.BORDER_WRAP)
+    with span('remap', theta=theta):
+        persp = remap_with_plan(img, plan, interpolation, dst)
     return persp
 
 
 def generate_views_for_image(input_path, output_dir, fov=90, overlap=0.2, out_size=(1024,1024), 
-                            exclude_angle_ranges=None, enable_angle_exclusion=False, pitch_angle=0, flip_vertical=False):
+                            exclude_angle_ranges=None, enable_angle_exclusion=False, pitch_angle=0, flip_vertical=False,
+                            map_cache=None, map_store=None, encoder=None, encoder_pool=None,
+                            reduced_decode=False, decode_oversample=None, interpolation='lanczos', manifest=None,
+                            view_plan=None, atlas=False, tensor_store=None, image=None, use_metadata=False):
     """
     为单张图片生成多个透视图
+    map_cache: 重映射网格缓存，默认使用进程内共享缓存
+    map_store: 定点采样网格的磁盘缓存（FixedPointMapStore），默认不使用
+    encoder: 输出编码器（OutputEncoder），默认使用配置文件中的输出设置
+    encoder_pool: 可选的编码线程池（EncoderPool），提供时编码与后续视角的渲染并行进行
+    reduced_decode: 按输出所需的角分辨率降采样解码（decode_oversample 为分辨率余量）
+    interpolation: 插值方式，见 equirectangular_to_perspective
+    manifest: 可选的批量处理清单（BatchManifest），全部视角写出后记录该图片已完成
+    view_plan: 预先规划的视角 (views, n_views, excluded_count)（见 views.plan_views），默认按 pitch_angle 规划一圈水平视角
+    atlas: 图集输出模式，所有视角渲染到一张图集中（一次 cv2.remap），与 JSON 索引一起写入 output_dir 的上级目录，
+        不再为每张图片创建目录
+    tensor_store: 张量输出（TensorStore），提供时视角直接渲染到内存映射数组中，不编码、不写图片文件
+    image: 已解码的全景图，提供时不再读取 input_path（input_path 只用于生成输出文件名）
+    use_metadata: 根据图片的 GPano 元数据确定垂直翻转和水平角偏移（见 planner.image_orientation）；
+        角度排除按偏移后相对于相机的水平角进行，view_plan 应为未排除的规划（见 planner.metadata_exclusion）
     """
+    if map_cache is None:
+        map_cache = get_default_map_cache()
+    if encoder_pool is not None:
+        encoder = encoder_pool.encoder
+    elif encoder is None:
+        encoder = OutputEncoder()
     try:
-        os.makedirs(output_dir, exist_ok=True)
-        img = cv2.imread(input_path)
+        if atlas:
+            output_dir = os.path.dirname(output_dir)
+        if tensor_store is None:
+            os.makedirs(output_dir, exist_ok=True)
+        img = image if image is not None else read_panorama(input_path, fov, out_size, reduced_decode,
+                                                            decode_oversample)
         
         if img is None:
             print(f"错误：无法读取图片 {input_path}")
             return False
             
-        h, w = img.shape[:2]
-
-        # 计算步进角度（比如 fov=90, overlap=0.2 → step=72）
-        step = fov * (1 - overlap)
-        n_views = int(math.ceil(360 / step))
+        # 同一布局的所有视角都从这一次解码的全景图渲染
+        plan_exclusion, image_exclusion = metadata_exclusion(exclude_angle_ranges, enable_angle_exclusion,
+                                                             use_metadata)
+        if view_plan is None:
+            view_plan = plan_ring_views(fov, overlap, pitch_angle, exclude_angle_ranges, plan_exclusion)
+        views, n_views, excluded_count = view_plan
+        flip_vertical, yaw_offset, gpano = image_orientation(input_path, flip_vertical, use_metadata)
+        oriented = orient_views(views, yaw_offset, image_exclusion)
+        excluded_count += len(views) - len(oriented)
+        views = oriented
 
         print(f"处理 {os.path.basename(input_path)}: 生成 {n_views} 张图，每张 FOV={fov}°，重叠={overlap*100:.1f}%，俯仰角={pitch_angle}°")
         if flip_vertical:
             print(f"启用垂直翻转功能（用于处理倒置拍摄的全景图）")
+        orientation = describe_orientation(flip_vertical, yaw_offset, gpano)
+        if orientation:
+            print(f"元数据: {orientation}")
         
         if enable_angle_exclusion and exclude_angle_ranges:
             print(f"启用角度排除功能，排除范围: {exclude_angle_ranges}")
 
+        if atlas:
+            atlas_img, index = render_atlas(img, fov, views, out_size, flip_vertical, map_cache, interpolation)
+            output_paths = write_atlas(output_dir, input_path, atlas_img, index, encoder)
+            if manifest is not None:
+                manifest.record(input_path, output_paths)
+            print(f"完成处理 {os.path.basename(input_path)}: 生成图集 {os.path.basename(output_paths[0])}"
+                  f"（{len(views)} 个视角，{index['columns']}x{index['rows']}）")
+            return True
+        
+        if tensor_store is not None:
+            for view_index, theta, phi in views:
+                row, slot = tensor_store.reserve()
+                equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical, map_cache, map_store,
+                                               interpolation, dst=slot)
+                tensor_store.commit(row, input_path, view_index, theta, phi)
+            print(f"完成处理 {os.path.basename(input_path)}: 写入 {len(views)} 个视角到张量输出")
+            return True
+        
         generated_count = 0
-        excluded_count = 0
+        encoded = []
         
-        for i in range(n_views):
-            theta = i * step  # 水平角
-            phi = pitch_angle  # 垂直方向俯仰角
-            
-            # 检查是否应该排除这个角度
-            if enable_angle_exclusion and exclude_angle_ranges:
-                from config import is_angle_excluded
-                if is_angle_excluded(theta, exclude_angle_ranges):
-                    excluded_count += 1
-                    continue
-            
-            out = equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical)
+        for view_index, theta, phi in views:
+            out = equirectangular_to_perspective(img, fov, theta, phi, out_size, flip_vertical, map_cache, map_store,
+                                                 interpolation)
             
             # 生成输出文件名
-            base_name = Path(input_path).stem
-            output_filename = f"{base_name}_view_{generated_count:03d}.jpg"
-            output_path = os.path.join(output_dir, output_filename)
+            output_path = os.path.join(output_dir, view_output_filename(input_path, view_index, encoder))
             
-            cv2.imwrite(output_path, out)
+            if encoder_pool is not None:
+                encoded.append((output_path, encoder_pool.encode_async(out)))
+            else:
+                encoded.append((output_path, encoder.encode(out)))
             generated_count += 1
+        
+        # 所有视角编码完成后整块写出
+        if encoder_pool is not None:
+            encoded = [(output_path, future.result()) for output_path, future in encoded]
+        write_buffers(encoded)
+        if manifest is not None:
+            manifest.record(input_path, [output_path for output_path, _ in encoded])
             
         if enable_angle_exclusion and exclude_angle_ranges:
             print(f"完成处理 {os.path.basename(input_path)}: 生成 {generated_count} 张图，排除 {excluded_count} 张")
@@ -132,41 +171,131 @@ def process_single_image(args):
     """
     单张图片处理函数，用于多线程调用
     """
-    input_path, output_base_dir, fov, overlap, out_size, exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical = args
+    input_path, output_base_dir, fov, overlap, out_size, exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical, input_root, extra_options = args
     
-    # 为每张图片创建独立的输出目录
-    base_name = Path(input_path).stem
-    output_dir = os.path.join(output_base_dir, base_name)
+    # 为每张图片创建独立的输出目录（递归扫描时保留子目录结构）
+    output_dir = image_output_dir(output_base_dir, input_path, input_root)
     
-    return generate_views_for_image(input_path, output_dir, fov, overlap, out_size, 
-                                  exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical)
+    with span('image', image=input_path):
+        return generate_views_for_image(input_path, output_dir, fov, overlap, out_size, 
+                                      exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical,
+                                      **extra_options)
 
 
 def batch_process_images(input_folder, output_base_dir, fov=90, overlap=0.2, out_size=(1024,1024), 
-                        max_workers=4, exclude_angle_ranges=None, enable_angle_exclusion=False, pitch_angle=0, flip_vertical=False):
+                        max_workers=4, exclude_angle_ranges=None, enable_angle_exclusion=False, pitch_angle=0, flip_vertical=False,
+                        map_cache=None, map_store_dir=None, backend='thread', cv2_threads=None,
+                        decode_workers=2, write_workers=2, output_options=None, encoder_workers=None,
+                        reduced_decode=False, decode_oversample=None, interpolation=None, trace_path=None,
+                        resume=True, recursive=False, include_patterns=None, exclude_patterns=None, shard=None,
+                        layout='ring', ring_pitches=None, poses=None, atlas=False, tensor_output=False,
+                        tensor_chunk_rows=1024, watch=False, watch_debounce=2.0, watch_poll=False, autotune=False,
+                        autotune_cache=None, memory_budget=None, plan=False, use_metadata=False):
     """
     批量处理文件夹中的全景图片，使用多线程
+    map_cache: 重映射网格缓存（RemapCache），所有线程共享；默认使用进程内共享缓存
+    map_store_dir: 定点采样网格的磁盘缓存目录，后续运行直接内存映射加载，默认不使用
+    backend: 执行后端，'thread'（线程池）、'pipeline'（解码/渲染/写出流水线）或 'process'（进程池 + 共享内存）
+    cv2_threads: OpenCV 线程数（cv2.setNumThreads）；多进程模式下为每个进程的线程数，默认按核心数平均分配，
+        其他模式默认使用 OpenCV 的默认值
+    decode_workers / write_workers: 流水线和多进程模式下解码、写出阶段的线程数；
+        渲染阶段使用 max_workers 个线程/进程
+    output_options: 输出编码设置字典（output_format、jpeg_quality 等，见 config.DEFAULT_CONFIG），
+        缺省项使用配置文件中的值；可直接传入 PERFORMANCE_CONFIGS 中的性能配置
+    encoder_workers: 线程池模式下的编码线程数，默认使用配置文件中的值
+    reduced_decode: 按输出所需的角分辨率降采样解码全景图，decode_oversample 为分辨率余量
+    interpolation: 插值方式 'nearest' / 'linear' / 'cubic' / 'lanczos' / 'auto'，默认使用配置文件中的值
+    trace_path: 记录各阶段耗时并导出为 Chrome trace JSON 文件，同时打印各阶段耗时汇总，默认不记录
+    resume: 在输出目录中维护处理清单，跳过已完成且输入和参数均未变化的图片（中断后重新运行即可继续）
+    recursive: 递归扫描子目录，输出目录保留相同的子目录结构
+    include_patterns / exclude_patterns: 包含/排除的通配符列表，匹配相对于输入目录的路径或文件名
+    shard: (index, count)，只处理按路径哈希属于第 index 个分片的图片，多台机器可各自处理同一目录树的一部分
+    图片边扫描边处理，不会先列出全部文件
+    layout: 视角布局，'ring'（单圈，俯仰角 pitch_angle）、'rings'（多圈，俯仰角 ring_pitches，每圈视角数按
+        cos(俯仰角) 缩放）、'cubemap'（6 面立方体贴图，固定 90° 视场角）或 'poses'（自定义视角列表 poses，[(theta, phi), ...]）；
+        每张全景图只解码一次，所有视角从同一份解码结果渲染，角度排除分别应用于每一圈
+    atlas: 图集输出模式，每张全景图的所有视角写入一张图集和一个 JSON 索引（见 atlas.py），
+        使用线程池执行（每张图只有一次 remap，无需按视角拆分任务）
+    tensor_output: 张量输出模式，视角以 uint8 数组写入输出目录中按 tensor_chunk_rows 行分块的内存映射 .npy 文件，
+        并附带索引（见 tensor_store.py），供训练直接读取；使用线程池执行，不使用处理清单
+    watch: 监视模式，处理完已有图片后继续监视输入目录（inotify，不可用时轮询，见 watcher.py），
+        新到达的图片在大小和修改时间保持 watch_debounce 秒不变后送入执行后端，按 Ctrl+C 停止；
+        watch_poll 强制使用轮询（输入目录在网络文件系统上时使用）；多进程后端改用线程池执行
+    autotune: 自动调优，用开头几张图片（监视模式下为第一张）标定渲染线程数和 OpenCV 线程数，
+        代替 max_workers 和 cv2_threads（见 autotune.py）；autotune_cache 为保存标定结果的文件，
+        已有本机相同任务的结果时不再标定；只用于线程池和流水线后端，多进程后端忽略
+    memory_budget: 内存预算（字节），按每张图片估计的内存（解码后的全景图 + 驻留的视角，见 memory_budget.py）
+        控制同时处理的图片，总量超出预算时后续图片等待；默认只按线程数限制
+    plan: 处理前只读取全部图片的文件头（见 planner.py），跳过不是 2:1 等距柱状全景图的图片，
+        按像素数从大到小处理（大图先开始，末尾不会只剩一张大图）；需要先扫描完整个目录，监视模式下忽略
+    use_metadata: 根据每张图片的 GPano 元数据自动确定垂直翻转（倒置拍摄）和水平角偏移（视角水平角 0° 指向正北），
+        没有元数据的图片使用 flip_vertical
     """
-    # 支持的图片格式
-    supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
-    
-    # 获取所有图片文件
-    input_path = Path(input_folder)
-    if not input_path.exists():
-        print(f"错误：输入文件夹 {input_folder} 不存在")
+    if map_cache is None:
+        map_cache = get_default_map_cache()
+    if interpolation is None:
+        interpolation = DEFAULT_CONFIG['interpolation']
+    if interpolation not in INTERPOLATION_CHOICES:
+        print(f"错误：不支持的插值方式 {interpolation}，可选: {', '.join(INTERPOLATION_CHOICES)}")
         return
+    # 规划视角布局
+    if layout == 'cubemap':
+        fov = 90
+        if out_size[0] != out_size[1]:
+            print(f"警告：立方体贴图建议使用正方形输出尺寸，当前为 {out_size[0]}x{out_size[1]}")
+    try:
+        # 使用元数据时角度排除在每张图片确定水平角偏移后进行（相对于相机），这里先规划未排除的视角
+        plan_exclusion, _ = metadata_exclusion(exclude_angle_ranges, enable_angle_exclusion, use_metadata)
+        view_plan = plan_views(layout, fov, overlap, pitch_angle, exclude_angle_ranges, plan_exclusion,
+                               ring_pitches, poses)
+        if atlas:
+            atlas_grid(len(view_plan[0]), out_size)
+    except ValueError as e:
+        print(f"错误：{str(e)}")
+        return
+    if atlas and tensor_output:
+        print("错误：图集输出和张量输出不能同时使用")
+        return
+    if atlas and backend != 'thread':
+        print(f"图集输出模式使用线程池执行（忽略 --backend {backend}）")
+        backend = 'thread'
+    if watch and backend == 'process':
+        # 多进程后端在等待新图片时无法处理已完成的视角
+        print("监视模式使用线程池执行（忽略 --backend process）")
+        backend = 'thread'
+    if watch and plan:
+        # 监视模式下图片陆续到达，无法预先规划
+        print("监视模式不进行任务规划（忽略 --plan）")
+        plan = False
+    if tensor_output:
+        if backend != 'thread':
+            print(f"张量输出模式使用线程池执行（忽略 --backend {backend}）")
+            backend = 'thread'
+        # 张量输出的行在每次运行时重新分配，无法按图片跳过
+        resume = False
+    if autotune and backend == 'process':
+        # 标定在主进程的线程池中进行，测得的线程数不能代表进程池（spawn、共享内存）的吞吐量
+        print("多进程后端不进行自动调优（忽略 --autotune），使用 --threads 和 --cv2-threads")
+        autotune = False
     
-    image_files = []
-    for file_path in input_path.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in supported_formats:
-            image_files.append(str(file_path))
-    
-    if not image_files:
-        print(f"在文件夹 {input_folder} 中没有找到支持的图片文件")
+    # 检查输入文件夹
+    if not Path(input_folder).exists():
+        print(f"错误：输入文件夹 {input_folder} 不存在")
         return
     
-    print(f"找到 {len(image_files)} 张图片，开始批量处理...")
-    print(f"使用 {max_workers} 个线程进行处理")
+    print(f"开始批量处理{'（递归子目录）' if recursive else ''}，边扫描边处理...")
+    if include_patterns:
+        print(f"包含: {include_patterns}")
+    if exclude_patterns:
+        print(f"排除: {exclude_patterns}")
+    if shard is not None:
+        print(f"分片: {shard[0]}/{shard[1]}（只处理属于该分片的图片）")
+    if autotune:
+        print("线程数由自动调优确定")
+    elif backend == 'process':
+        print(f"使用 {max_workers} 个进程进行处理")
+    else:
+        print(f"使用 {max_workers} 个线程进行处理")
     
     if enable_angle_exclusion and exclude_angle_ranges:
         print(f"角度排除功能已启用，排除范围: {exclude_angle_ranges}")
@@ -176,25 +305,203 @@ def batch_process_images(input_folder, output_base_dir, fov=90, overlap=0.2, out
     if flip_vertical:
         print(f"垂直翻转功能已启用（用于处理倒置拍摄的全景图）")
     
+    if use_metadata:
+        print(f"根据 GPano 元数据确定每张图片的垂直翻转和水平角偏移")
+    
+    if reduced_decode:
+        print(f"降采样解码已启用（按输出所需分辨率选择解码级别）")
+    
+    budget = None
+    if memory_budget is not None:
+        budget = MemoryBudget(memory_budget)
+        print(f"内存预算: {memory_budget/1024/1024:.0f} MB（按估计的全景图和视角内存控制同时处理的图片）")
+    
+    print(f"插值方式: {interpolation}")
+    
+    if layout != 'ring':
+        print(f"视角布局: {layout}，每张图 {len(view_plan[0])} 个视角（排除 {view_plan[2]} 个）")
+    
+    # 创建输出编码器
+    try:
+        encoder = OutputEncoder(output_options)
+    except ValueError as e:
+        print(f"错误：{str(e)}")
+        return
+    print(f"输出编码: {encoder.describe()}")
+    
     # 创建输出基础目录
     os.makedirs(output_base_dir, exist_ok=True)
     
-    # 准备多线程参数
-    thread_args = [(img_path, output_base_dir, fov, overlap, out_size, exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical) 
-                   for img_path in image_files]
+    # 读取处理清单，扫描时跳过已完成的图片
+    manifest = None
+    if resume:
+        if decode_oversample is None:
+            decode_oversample = DEFAULT_CONFIG['decode_oversample']
+        manifest = BatchManifest(output_base_dir, _output_params(
+            fov, overlap, out_size, exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical,
+            map_store_dir, reduced_decode, decode_oversample, interpolation, encoder, view_plan, atlas,
+            use_metadata))
+    
+    scan_stats = {'found': 0, 'skipped': 0, 'pending': 0, 'rejected': 0}
+    
+    stop_event = threading.Event()
+    if watch:
+        watcher = FolderWatcher(input_folder, recursive, include_patterns, exclude_patterns, shard,
+                                debounce=watch_debounce, poll=watch_poll, ignore_dirs=[output_base_dir],
+                                is_processed=manifest.is_complete if manifest is not None else None)
+        print(f"监视模式（{watcher.mode}）: 处理完已有图片后继续处理新到达的图片，按 Ctrl+C 停止")
+        source = watcher.iter_ready(stop_event)
+    else:
+        source = iter_image_files(input_folder, recursive, include_patterns, exclude_patterns, shard,
+                                  ignore_dirs=[output_base_dir])
+    
+    def pending_images():
+        for path in source:
+            scan_stats['found'] += 1
+            if manifest is not None and manifest.is_complete(path):
+                scan_stats['skipped'] += 1
+                continue
+            scan_stats['pending'] += 1
+            yield path
+    
+    image_files = pending_images()
+    if plan:
+        image_files, scan_stats['rejected'] = plan_inputs(image_files)
+        scan_stats['pending'] -= scan_stats['rejected']
+    input_root = input_folder
+    
+    if trace_path:
+        get_tracer().start()
+    
+    tensor_store = None
+    if tensor_output:
+        tensor_store = TensorStore(output_base_dir, out_size, tensor_chunk_rows)
+        print(f"张量输出: {output_base_dir}（每块 {tensor_chunk_rows} 行）")
+    
+    map_store = None
+    if map_store_dir and backend != 'process':
+        map_store = FixedPointMapStore(map_store_dir)
+        print(f"定点采样网格缓存目录: {map_store.version_dir}")
+    
+    previous_handler = None
+    if watch and threading.current_thread() is threading.main_thread():
+        def request_stop(signum, frame):
+            # 第一次 Ctrl+C 停止接收新图片并等待处理中的图片完成，再次按下时立即中断
+            if stop_event.is_set():
+                raise KeyboardInterrupt
+            print("\n停止监视，等待处理中的图片完成...")
+            stop_event.set()
+        previous_handler = signal.signal(signal.SIGINT, request_stop)
     
-    # 使用线程池执行
     start_time = time.time()
+    previous_cv2_threads = None
+    try:
+        if autotune:
+            # 标定用的图片放回处理队列的开头，标定后照常处理
+            samples = list(itertools.islice(image_files, 1 if watch else CALIBRATION_IMAGES))
+            image_files = itertools.chain(samples, image_files)
+            tuned = autotune_batch(samples, fov, out_size, view_plan, flip_vertical, map_cache, map_store,
+                                   interpolation, encoder, reduced_decode, decode_oversample, backend, autotune_cache)
+            if tuned is not None:
+                max_workers, cv2_threads = tuned
+                print(f"自动调优: 使用 {max_workers} 个渲染线程，OpenCV 线程数 {cv2_threads}")
+            else:
+                print(f"自动调优: 没有可用于标定的图片或视角，使用 {max_workers} 个线程")
+        if cv2_threads is not None and backend != 'process':
+            previous_cv2_threads = cv2.getNumThreads()
+            cv2.setNumThreads(cv2_threads)
+        if backend == 'process':
+            # 使用进程池执行
+            from process_backend import run_process_backend
+            successful_count = run_process_backend(
+                image_files, output_base_dir, fov, overlap, out_size, max_workers,
+                exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical,
+                map_cache_max_bytes=map_cache.max_bytes, map_store_dir=map_store_dir, cv2_threads=cv2_threads,
+                decode_workers=decode_workers, encoder=encoder,
+                reduced_decode=reduced_decode, decode_oversample=decode_oversample, interpolation=interpolation,
+                trace=bool(trace_path), manifest=manifest, input_root=input_root, view_plan=view_plan,
+                memory_budget=budget, use_metadata=use_metadata)
+            # 网格缓存位于各子进程中
+            map_cache = None
+        elif backend == 'pipeline':
+            # 使用流水线执行
+            from pipeline import run_pipeline_backend
+            successful_count = run_pipeline_backend(
+                image_files, output_base_dir, fov, overlap, out_size,
+                exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical, map_cache, map_store,
+                decode_workers=decode_workers, render_workers=max_workers, write_workers=write_workers,
+                encoder=encoder, reduced_decode=reduced_decode, decode_oversample=decode_oversample,
+                interpolation=interpolation, manifest=manifest, input_root=input_root, view_plan=view_plan,
+                memory_budget=budget, use_metadata=use_metadata)
+        else:
+            successful_count = _run_thread_backend(
+                image_files, output_base_dir, fov, overlap, out_size, max_workers,
+                exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical,
+                map_cache, map_store, encoder, encoder_workers, reduced_decode, decode_oversample,
+                interpolation, manifest, input_root, view_plan, atlas, tensor_store, budget, use_metadata)
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+        if previous_cv2_threads is not None:
+            cv2.setNumThreads(previous_cv2_threads)
+        if manifest is not None:
+            manifest.close()
+        if tensor_store is not None:
+            print(f"张量输出共 {tensor_store.close()} 行")
+    
+    total_time = time.time() - start_time
+    if scan_stats['skipped']:
+        print(f"跳过 {scan_stats['skipped']} 张已完成且未变化的图片（清单: {manifest.path}）")
+    if scan_stats['rejected']:
+        print(f"跳过 {scan_stats['rejected']} 张无效的全景图（任务规划）")
+    if scan_stats['pending'] == 0:
+        if watch:
+            print("监视期间没有需要处理的新图片")
+        elif scan_stats['found'] == 0:
+            print(f"在文件夹 {input_folder} 中没有找到支持的图片文件")
+        elif scan_stats['rejected'] and not scan_stats['skipped']:
+            print("没有有效的全景图需要处理")
+        else:
+            print("所有图片均已处理完成，无需重新生成")
+        _finish_trace(trace_path)
+        return
+    _print_batch_summary(successful_count, scan_stats['pending'], total_time, output_base_dir,
+                         exclude_angle_ranges, enable_angle_exclusion, flip_vertical, map_cache)
+    if budget is not None:
+        print(f"内存预算: {budget.format_stats()}")
+    _finish_trace(trace_path)
+
+
+def _run_thread_backend(image_files, output_base_dir, fov, overlap, out_size, max_workers,
+                        exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical,
+                        map_cache, map_store, encoder, encoder_workers, reduced_decode, decode_oversample,
+                        interpolation, manifest, input_root=None, view_plan=None, atlas=False, tensor_store=None,
+                        memory_budget=None, use_metadata=False):
+    """
+    线程池执行后端：每个线程处理一张图片，编码在共享的编码线程池中进行
+    任务逐个提交，同时排队的任务不超过线程数的两倍，输入可以是边扫描边产出的生成器
+    memory_budget: 可选的内存预算（MemoryBudget），提交前等待预算足够，图片处理完成后归还
+    返回: 成功处理的图片数量
+    """
+    # 编码线程池，所有渲染线程共享
+    if encoder_workers is None:
+        encoder_workers = DEFAULT_CONFIG['encoder_workers']
+    encoder_pool = EncoderPool(encoder, encoder_workers)
+    
+    # 准备多线程参数
+    extra_options = {'map_cache': map_cache, 'map_store': map_store, 'encoder_pool': encoder_pool,
+                     'reduced_decode': reduced_decode, 'decode_oversample': decode_oversample,
+                     'interpolation': interpolation, 'manifest': manifest, 'view_plan': view_plan,
+                     'atlas': atlas, 'tensor_store': tensor_store, 'use_metadata': use_metadata}
+    max_pending = max_workers * 2
     successful_count = 0
+    future_to_path = {}
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_path = {executor.submit(process_single_image, args): args[0] 
-                         for args in thread_args}
-        
-        # 处理完成的任务
-        for future in as_completed(future_to_path):
-            img_path = future_to_path[future]
+    def collect(futures):
+        """处理完成的任务"""
+        nonlocal successful_count
+        for future in futures:
+            img_path = future_to_path.pop(future)
             try:
                 result = future.result()
                 if result:
@@ -202,14 +509,82 @@ def batch_process_images(input_folder, output_base_dir, fov=90, overlap=0.2, out
             except Exception as e:
                 print(f"处理 {img_path} 时发生异常: {str(e)}")
     
-    end_time = time.time()
-    total_time = end_time - start_time
+    # 同一张图片同时驻留的视角：张量输出直接写入内存映射，其余模式所有视角渲染后等待编码写出
+    if tensor_store is not None:
+        held_views = 1
+    elif view_plan is not None:
+        held_views = len(view_plan[0])
+    else:
+        held_views = len(plan_ring_views(fov, overlap, pitch_angle, exclude_angle_ranges, enable_angle_exclusion)[0])
     
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for img_path in image_files:
+            # 排队的任务已满时等待其中一个完成再提交
+            if len(future_to_path) >= max_pending:
+                done, _ = wait(future_to_path, return_when=FIRST_COMPLETED)
+                collect(done)
+            cost = 0
+            if memory_budget is not None:
+                cost = estimate_job_bytes(img_path, fov, out_size, held_views, reduced_decode, decode_oversample)
+                memory_budget.acquire(cost)
+            args = (img_path, output_base_dir, fov, overlap, out_size, exclude_angle_ranges, enable_angle_exclusion,
+                    pitch_angle, flip_vertical, input_root, extra_options)
+            future = executor.submit(process_single_image, args)
+            if memory_budget is not None:
+                future.add_done_callback(lambda f, cost=cost: memory_budget.release(cost))
+            future_to_path[future] = img_path
+        collect(list(future_to_path))
+    encoder_pool.shutdown()
+    return successful_count
+
+
+def _output_params(fov, overlap, out_size, exclude_angle_ranges, enable_angle_exclusion, pitch_angle, flip_vertical,
+                   map_store_dir, reduced_decode, decode_oversample, interpolation, encoder, view_plan,
+                   atlas=False, use_metadata=False):
+    """影响输出结果的全部参数，用于处理清单判断已有输出是否仍然有效"""
+    return {
+        'fov': fov,
+        'overlap': overlap,
+        'out_size': list(out_size),
+        'pitch_angle': pitch_angle,
+        'flip_vertical': bool(flip_vertical),
+        'exclude_angle_ranges': [list(r) for r in exclude_angle_ranges]
+                                if enable_angle_exclusion and exclude_angle_ranges else None,
+        'reduced_decode': bool(reduced_decode),
+        'decode_oversample': decode_oversample if reduced_decode else None,
+        'interpolation': interpolation,
+        # 定点采样网格与浮点网格的输出有细微差别
+        'fixed_point_maps': bool(map_store_dir),
+        'output': encoder.options,
+        # 视角布局展开后的全部视角（编号、水平角、俯仰角）
+        'views': [list(v) for v in view_plan[0]],
+        'atlas': bool(atlas),
+        'use_metadata': bool(use_metadata),
+    }
+
+
+def _finish_trace(trace_path):
+    """停止追踪，导出 Chrome trace 文件并打印各阶段耗时汇总"""
+    if not trace_path:
+        return
+    tracer = get_tracer()
+    tracer.stop()
+    tracer.export_chrome_trace(trace_path)
+    print(f"\n各阶段耗时（毫秒）:")
+    print(tracer.format_summary())
+    print(f"追踪文件已写入 {trace_path}（可在 chrome://tracing 或 https://ui.perfetto.dev 中查看）")
+
+
+def _print_batch_summary(successful_count, image_count, total_time, output_base_dir,
+                         exclude_angle_ranges, enable_angle_exclusion, flip_vertical, map_cache=None):
+    """打印批量处理的统计信息"""
     print(f"\n批量处理完成！")
-    print(f"成功处理: {successful_count}/{len(image_files)} 张图片")
+    print(f"成功处理: {successful_count}/{image_count} 张图片")
     print(f"总耗时: {total_time:.2f} 秒")
-    print(f"平均每张图片: {total_time/len(image_files):.2f} 秒")
+    print(f"平均每张图片: {total_time/image_count:.2f} 秒")
     print(f"输出目录: {output_base_dir}")
+    if map_cache is not None:
+        print(f"重映射缓存: {map_cache.format_stats()}")
     
     if enable_angle_exclusion and exclude_angle_ranges:
         print(f"注意：已排除角度范围 {exclude_angle_ranges} 内的图片，以减少拍摄人的影响")
@@ -235,6 +610,80 @@ def main():
                        help='启用角度排除功能')
     parser.add_argument('--flip-vertical', action='store_true', 
                        help='启用垂直翻转功能（用于处理倒置拍摄的全景图）')
+    parser.add_argument('--map-cache-mb', type=int, default=None,
+                       help='重映射网格缓存上限（MB），0表示禁用缓存，默认使用配置文件中的值')
+    parser.add_argument('--map-store', default=DEFAULT_CONFIG['map_store_dir'], metavar='DIR',
+                       help='定点采样网格的磁盘缓存目录，后续运行直接加载，无需重新计算，默认使用配置文件中的值')
+    parser.add_argument('--backend', choices=['thread', 'pipeline', 'process'], default='thread',
+                       help='执行后端：thread（线程池）、pipeline（解码/渲染/写出流水线）或 process（进程池 + 共享内存），默认thread')
+    parser.add_argument('--decode-workers', type=int, default=2,
+                       help='流水线/多进程模式下的解码线程数，默认2')
+    parser.add_argument('--write-workers', type=int, default=2,
+                       help='流水线模式下的编码写出线程数，默认2')
+    parser.add_argument('--cv2-threads', type=int, default=None,
+                       help='OpenCV线程数（多进程模式下为每个进程的线程数，默认按CPU核心数平均分配）')
+    parser.add_argument('--format', choices=['jpg', 'webp', 'png'], default=DEFAULT_CONFIG['output_format'],
+                       help='输出图片格式，默认jpg')
+    parser.add_argument('--quality', type=int, default=None,
+                       help='JPEG/WebP 质量（0-100），默认使用配置文件中的值')
+    parser.add_argument('--jpeg-progressive', action='store_true', help='JPEG 渐进式编码')
+    parser.add_argument('--jpeg-optimize', action='store_true', help='JPEG 优化霍夫曼表（文件更小，编码稍慢）')
+    parser.add_argument('--jpeg-sampling', choices=['444', '422', '420', '440', '411'], default=None,
+                       help='JPEG 色度抽样，默认使用OpenCV默认值')
+    parser.add_argument('--png-compression', type=int, default=DEFAULT_CONFIG['png_compression'],
+                       help='PNG 压缩级别（0-9），默认3')
+    parser.add_argument('--lossless', action='store_true', help='无损输出（webp）')
+    parser.add_argument('--reduced-decode', action='store_true', default=DEFAULT_CONFIG['reduced_decode'],
+                       help='按输出所需的角分辨率降采样解码全景图，减少解码时间和内存，默认使用配置文件中的值')
+    parser.add_argument('--no-reduced-decode', dest='reduced_decode', action='store_false',
+                       help='完整解码全景图（配置文件中启用降采样解码时使用）')
+    parser.add_argument('--interpolation', choices=INTERPOLATION_CHOICES, default=DEFAULT_CONFIG['interpolation'],
+                       help='插值方式：nearest/linear/cubic/lanczos（从快到慢）或 auto（按采样比例自动选择），默认lanczos')
+    parser.add_argument('--encoder-workers', type=int, default=DEFAULT_CONFIG['encoder_workers'],
+                       help='编码线程数，默认2')
+    parser.add_argument('--trace', default=None, metavar='FILE',
+                       help='记录解码/网格/重映射/编码/写出各阶段耗时，导出为 Chrome trace JSON 文件并打印汇总')
+    parser.add_argument('--recursive', action='store_true',
+                       help='递归处理子目录中的图片，输出目录保留相同的子目录结构')
+    parser.add_argument('--include', action='append', default=None, metavar='GLOB',
+                       help='只处理匹配的文件（匹配相对路径或文件名，如 "*.jpg"、"2024-*/*"），可多次使用')
+    parser.add_argument('--exclude', action='append', default=None, metavar='GLOB',
+                       help='跳过匹配的文件或目录，可多次使用')
+    parser.add_argument('--shard', default=None, metavar='INDEX/COUNT',
+                       help='按路径哈希分片，只处理第 INDEX 片（从0开始），多台机器可各自处理同一目录树的一部分')
+    parser.add_argument('--layout', choices=VIEW_LAYOUTS, default='ring',
+                       help='视角布局：ring（单圈水平视角）、rings（多圈，每圈视角数按俯仰角余弦缩放）、'
+                            'cubemap（6面立方体贴图）、poses（自定义视角列表），默认ring')
+    parser.add_argument('--ring-pitches', type=float, nargs='+', default=None, metavar='PITCH',
+                       help='rings 布局各圈的俯仰角，默认按视场角和重叠比例覆盖天顶到天底')
+    parser.add_argument('--poses', default=None, metavar='FILE',
+                       help='poses 布局的视角列表文件（JSON [[theta, phi], ...] 或每行 "theta phi"）')
+    parser.add_argument('--atlas', action='store_true',
+                       help='图集输出：每张全景图的所有视角写入一张图集和一个 JSON 索引，大幅减少文件数量')
+    parser.add_argument('--tensor', action='store_true',
+                       help='张量输出：视角以 uint8 数组写入内存映射的 .npy 分块文件并附带索引，供训练直接读取')
+    parser.add_argument('--tensor-chunk-rows', type=int, default=1024,
+                       help='张量输出每个分块的视角数，默认1024')
+    parser.add_argument('--no-resume', action='store_true',
+                       help='忽略输出目录中的处理清单，重新处理所有图片（默认跳过已完成且未变化的图片）')
+    parser.add_argument('--watch', action='store_true',
+                       help='监视模式：处理完已有图片后继续监视输入文件夹，新图片写完后立即处理，按 Ctrl+C 停止')
+    parser.add_argument('--watch-debounce', type=float, default=2.0, metavar='SECONDS',
+                       help='监视模式下文件大小和修改时间保持不变多少秒后视为写完，默认2')
+    parser.add_argument('--watch-poll', action='store_true',
+                       help='监视模式下使用轮询代替 inotify（输入文件夹在 NFS/SMB 等网络文件系统上时使用）')
+    parser.add_argument('--autotune', action='store_true',
+                       help='自动调优：用开头几张图片测量不同线程数和OpenCV线程数组合的吞吐量，使用最快的组合'
+                            '（忽略 --threads 和 --cv2-threads；多进程后端不支持）')
+    parser.add_argument('--autotune-cache', default=DEFAULT_CONFIG['autotune_cache'], metavar='FILE',
+                       help='按主机保存自动调优结果的文件，已有本机相同任务的结果时直接使用，不再标定')
+    parser.add_argument('--memory-budget', default=None, metavar='SIZE',
+                       help='内存预算（如 8G、512M，不带单位按MB）：按估计的全景图和视角内存控制同时处理的图片，'
+                            '超出时后续图片等待，默认只按线程数限制')
+    parser.add_argument('--plan', action='store_true',
+                       help='任务规划：处理前只读取全部图片的文件头，跳过不是2:1等距柱状全景图的图片，按尺寸从大到小处理')
+    parser.add_argument('--use-metadata', action='store_true',
+                       help='根据图片的GPano元数据自动确定垂直翻转（倒置拍摄）和水平角偏移（水平角0°指向正北）')
     
     args = parser.parse_args()
     
@@ -251,6 +700,74 @@ def main():
         print("错误：线程数必须大于0")
         return
     
+    if args.decode_workers < 1 or args.write_workers < 1 or args.encoder_workers < 1:
+        print("错误：解码、写出和编码线程数必须大于0")
+        return
+    
+    # 验证输出编码参数
+    output_options = {
+        'output_format': args.format,
+        'jpeg_progressive': args.jpeg_progressive,
+        'jpeg_optimize': args.jpeg_optimize,
+        'jpeg_sampling': args.jpeg_sampling,
+        'png_compression': args.png_compression,
+        'lossless': args.lossless,
+    }
+    if args.quality is not None:
+        output_options['jpeg_quality'] = args.quality
+        output_options['webp_quality'] = args.quality
+    is_valid, error_msg = validate_output_options({**DEFAULT_CONFIG, **output_options})
+    if not is_valid:
+        print(f"错误：{error_msg}")
+        return
+    
+    if args.watch_debounce < 0:
+        print("错误：监视去抖时间不能为负数")
+        return
+    
+    if args.tensor_chunk_rows < 1:
+        print("错误：张量分块行数必须大于0")
+        return
+    
+    if args.cv2_threads is not None and args.cv2_threads < 1:
+        print("错误：OpenCV线程数必须大于0")
+        return
+    
+    if args.ring_pitches and any(p < -90 or p > 90 for p in args.ring_pitches):
+        print("错误：各圈俯仰角必须在-90到90度之间")
+        return
+    
+    poses = None
+    if args.layout == 'poses':
+        if not args.poses:
+            print("错误：poses 布局需要使用 --poses 指定视角列表文件")
+            return
+        try:
+            poses = load_pose_list(args.poses)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print(f"错误：无法读取视角列表 {args.poses}: {str(e)}")
+            return
+    
+    shard = None
+    if args.shard is not None:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"错误：{str(e)}")
+            return
+    
+    if args.map_cache_mb is not None and args.map_cache_mb < 0:
+        print("错误：重映射缓存上限不能为负数")
+        return
+    
+    memory_budget = None
+    if args.memory_budget is not None:
+        try:
+            memory_budget = parse_size(args.memory_budget)
+        except ValueError as e:
+            print(f"错误：{str(e)}")
+            return
+    
     # 验证俯仰角度参数
     if args.pitch_angle < -90 or args.pitch_angle > 90:
         print("错误：俯仰角度必须在-90到90度之间")
@@ -275,7 +792,10 @@ def main():
     print(f"视场角: {args.fov}°")
     print(f"重叠比例: {args.overlap*100:.1f}%")
     print(f"输出尺寸: {args.size[0]}x{args.size[1]}")
-    print(f"线程数: {args.threads}")
+    print(f"线程数: {'自动调优' if args.autotune and args.backend != 'process' else args.threads}")
+    print(f"执行后端: {args.backend}")
+    print(f"输出格式: {args.format}")
+    print(f"插值方式: {args.interpolation}")
     print(f"俯仰角度: {args.pitch_angle}°")
     if enable_angle_exclusion and exclude_angle_ranges:
         print(f"角度排除: 启用，排除范围: {exclude_angle_ranges}")
@@ -285,6 +805,8 @@ def main():
         print(f"垂直翻转: 启用")
     else:
         print(f"垂直翻转: 禁用")
+    if args.use_metadata:
+        print(f"GPano 元数据: 启用")
     print("=" * 40)
     
     # 开始批量处理
@@ -298,7 +820,37 @@ def main():
         exclude_angle_ranges=exclude_angle_ranges,
         enable_angle_exclusion=enable_angle_exclusion,
         pitch_angle=args.pitch_angle,
-        flip_vertical=args.flip_vertical
+        flip_vertical=args.flip_vertical,
+        map_cache=RemapCache(args.map_cache_mb * 1024 * 1024) if args.map_cache_mb is not None else None,
+        map_store_dir=args.map_store,
+        backend=args.backend,
+        cv2_threads=args.cv2_threads,
+        decode_workers=args.decode_workers,
+        write_workers=args.write_workers,
+        output_options=output_options,
+        encoder_workers=args.encoder_workers,
+        reduced_decode=args.reduced_decode,
+        interpolation=args.interpolation,
+        trace_path=args.trace,
+        resume=not args.no_resume,
+        recursive=args.recursive,
+        include_patterns=args.include,
+        exclude_patterns=args.exclude,
+        shard=shard,
+        layout=args.layout,
+        ring_pitches=args.ring_pitches,
+        poses=poses,
+        atlas=args.atlas,
+        tensor_output=args.tensor,
+        tensor_chunk_rows=args.tensor_chunk_rows,
+        watch=args.watch,
+        watch_debounce=args.watch_debounce,
+        watch_poll=args.watch_poll,
+        autotune=args.autotune,
+        autotune_cache=args.autotune_cache,
+        memory_budget=memory_budget,
+        plan=args.plan,
+        use_metadata=args.use_metadata
     )
 
 
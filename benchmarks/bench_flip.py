@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+垂直翻转开销对比 - 旧方式（每个视角 cv2.flip 复制整张全景图）与
+新方式（翻转体现在采样坐标中）的耗时和峰值内存
+
+用法: python benchmarks/bench_flip.py --width 8192 --views 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_process import equirectangular_to_perspective  # noqa: E402
+from remap_cache import RemapCache  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+
+def _peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run(mode, width, n_views, fov, out_size, repeat, result_queue):
+    img = np.random.default_rng(0).integers(0, 256, (width // 2, width, 3), dtype=np.uint8)
+    map_cache = RemapCache()
+    step = 360 / n_views
+
+    # 预热：网格计算不计入对比
+    for i in range(n_views):
+        equirectangular_to_perspective(img, fov, i * step, 0, out_size, mode != 'none', map_cache)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(n_views):
+            if mode == 'copy':
+                # 旧实现：每个视角先复制翻转整张全景图
+                flipped = cv2.flip(img, 0)
+                equirectangular_to_perspective(flipped, fov, i * step, 0, out_size, False, map_cache)
+            else:
+                equirectangular_to_perspective(img, fov, i * step, 0, out_size, mode == 'maps', map_cache)
+    elapsed = time.perf_counter() - start
+
+    peak_rss = _peak_rss_mb()
+    copied = img.nbytes * n_views * repeat if mode == 'copy' else 0
+    result_queue.put({
+        'mode': mode,
+        'seconds_per_image': elapsed / repeat,
+        'copied_mb_per_image': copied / repeat / 1024 / 1024,
+        'peak_rss_mb': peak_rss,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='垂直翻转开销对比')
+    parser.add_argument('--width', type=int, default=8192, help='合成全景图宽度，默认8192（高度为宽度一半）')
+    parser.add_argument('--views', type=int, default=10, help='每张图的视角数，默认10')
+    parser.add_argument('--fov', type=float, default=90, help='视场角（度），默认90')
+    parser.add_argument('--size', type=int, nargs=2, default=[1024, 1024], metavar=('WIDTH', 'HEIGHT'),
+                        help='输出尺寸，默认1024x1024')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数，默认3')
+    args = parser.parse_args()
+
+    print(f"全景图 {args.width}x{args.width // 2}，{args.views} 个视角，输出 {args.size[0]}x{args.size[1]}")
+    print(f"{'模式':<8}{'每张耗时(s)':>14}{'复制量(MB)':>14}{'峰值内存(MB)':>16}")
+    ctx = multiprocessing.get_context('spawn')
+    for mode in ('none', 'copy', 'maps'):
+        # 每种模式在独立进程中运行，峰值内存互不影响
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(mode, args.width, args.views, args.fov,
+                                              tuple(args.size), args.repeat, queue))
+        proc.start()
+        r = queue.get()
+        proc.join()
+        rss = 'N/A' if r['peak_rss_mb'] is None else f"{r['peak_rss_mb']:.0f}"
+        print(f"{r['mode']:<8}{r['seconds_per_image']:>14.3f}{r['copied_mb_per_image']:>14.0f}{rss:>16}")
+    print("none=不翻转，copy=旧实现（每视角复制翻转），maps=翻转体现在采样坐标中")
+
+
+if __name__ == "__main__":
+    main()
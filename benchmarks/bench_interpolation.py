@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+插值方式对比 - 在样例全景图上测量各插值方式的重映射吞吐量，
+以及相对于 lanczos 参考结果的 PSNR / SSIM
+
+用法: python benchmarks/bench_interpolation.py 样例文件夹 --fov 90 --size 1024 1024
+      不指定文件夹时使用合成全景图
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import synthetic_panorama  # noqa: E402
+from batch_process import equirectangular_to_perspective  # noqa: E402
+from config import DEFAULT_CONFIG  # noqa: E402
+from interpolation import INTERPOLATION_MODES, auto_interpolation  # noqa: E402
+from remap_cache import RemapCache  # noqa: E402
+from views import plan_ring_views  # noqa: E402
+
+
+def psnr(reference, test):
+    """峰值信噪比（dB），完全相同时返回 inf"""
+    mse = np.mean((reference.astype(np.float64) - test.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(255.0 ** 2 / mse)
+
+
+def ssim(reference, test):
+    """结构相似度（灰度，11x11 高斯窗口，σ=1.5）"""
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    a = cv2.cvtColor(reference, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    b = cv2.cvtColor(test, cv2.COLOR_BGR2GRAY).astype(np.float64)
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a * mu_a
+    var_b = blur(b * b) - mu_b * mu_b
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def load_samples(folder, max_images):
+    supported_formats = DEFAULT_CONFIG['supported_formats']
+    samples = []
+    for file_path in sorted(Path(folder).iterdir()):
+        if file_path.is_file() and file_path.suffix.lower() in supported_formats:
+            img = cv2.imread(str(file_path))
+            if img is not None:
+                samples.append((file_path.name, img))
+        if len(samples) >= max_images:
+            break
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='插值方式的速度/质量对比')
+    parser.add_argument('input_folder', nargs='?', default=None, help='样例全景图文件夹，默认使用合成全景图')
+    parser.add_argument('--fov', type=float, default=90, help='视场角（度），默认90')
+    parser.add_argument('--overlap', type=float, default=0.2, help='重叠比例，默认0.2')
+    parser.add_argument('--size', type=int, nargs=2, default=[1024, 1024], metavar=('WIDTH', 'HEIGHT'),
+                        help='输出尺寸，默认1024x1024')
+    parser.add_argument('--synthetic-width', type=int, default=8192, help='合成全景图宽度，默认8192')
+    parser.add_argument('--max-images', type=int, default=5, help='最多使用的样例数量，默认5')
+    parser.add_argument('--repeat', type=int, default=3, help='计时重复次数，默认3')
+    parser.add_argument('--json', default=None, metavar='FILE', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    if args.input_folder:
+        samples = load_samples(args.input_folder, args.max_images)
+        if not samples:
+            print(f"在文件夹 {args.input_folder} 中没有找到支持的图片文件")
+            return
+    else:
+        samples = [('synthetic', synthetic_panorama(args.synthetic_width))]
+
+    out_size = tuple(args.size)
+    views, _, _ = plan_ring_views(args.fov, args.overlap)
+    map_cache = RemapCache()
+    results = {mode: {'seconds': 0.0, 'views': 0, 'psnr': [], 'ssim': []} for mode in INTERPOLATION_MODES}
+
+    for name, img in samples:
+        auto = auto_interpolation(img.shape[1], args.fov, out_size)
+        auto_name = [m for m, flag in INTERPOLATION_MODES.items() if flag == auto][0]
+        print(f"{name}: {img.shape[1]}x{img.shape[0]}，{len(views)} 个视角，auto 选择 {auto_name}")
+        for _, theta, phi in views:
+            # 预热网格缓存，只比较重映射本身的耗时
+            reference = equirectangular_to_perspective(img, args.fov, theta, phi, out_size,
+                                                       map_cache=map_cache, interpolation='lanczos')
+            for mode in INTERPOLATION_MODES:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    out = equirectangular_to_perspective(img, args.fov, theta, phi, out_size,
+                                                         map_cache=map_cache, interpolation=mode)
+                results[mode]['seconds'] += (time.perf_counter() - start) / args.repeat
+                results[mode]['views'] += 1
+                results[mode]['psnr'].append(psnr(reference, out))
+                results[mode]['ssim'].append(ssim(reference, out))
+
+    print(f"\n{'插值方式':<10}{'视角/秒':>10}{'相对lanczos速度':>18}{'PSNR(dB)':>10}{'SSIM':>8}")
+    summary = {}
+    lanczos_rate = results['lanczos']['views'] / results['lanczos']['seconds']
+    for mode, r in results.items():
+        rate = r['views'] / r['seconds']
+        mean_psnr = float(np.mean([p for p in r['psnr'] if np.isfinite(p)])) if mode != 'lanczos' else float('inf')
+        mean_ssim = float(np.mean(r['ssim']))
+        summary[mode] = {'views_per_second': rate, 'speedup_vs_lanczos': rate / lanczos_rate,
+                         'psnr_db': mean_psnr, 'ssim': mean_ssim}
+        print(f"{mode:<10}{rate:>10.1f}{rate / lanczos_rate:>18.2f}x{mean_psnr:>10.2f}{mean_ssim:>8.4f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'fov': args.fov, 'out_size': list(out_size),
+                       'samples': [name for name, _ in samples],
+                       'results': {m: {k: (None if v == float('inf') else v) for k, v in r.items()}
+                                   for m, r in summary.items()}}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
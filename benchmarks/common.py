@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试公共函数 - 合成全景图、计时、运行环境信息
+"""
+
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+# 预设的全景图宽度（高度为宽度一半）
+PANORAMA_WIDTHS = {
+    '4k': 4096,
+    '8k': 8192,
+    '16k': 16384,
+}
+
+
+def synthetic_panorama(width, seed=0):
+    """生成带有细节纹理的合成全景图（高度为宽度一半），结果只与 width 和 seed 有关"""
+    rng = np.random.default_rng(seed)
+    h = width // 2
+    noise = (rng.random((h // 8, width // 8, 3)) * 255).astype(np.uint8)
+    img = cv2.resize(noise, (width, h), interpolation=cv2.INTER_CUBIC)
+    # 叠加细线条，便于比较锐度
+    for x in range(0, width, 37):
+        cv2.line(img, (x, 0), (x, h - 1), (255, 255, 255), 1)
+    return img
+
+
+def time_call(func, repeat=3, warmup=0):
+    """
+    多次调用 func 并返回耗时统计（秒）
+    返回: {'median':..., 'min':..., 'max':..., 'repeat':...}
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {'median': statistics.median(samples), 'min': min(samples), 'max': max(samples), 'repeat': repeat}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info():
+    """记录运行环境，便于比较不同机器或版本的结果"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+        'numpy': np.__version__,
+        'git_revision': _git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
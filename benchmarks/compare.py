@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+比较两次基准测试结果 - 按 stage + params 匹配测试项，
+耗时增加超过阈值的项目视为性能回退，存在回退时以退出码 1 结束（便于在部署前检查）
+
+用法: python benchmarks/compare.py baseline.json new.json --threshold 0.10
+"""
+
+import argparse
+import json
+import sys
+
+
+def result_key(entry):
+    """测试项的唯一标识"""
+    return entry['stage'], json.dumps(entry['params'], sort_keys=True, ensure_ascii=False)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    return report, {result_key(entry): entry for entry in report['results']}
+
+
+def compare_results(baseline, current, threshold=0.10):
+    """
+    比较两组结果
+    返回: (rows, regressions)
+        rows: [(stage, params, 基准耗时, 当前耗时, 变化比例), ...]，按变化比例从大到小排序
+        regressions: 耗时增加超过 threshold 的行
+    """
+    rows = []
+    for key in baseline.keys() & current.keys():
+        old, new = baseline[key]['seconds'], current[key]['seconds']
+        change = (new - old) / old if old > 0 else 0.0
+        rows.append((key[0], key[1], old, new, change))
+    rows.sort(key=lambda r: r[4], reverse=True)
+    regressions = [r for r in rows if r[4] > threshold]
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较两次基准测试结果')
+    parser.add_argument('baseline', help='基准结果 JSON')
+    parser.add_argument('current', help='当前结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='判定为回退的耗时增加比例，默认0.10（10%%）')
+    parser.add_argument('--stage', nargs='+', default=None, help='只比较指定阶段')
+    args = parser.parse_args()
+
+    base_report, baseline = load_results(args.baseline)
+    cur_report, current = load_results(args.current)
+    if args.stage:
+        baseline = {k: v for k, v in baseline.items() if k[0] in args.stage}
+        current = {k: v for k, v in current.items() if k[0] in args.stage}
+
+    for label, report in (('基准', base_report), ('当前', cur_report)):
+        env = report.get('environment', {})
+        print(f"{label}: 版本 {env.get('git_revision')}，{env.get('cpu_count')} 核，"
+              f"OpenCV {env.get('opencv')}，{env.get('timestamp')}")
+    if base_report.get('environment', {}).get('platform') != cur_report.get('environment', {}).get('platform'):
+        print("警告：两次测试的运行平台不同，结果可能不可比")
+
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    only_base = len(baseline.keys() - current.keys())
+    only_cur = len(current.keys() - baseline.keys())
+
+    print(f"\n{'阶段':<18}{'基准(ms)':>12}{'当前(ms)':>12}{'变化':>10}  参数")
+    for stage, params, old, new, change in rows:
+        mark = '  <-- 回退' if change > args.threshold else ''
+        print(f"{stage:<18}{old*1000:>12.2f}{new*1000:>12.2f}{change*100:>+9.1f}%  {params}{mark}")
+
+    print(f"\n共比较 {len(rows)} 项，回退 {len(regressions)} 项（阈值 {args.threshold*100:.0f}%）")
+    if only_base or only_cur:
+        print(f"仅在基准中: {only_base} 项，仅在当前结果中: {only_cur} 项")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+投影流水线基准测试 - 在 4K/8K/16K 合成全景图上分别测量
+解码、网格生成、重映射、编码的耗时，以及不同线程数、执行后端、性能配置下的整体吞吐量，
+结果以 JSON 格式输出，可用 benchmarks/compare.py 比较两次结果
+
+用法:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --quick --output quick.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import cv2
+
+from common import PANORAMA_WIDTHS, environment_info, synthetic_panorama, time_call
+
+from batch_process import batch_process_images, equirectangular_to_perspective  # noqa: E402
+from config import DEFAULT_CONFIG, PERFORMANCE_CONFIGS  # noqa: E402
+from decoding import read_panorama  # noqa: E402
+from encoders import OutputEncoder  # noqa: E402
+from map_store import convert_to_fixed_point  # noqa: E402
+from projection import compute_base_grid, compute_perspective_maps  # noqa: E402
+from remap_cache import RemapCache  # noqa: E402
+from views import plan_ring_views  # noqa: E402
+
+BENCHMARK_FORMAT_VERSION = 1
+
+
+class BenchmarkRecorder:
+    """收集结果：每条结果由 stage + params 唯一确定"""
+
+    def __init__(self, quiet=False):
+        self.results = []
+        self.quiet = quiet
+
+    def add(self, stage, params, timing, unit, **extra):
+        entry = {'stage': stage, 'params': params, 'seconds': timing['median'],
+                 'min_seconds': timing['min'], 'max_seconds': timing['max'],
+                 'repeat': timing['repeat'], 'unit': unit}
+        entry.update(extra)
+        self.results.append(entry)
+        if not self.quiet:
+            desc = ', '.join(f"{k}={v}" for k, v in params.items())
+            extra_desc = ''.join(f", {k}={v:.1f}" if isinstance(v, float) else f", {k}={v}"
+                                 for k, v in extra.items())
+            print(f"  [{stage}] {desc}: {timing['median']*1000:.2f} ms/{unit}{extra_desc}")
+
+
+def prepare_inputs(work_dir, size_names, batch_images):
+    """生成合成全景图并保存为 JPEG，返回 {尺寸名: (图像, 单张文件路径, 批量文件夹)}"""
+    inputs = {}
+    for name in size_names:
+        img = synthetic_panorama(PANORAMA_WIDTHS[name])
+        folder = os.path.join(work_dir, f"input_{name}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"pano_{name}_000.jpg")
+        cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        for i in range(1, batch_images):
+            shutil.copyfile(path, os.path.join(folder, f"pano_{name}_{i:03d}.jpg"))
+        inputs[name] = (img, path, folder)
+    return inputs
+
+
+def bench_decode(rec, inputs, fovs, out_sizes, repeat):
+    for name, (_, path, _) in inputs.items():
+        rec.add('decode', {'size': name, 'reduced': False},
+                time_call(lambda: cv2.imread(path), repeat), 'image')
+        for fov in fovs:
+            for out_size in out_sizes:
+                img = read_panorama(path, fov, out_size, reduced_decode=True)
+                rec.add('decode', {'size': name, 'reduced': True, 'fov': fov, 'out_size': out_size},
+                        time_call(lambda: read_panorama(path, fov, out_size, reduced_decode=True), repeat),
+                        'image', decoded_width=img.shape[1])
+
+
+def bench_maps(rec, inputs, fovs, out_sizes, pitches, repeat):
+    for name, (img, _, _) in inputs.items():
+        h, w = img.shape[:2]
+        for fov in fovs:
+            views, _, _ = plan_ring_views(fov, DEFAULT_CONFIG['overlap'])
+            for out_size in out_sizes:
+                for pitch in pitches:
+                    params = {'size': name, 'fov': fov, 'out_size': out_size, 'pitch': pitch}
+
+                    def ring_maps():
+                        # 冷启动：每次都重新计算基础网格和所有视角的采样坐标
+                        grid = compute_base_grid(fov, pitch, out_size)
+                        for _, theta, _ in views:
+                            compute_perspective_maps(w, h, fov, theta, pitch, out_size, grid)
+
+                    rec.add('maps', params, time_call(ring_maps, repeat), 'ring', views=len(views))
+                    map_x, map_y = compute_perspective_maps(w, h, fov, 0, pitch, out_size)
+                    rec.add('maps_fixed_point', params,
+                            time_call(lambda: convert_to_fixed_point(map_x, map_y), repeat), 'view')
+
+
+def bench_remap(rec, inputs, fovs, out_sizes, interpolations, repeat):
+    for name, (img, _, _) in inputs.items():
+        for fov in fovs:
+            for out_size in out_sizes:
+                map_cache = RemapCache()
+                for interpolation in interpolations:
+                    def render():
+                        equirectangular_to_perspective(img, fov, 30, 0, out_size, map_cache=map_cache,
+                                                       interpolation=interpolation)
+                    rec.add('remap', {'size': name, 'fov': fov, 'out_size': out_size,
+                                      'interpolation': interpolation},
+                            time_call(render, repeat, warmup=1), 'view')
+
+
+def bench_encode(rec, inputs, out_sizes, profiles, repeat):
+    img = next(iter(inputs.values()))[0]
+    for out_size in out_sizes:
+        view = equirectangular_to_perspective(img, 90, 0, 0, out_size, interpolation='linear')
+        for profile in profiles:
+            encoder = OutputEncoder(PERFORMANCE_CONFIGS[profile])
+            rec.add('encode', {'out_size': out_size, 'profile': profile},
+                    time_call(lambda: encoder.encode(view), repeat), 'view',
+                    bytes=int(len(encoder.encode(view))))
+
+
+def bench_batch(rec, inputs, work_dir, profiles, thread_counts, backends, batch_images, repeat):
+    for name, (_, _, folder) in inputs.items():
+        for profile in profiles:
+            cfg = PERFORMANCE_CONFIGS[profile]
+            for backend in backends:
+                for threads in thread_counts:
+                    output_dir = os.path.join(work_dir, 'batch_output')
+
+                    def run():
+                        shutil.rmtree(output_dir, ignore_errors=True)
+                        # 批量处理会打印大量进度信息，基准测试中不需要
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            batch_process_images(folder, output_dir, fov=cfg['fov'], overlap=cfg['overlap'],
+                                                 out_size=cfg['output_size'], max_workers=threads,
+                                                 exclude_angle_ranges=cfg['exclude_angle_ranges'],
+                                                 enable_angle_exclusion=cfg['enable_angle_exclusion'],
+                                                 map_cache=RemapCache(), backend=backend,
+                                                 output_options=cfg,
+                                                 reduced_decode=cfg.get('reduced_decode', False),
+                                                 interpolation=cfg.get('interpolation'))
+
+                    timing = time_call(run, repeat)
+                    rec.add('batch', {'size': name, 'profile': profile, 'backend': backend, 'threads': threads},
+                            timing, 'batch', images=batch_images,
+                            images_per_second=batch_images / timing['median'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='投影流水线基准测试')
+    parser.add_argument('--sizes', nargs='+', choices=list(PANORAMA_WIDTHS), default=list(PANORAMA_WIDTHS),
+                        help='全景图尺寸，默认 4k 8k 16k')
+    parser.add_argument('--fov', type=float, nargs='+', default=[60, 90], help='视场角列表，默认 60 90')
+    parser.add_argument('--out-size', type=int, nargs='+', default=[512, 1024],
+                        help='输出边长列表（正方形），默认 512 1024')
+    parser.add_argument('--pitch', type=float, nargs='+', default=[0, 30], help='俯仰角列表，默认 0 30')
+    parser.add_argument('--interpolation', nargs='+', default=['linear', 'cubic', 'lanczos'],
+                        help='重映射插值方式列表，默认 linear cubic lanczos')
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help='批量处理的线程数列表，默认 1 和 CPU 核心数')
+    parser.add_argument('--backends', nargs='+', choices=['thread', 'pipeline', 'process'],
+                        default=['thread', 'pipeline'], help='批量处理的执行后端，默认 thread pipeline')
+    parser.add_argument('--profiles', nargs='+', choices=list(PERFORMANCE_CONFIGS),
+                        default=list(PERFORMANCE_CONFIGS), help='性能配置列表，默认全部')
+    parser.add_argument('--stages', nargs='+', choices=['decode', 'maps', 'remap', 'encode', 'batch'],
+                        default=['decode', 'maps', 'remap', 'encode', 'batch'], help='要运行的测试阶段，默认全部')
+    parser.add_argument('--batch-images', type=int, default=4, help='批量测试的图片数量，默认4')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测试的重复次数（取中位数），默认3')
+    parser.add_argument('--quick', action='store_true', help='快速模式：只测 4k、fov 90、输出 512，重复1次')
+    parser.add_argument('--output', default=None, metavar='FILE', help='结果 JSON 文件，默认只打印')
+    parser.add_argument('--work-dir', default=None, help='临时文件目录，默认使用系统临时目录')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes, args.fov, args.out_size, args.pitch = ['4k'], [90], [512], [0]
+        args.profiles, args.repeat, args.batch_images = ['fast'], 1, 2
+    if args.threads is None:
+        args.threads = sorted({1, os.cpu_count() or 1})
+    out_sizes = [(s, s) for s in args.out_size]
+
+    env = environment_info()
+    print(f"运行环境: Python {env['python']}，OpenCV {env['opencv']}，{env['cpu_count']} 核，版本 {env['git_revision']}")
+
+    work_dir = tempfile.mkdtemp(prefix='pano_bench_', dir=args.work_dir)
+    rec = BenchmarkRecorder()
+    try:
+        print("生成合成全景图...")
+        inputs = prepare_inputs(work_dir, args.sizes, args.batch_images)
+        if 'decode' in args.stages:
+            print("解码:")
+            bench_decode(rec, inputs, args.fov, out_sizes, args.repeat)
+        if 'maps' in args.stages:
+            print("网格生成:")
+            bench_maps(rec, inputs, args.fov, out_sizes, args.pitch, args.repeat)
+        if 'remap' in args.stages:
+            print("重映射:")
+            bench_remap(rec, inputs, args.fov, out_sizes, args.interpolation, args.repeat)
+        if 'encode' in args.stages:
+            print("编码:")
+            bench_encode(rec, inputs, out_sizes, args.profiles, args.repeat)
+        if 'batch' in args.stages:
+            print("批量处理:")
+            bench_batch(rec, inputs, work_dir, args.profiles, args.threads, args.backends,
+                        args.batch_images, args.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'format_version': BENCHMARK_FORMAT_VERSION,
+        'environment': env,
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'work_dir')},
+        'results': rec.results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
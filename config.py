@@ -21,9 +21,40 @@ DEFAULT_CONFIG = {
     # 支持的图片格式
     'supported_formats': {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'},
     
+    # 输出图片格式：jpg / webp / png
+    'output_format': 'jpg',
+    
     # 输出图片质量（0-100，仅对jpg格式有效）
     'jpeg_quality': 95,
     
+    # JPEG 渐进式编码、优化霍夫曼表（文件更小，编码稍慢）
+    'jpeg_progressive': False,
+    'jpeg_optimize': False,
+    
+    # JPEG 色度抽样：'444' / '422' / '420' 等，None 表示使用 OpenCV 默认值
+    'jpeg_sampling': None,
+    
+    # WebP 质量（0-100）
+    'webp_quality': 90,
+    
+    # PNG 压缩级别（0-9，0最快，9文件最小）
+    'png_compression': 3,
+    
+    # 无损输出（仅对 webp 有效，png 本身就是无损格式）
+    'lossless': False,
+    
+    # 编码线程数（cv2.imencode 在独立线程池中执行）
+    'encoder_workers': 2,
+    
+    # 按输出所需的角分辨率降采样解码全景图（IMREAD_REDUCED_COLOR_2/4/8）
+    'reduced_decode': False,
+    
+    # 降采样解码时相对所需分辨率保留的余量（1.0 表示恰好满足视角中心的分辨率）
+    'decode_oversample': 1.25,
+    
+    # 插值方式：nearest / linear / cubic / lanczos（从快到慢），auto 按采样比例自动选择
+    'interpolation': 'lanczos',
+    
     # 是否显示处理进度
     'show_progress': True,
     
@@ -43,7 +74,16 @@ DEFAULT_CONFIG = {
     'exclude_angle_ranges': [],  # 格式: [(start_angle1, end_angle1), (start_angle2, end_angle2), ...]
     
     # 是否启用角度排除功能
-    'enable_angle_exclusion': False
+    'enable_angle_exclusion': False,
+    
+    # 重映射网格缓存上限（MB），同一批次中相同参数的采样网格只计算一次
+    'map_cache_max_mb': 512,
+    
+    # 定点采样网格的磁盘缓存目录（None 表示不使用），后续运行直接内存映射加载
+    'map_store_dir': None,
+    
+    # 按主机保存自动调优结果的文件（None 表示不保存），get_recommended_threads 优先使用其中本机的结果
+    'autotune_cache': None
 }
 
 # 性能优化建议配置
@@ -53,6 +93,10 @@ PERFORMANCE_CONFIGS = {
         'overlap': 0.1,
         'output_size': (512, 512),
         'jpeg_quality': 85,
+        'jpeg_sampling': '420',
+        'jpeg_optimize': False,
+        'reduced_decode': True,
+        'interpolation': 'linear',
         'exclude_angle_ranges': [(150, 210)],  # 排除拍摄人后方180度范围
         'enable_angle_exclusion': True
     },
@@ -61,6 +105,10 @@ PERFORMANCE_CONFIGS = {
         'overlap': 0.2,
         'output_size': (1024, 1024),
         'jpeg_quality': 95,
+        'jpeg_sampling': '420',
+        'jpeg_optimize': True,
+        'reduced_decode': True,
+        'interpolation': 'auto',
         'exclude_angle_ranges': [(150, 210)],  # 排除拍摄人后方180度范围
         'enable_angle_exclusion': True
     },
@@ -69,6 +117,9 @@ PERFORMANCE_CONFIGS = {
         'overlap': 0.3,
         'output_size': (2048, 2048),
         'jpeg_quality': 100,
+        'jpeg_sampling': '444',
+        'jpeg_optimize': True,
+        'interpolation': 'lanczos',
         'exclude_angle_ranges': [(150, 210)],  # 排除拍摄人后方180度范围
         'enable_angle_exclusion': True
     }
@@ -83,10 +134,22 @@ THREAD_RECOMMENDATIONS = {
     32: [12, 16]
 }
 
-def get_recommended_threads():
-    """获取推荐的线程数"""
+def get_recommended_threads(autotune_cache=None):
+    """
+    获取推荐的线程数
+    有本机的自动调优结果（autotune_cache，默认使用配置文件中的 autotune_cache）时使用最近一次标定的线程数，
+    否则按 CPU 核心数查表
+    """
     import os
     try:
+        if autotune_cache is None:
+            autotune_cache = DEFAULT_CONFIG['autotune_cache']
+        if autotune_cache:
+            from autotune import AutotuneCache
+            latest = AutotuneCache(autotune_cache).latest()
+            if latest is not None:
+                return latest['workers']
+        
         # 获取CPU核心数
         cpu_count = os.cpu_count()
         if cpu_count is None:
@@ -175,7 +238,7 @@ def print_config_info():
         print(f"排除角度范围: {DEFAULT_CONFIG['exclude_angle_ranges']}")
     print("\n性能配置选项:")
     for profile, config in PERFORMANCE_CONFIGS.items():
-        print(f"  {profile}: FOV={config['fov']}°, 重叠={config['overlap']*100:.1f}%, 尺寸={config['output_size'][0]}x{config['output_size'][1]}")
+        print(f"  {profile}: FOV={config['fov']}°, 重叠={config['overlap']*100:.1f}%, 尺寸={config['output_size'][0]}x{config['output_size'][1]}, 插值={config.get('interpolation', DEFAULT_CONFIG['interpolation'])}")
         if config.get('enable_angle_exclusion'):
             print(f"    排除角度: {config.get('exclude_angle_ranges', [])}")
     print("=" * 30)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全景图解码 - 根据输出视角实际需要的角分辨率选择降采样解码级别，
+避免为小尺寸输出完整解码超大全景图
+"""
+
+import cv2
+import numpy as np
+
+from config import DEFAULT_CONFIG
+from probe import probe_image_bytes, probe_image_size
+from projection import required_source_width
+from tracing import span
+
+# 降采样倍数 → OpenCV 降采样解码标志（JPEG 在 DCT 域直接缩小，速度最快）
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def choose_reduction_factor(src_w, fov, out_size, oversample=None):
+    """
+    选择降采样倍数（1、2、4、8），保证降采样后的宽度不低于所需宽度 × oversample
+    oversample: 相对于所需分辨率的余量，默认使用配置文件中的 decode_oversample
+    """
+    if oversample is None:
+        oversample = DEFAULT_CONFIG['decode_oversample']
+    needed = required_source_width(fov, out_size) * oversample
+    factor = 1
+    for candidate in (2, 4, 8):
+        if src_w / candidate >= needed:
+            factor = candidate
+    return factor
+
+
+def read_panorama(input_path, fov, out_size, reduced_decode=False, oversample=None):
+    """
+    读取全景图
+    reduced_decode: 是否按所需分辨率降采样解码；能从文件头读取尺寸时直接使用
+        cv2.IMREAD_REDUCED_COLOR_2/4/8 解码，否则完整解码后用 INTER_AREA 缩小
+    返回: 图像数组，读取失败返回 None
+    """
+    with span('decode', image=input_path):
+        return _read_panorama(input_path, fov, out_size, reduced_decode, oversample)
+
+
+def _read_panorama(input_path, fov, out_size, reduced_decode, oversample):
+    if not reduced_decode:
+        return cv2.imread(input_path)
+
+    size = probe_image_size(input_path)
+    if size is not None:
+        factor = choose_reduction_factor(size[0], fov, out_size, oversample)
+        if factor > 1:
+            img = cv2.imread(input_path, _REDUCED_FLAGS[factor])
+            if img is not None:
+                return img
+        return cv2.imread(input_path)
+
+    # 无法从文件头获取尺寸：完整解码后按面积插值缩小，同样可以降低后续重映射的内存访问量和混叠
+    img = cv2.imread(input_path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    factor = choose_reduction_factor(w, fov, out_size, oversample)
+    if factor > 1:
+        img = cv2.resize(img, ((w + factor - 1) // factor, (h + factor - 1) // factor),
+                         interpolation=cv2.INTER_AREA)
+    return img
+
+
+def decode_panorama(data, fov, out_size, reduced_decode=False, oversample=None):
+    """
+    解码内存中的全景图数据（如上传的请求体），降采样规则同 read_panorama
+    返回: 图像数组，解码失败返回 None
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not reduced_decode:
+        return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    info = probe_image_bytes(data, read_xmp=False)
+    if info is not None:
+        factor = choose_reduction_factor(info['width'], fov, out_size, oversample)
+        if factor > 1:
+            img = cv2.imdecode(buf, _REDUCED_FLAGS[factor])
+            if img is not None:
+                return img
+        return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    factor = choose_reduction_factor(w, fov, out_size, oversample)
+    if factor > 1:
+        img = cv2.resize(img, ((w + factor - 1) // factor, (h + factor - 1) // factor),
+                         interpolation=cv2.INTER_AREA)
+    return img
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+输出编码模块 - 按配置将视角图编码为 JPEG / WebP / PNG，
+编码（cv2.imencode）可在独立的线程池中进行，编码结果整块写入文件
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from config import DEFAULT_CONFIG
+from tracing import span
+
+# 支持的输出格式及扩展名
+OUTPUT_FORMATS = {
+    'jpg': '.jpg',
+    'jpeg': '.jpg',
+    'webp': '.webp',
+    'png': '.png',
+}
+
+# JPEG 色度抽样
+JPEG_SAMPLING_FACTORS = {
+    '444': 'IMWRITE_JPEG_SAMPLING_FACTOR_444',
+    '422': 'IMWRITE_JPEG_SAMPLING_FACTOR_422',
+    '420': 'IMWRITE_JPEG_SAMPLING_FACTOR_420',
+    '440': 'IMWRITE_JPEG_SAMPLING_FACTOR_440',
+    '411': 'IMWRITE_JPEG_SAMPLING_FACTOR_411',
+}
+
+# 输出相关的配置项
+OUTPUT_OPTION_KEYS = ('output_format', 'jpeg_quality', 'jpeg_progressive', 'jpeg_optimize', 'jpeg_sampling',
+                      'webp_quality', 'png_compression', 'lossless', 'output_filename_format')
+
+
+def validate_output_options(options):
+    """
+    验证输出编码配置的有效性
+    返回: (是否有效, 错误信息)
+    """
+    fmt = str(options.get('output_format', 'jpg')).lower()
+    if fmt not in OUTPUT_FORMATS:
+        return False, f"不支持的输出格式 {fmt}，可选: {', '.join(sorted(set(OUTPUT_FORMATS)))}"
+    if not 0 <= options.get('jpeg_quality', 95) <= 100:
+        return False, "JPEG质量必须在0-100之间"
+    if not 0 <= options.get('webp_quality', 90) <= 100:
+        return False, "WebP质量必须在0-100之间"
+    if not 0 <= options.get('png_compression', 3) <= 9:
+        return False, "PNG压缩级别必须在0-9之间"
+    sampling = options.get('jpeg_sampling')
+    if sampling is not None and str(sampling) not in JPEG_SAMPLING_FACTORS:
+        return False, f"不支持的JPEG色度抽样 {sampling}，可选: {', '.join(JPEG_SAMPLING_FACTORS)}"
+    if options.get('lossless') and fmt in ('jpg', 'jpeg'):
+        return False, "JPEG不支持无损编码，请使用 png 或 webp 格式"
+    return True, ""
+
+
+class OutputEncoder:
+    """
+    视角图编码器
+    options: 配置字典，键同 DEFAULT_CONFIG 中的输出相关配置（output_format、jpeg_quality 等），
+             缺省的键使用 DEFAULT_CONFIG 中的值
+    """
+
+    def __init__(self, options=None):
+        merged = {key: DEFAULT_CONFIG[key] for key in OUTPUT_OPTION_KEYS}
+        if options:
+            merged.update({key: options[key] for key in OUTPUT_OPTION_KEYS if key in options})
+        is_valid, error_msg = validate_output_options(merged)
+        if not is_valid:
+            raise ValueError(error_msg)
+        self.options = merged
+        self.format = str(merged['output_format']).lower()
+        self.extension = OUTPUT_FORMATS[self.format]
+        self.filename_format = merged['output_filename_format']
+        self.params = self._build_params()
+
+    def _build_params(self):
+        o = self.options
+        if self.format in ('jpg', 'jpeg'):
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(o['jpeg_quality'])]
+            if o['jpeg_progressive']:
+                params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+            if o['jpeg_optimize']:
+                params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+            sampling = o.get('jpeg_sampling')
+            # 旧版本 OpenCV 没有色度抽样参数，此时使用库的默认值
+            if sampling is not None and hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):
+                params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                           getattr(cv2, JPEG_SAMPLING_FACTORS[str(sampling)])]
+            return params
+        if self.format == 'webp':
+            # OpenCV 中 WebP 质量大于 100 表示无损
+            quality = 101 if o['lossless'] else int(o['webp_quality'])
+            return [cv2.IMWRITE_WEBP_QUALITY, quality]
+        # PNG 本身就是无损格式，只有压缩级别（0 最快，9 最小）
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(o['png_compression'])]
+
+    def output_filename(self, base_name, view_index):
+        """按 output_filename_format 生成文件名，扩展名与输出格式保持一致"""
+        name = self.filename_format.format(base_name=base_name, view_index=view_index)
+        stem, ext = name.rsplit('.', 1) if '.' in name else (name, '')
+        if '.' + ext.lower() != self.extension:
+            name = stem + self.extension
+        return name
+
+    def encode(self, img):
+        """编码图片，返回编码后的字节缓冲区（numpy uint8 数组）"""
+        with span('encode'):
+            ok, buf = cv2.imencode(self.extension, img, self.params)
+        if not ok:
+            raise ValueError(f"{self.format} 编码失败")
+        return buf
+
+    def describe(self):
+        """返回便于打印的编码设置"""
+        o = self.options
+        if self.format in ('jpg', 'jpeg'):
+            desc = f"JPEG 质量={o['jpeg_quality']}"
+            if o['jpeg_sampling']:
+                desc += f"，色度抽样={o['jpeg_sampling']}"
+            if o['jpeg_progressive']:
+                desc += "，渐进式"
+            if o['jpeg_optimize']:
+                desc += "，优化霍夫曼表"
+            return desc
+        if self.format == 'webp':
+            return "WebP 无损" if o['lossless'] else f"WebP 质量={o['webp_quality']}"
+        return f"PNG 压缩级别={o['png_compression']}"
+
+
+def write_buffer(output_path, buf):
+    """
+    将编码结果一次性写入文件
+    先写入同目录下的临时文件再重命名（原子替换），进程被中断时不会留下写了一半的输出文件
+    """
+    directory, name = os.path.split(output_path)
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with span('write'):
+            with open(tmp_path, 'wb') as f:
+                f.write(memoryview(buf))
+            os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_buffers(files):
+    """
+    批量写出编码结果
+    files: [(output_path, buf), ...]
+    """
+    for output_path, buf in files:
+        write_buffer(output_path, buf)
+
+
+class EncoderPool:
+    """
+    编码线程池：cv2.imencode 会释放 GIL，渲染线程提交编码任务后即可继续渲染下一个视角
+    """
+
+    def __init__(self, encoder, max_workers=2):
+        self.encoder = encoder
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='encoder')
+
+    def encode_async(self, img):
+        """提交编码任务，返回 Future，结果为编码后的缓冲区"""
+        return self._executor.submit(self.encoder.encode, img)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+插值方式 - 重映射时使用的插值核，以及根据采样比例自动选择的 auto 模式
+"""
+
+import cv2
+
+from projection import required_source_width
+
+# 按速度从快到慢排列
+INTERPOLATION_MODES = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'lanczos': cv2.INTER_LANCZOS4,
+}
+
+INTERPOLATION_CHOICES = list(INTERPOLATION_MODES) + ['auto']
+
+
+def auto_interpolation(src_w, fov, out_size):
+    """
+    根据采样比例（全景图像素数 / 输出所需像素数）选择插值方式
+    - 比例 < 1：输出在放大全景图，插值核决定清晰度，使用 lanczos
+    - 1 ≤ 比例 < 2：接近 1:1 采样，使用 cubic
+    - 比例 ≥ 2：缩小采样，高阶插值核几乎没有收益，使用 linear（混叠应通过降采样解码解决）
+    """
+    ratio = src_w / required_source_width(fov, out_size)
+    if ratio < 1:
+        return cv2.INTER_LANCZOS4
+    if ratio < 2:
+        return cv2.INTER_CUBIC
+    return cv2.INTER_LINEAR
+
+
+def resolve_interpolation(mode, src_w, fov, out_size):
+    """
+    将插值设置转换为 OpenCV 插值标志
+    mode: 'nearest' / 'linear' / 'cubic' / 'lanczos' / 'auto'，或直接传入 cv2.INTER_* 标志
+    """
+    if isinstance(mode, int):
+        return mode
+    if mode == 'auto':
+        return auto_interpolation(src_w, fov, out_size)
+    if mode not in INTERPOLATION_MODES:
+        raise ValueError(f"不支持的插值方式 {mode}，可选: {', '.join(INTERPOLATION_CHOICES)}")
+    return INTERPOLATION_MODES[mode]
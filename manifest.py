@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量处理清单 - 在输出目录中记录每张输入图片的大小、修改时间、内容哈希、处理参数和生成的视角文件，
+重新运行时跳过已完成且输入和参数都未变化的图片，中断后可以从断点继续
+
+清单为 JSON Lines 格式，每完成一张图片追加一行，进程被中断时最多丢失正在处理的图片；
+同一张图片以最后一条记录为准，结束时整理为每张图片一条记录（写入临时文件后重命名）
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_FILENAME = '.panorama_manifest.jsonl'
+# 清单格式版本，格式变化时递增，旧版本清单中的记录会被忽略
+MANIFEST_VERSION = 1
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """计算文件内容的 SHA-1 哈希"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_digest(params):
+    """计算处理参数的哈希（参数需可 JSON 序列化）"""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BatchManifest:
+    """
+    输出目录中的批量处理清单
+    output_base_dir: 输出目录，清单保存为其中的 .panorama_manifest.jsonl
+    params: 影响输出结果的全部参数（字典），任一参数变化时所有图片都会重新生成
+    """
+
+    def __init__(self, output_base_dir, params):
+        self.output_base_dir = output_base_dir
+        self.path = os.path.join(output_base_dir, MANIFEST_FILENAME)
+        self.params = params
+        self.params_hash = params_digest(params)
+        self._entries = {}
+        self._params = {}
+        self._lock = threading.Lock()
+        self._load()
+
+        new_file = not os.path.exists(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if new_file:
+            self._append({'type': 'manifest', 'version': MANIFEST_VERSION})
+        if self.params_hash not in self._params:
+            self._params[self.params_hash] = params
+            self._append({'type': 'params', 'hash': self.params_hash, 'params': params})
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            version = None
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下不完整的最后一行
+                    continue
+                kind = record.get('type')
+                if kind == 'manifest':
+                    version = record.get('version')
+                elif version != MANIFEST_VERSION:
+                    continue
+                elif kind == 'params':
+                    self._params[record['hash']] = record['params']
+                elif kind == 'image':
+                    self._entries[record['input']] = record
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    @staticmethod
+    def _key(input_path):
+        return os.path.abspath(input_path)
+
+    def is_complete(self, input_path):
+        """
+        判断图片是否已按当前参数处理完成且输入未变化
+        大小和修改时间都相同时直接认为未变化；修改时间不同时比较内容哈希（例如文件被重新复制）
+        记录中的每个输出文件都必须存在且大小一致
+        """
+        entry = self._entries.get(self._key(input_path))
+        if entry is None or entry['params_hash'] != self.params_hash:
+            return False
+        try:
+            st = os.stat(input_path)
+            if st.st_size != entry['size']:
+                return False
+            if st.st_mtime_ns != entry['mtime_ns']:
+                if file_digest(input_path) != entry['hash']:
+                    return False
+                # 内容未变，更新记录中的修改时间，下次无需再计算哈希
+                entry = dict(entry, mtime_ns=st.st_mtime_ns)
+                with self._lock:
+                    self._entries[entry['input']] = entry
+                    self._append(entry)
+            for name, size in entry['outputs'].items():
+                if os.path.getsize(os.path.join(self.output_base_dir, name)) != size:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def record(self, input_path, output_paths):
+        """记录一张图片已处理完成及其生成的文件"""
+        st = os.stat(input_path)
+        entry = {
+            'type': 'image',
+            'input': self._key(input_path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'hash': file_digest(input_path),
+            'params_hash': self.params_hash,
+            'outputs': {os.path.relpath(p, self.output_base_dir): os.path.getsize(p) for p in output_paths},
+        }
+        with self._lock:
+            self._entries[entry['input']] = entry
+            self._append(entry)
+
+    def close(self):
+        """整理清单：每张图片只保留最后一条记录，写入临时文件后原子替换"""
+        with self._lock:
+            self._file.close()
+            used = {entry['params_hash'] for entry in self._entries.values()} | {self.params_hash}
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'type': 'manifest', 'version': MANIFEST_VERSION}) + '\n')
+                for h in sorted(used):
+                    f.write(json.dumps({'type': 'params', 'hash': h, 'params': self._params[h]},
+                                       ensure_ascii=False) + '\n')
+                for entry in self._entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+定点重映射网格的磁盘存储 - 将 cv2.convertMaps 生成的 CV_16SC2 + CV_16UC1 网格
+保存为 .npy 文件，后续运行通过内存映射直接加载，无需重新计算
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# 网格计算方式或文件格式变化时递增，旧版本的缓存目录会被自动忽略
+MAP_STORE_VERSION = 2
+
+
+def convert_to_fixed_point(map_x, map_y):
+    """将 float32 采样坐标转换为 OpenCV 定点格式 (CV_16SC2, CV_16UC1)"""
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+
+class FixedPointMapStore:
+    """
+    定点重映射网格的磁盘缓存
+    cache_dir: 缓存根目录，实际文件保存在 cache_dir/v{版本号}/ 下
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.version_dir = os.path.join(cache_dir, f"v{MAP_STORE_VERSION}")
+        os.makedirs(self.version_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(params):
+        """
+        由影响几何的全部参数生成文件名 key
+        params: 参数字典，例如 输入尺寸、fov、theta、phi、输出尺寸、是否翻转
+        """
+        payload = json.dumps({'version': MAP_STORE_VERSION, 'format': 'CV_16SC2+CV_16UC1',
+                              'params': params}, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.version_dir, key)
+        return base + '_map1.npy', base + '_map2.npy'
+
+    def load(self, key):
+        """以内存映射方式加载网格，不存在或文件损坏时返回 None"""
+        path1, path2 = self._paths(key)
+        if not (os.path.exists(path1) and os.path.exists(path2)):
+            return None
+        try:
+            map1 = np.load(path1, mmap_mode='r')
+            map2 = np.load(path2, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if map1.dtype != np.int16 or map2.dtype != np.uint16 or map1.shape[:2] != map2.shape:
+            return None
+        return map1, map2
+
+    def save(self, key, map1, map2):
+        """保存网格，先写临时文件再重命名，避免并发读取到不完整的文件"""
+        for path, data in zip(self._paths(key), (map1, map2)):
+            fd, tmp_path = tempfile.mkstemp(dir=self.version_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(data))
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def load_or_compute(self, params, compute_float_maps):
+        """
+        加载已保存的定点网格；不存在时调用 compute_float_maps() 计算 float32 网格，
+        转换为定点格式后保存，并返回内存映射的结果
+        """
+        key = self.make_key(params)
+        maps = self.load(key)
+        if maps is not None:
+            return maps
+        map_x, map_y = compute_float_maps()
+        map1, map2 = convert_to_fixed_point(map_x, map_y)
+        try:
+            self.save(key, map1, map2)
+        except OSError as e:
+            print(f"警告：无法保存重映射网格到 {self.version_dir}: {str(e)}")
+            return map1, map2
+        maps = self.load(key)
+        return maps if maps is not None else (map1, map2)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存预算 - 按每张图片的估计内存（解码后的全景图 + 渲染/编码期间驻留的视角）控制同时处理的图片，
+总量超出预算时后续图片等待，线程数和内存占用互不牵连：大图多时自动少并行，小图多时照常满载
+
+估计值只包含随图片数量增长的部分，网格缓存（--map-cache-mb）和各线程的临时数组不计入
+"""
+
+import os
+import threading
+
+from decoding import choose_reduction_factor
+from probe import probe_image_size
+
+# 无法从文件头读取尺寸时，按文件大小的倍数估计解码后的大小（JPEG 的典型压缩比）
+UNKNOWN_SIZE_EXPANSION = 10
+
+_SIZE_UNITS = {'': 1024 ** 2, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(text):
+    """
+    解析内存大小，如 "8G"、"512M"、"1.5G"；不带单位时按 MB
+    返回: 字节数，格式错误时抛出 ValueError
+    """
+    value = str(text).strip().upper()
+    if value.endswith('B'):
+        value = value[:-1]
+    unit = value[-1:] if value[-1:] in _SIZE_UNITS else ''
+    try:
+        number = float(value[:len(value) - len(unit)])
+    except ValueError:
+        raise ValueError(f"内存大小格式应为数字加单位（K/M/G），例如 8G，实际为 {text}")
+    if number <= 0:
+        raise ValueError(f"内存大小必须大于0，实际为 {text}")
+    return int(number * _SIZE_UNITS[unit])
+
+
+def estimate_decoded_bytes(input_path, fov, out_size, reduced_decode=False, decode_oversample=None):
+    """估计解码后全景图的字节数（BGR uint8），降采样解码时按实际使用的倍数缩小"""
+    size = probe_image_size(input_path)
+    if size is None:
+        try:
+            return os.path.getsize(input_path) * UNKNOWN_SIZE_EXPANSION
+        except OSError:
+            return 0
+    w, h = size
+    if reduced_decode:
+        factor = choose_reduction_factor(w, fov, out_size, decode_oversample)
+        w, h = (w + factor - 1) // factor, (h + factor - 1) // factor
+    return w * h * 3
+
+
+def estimate_job_bytes(input_path, fov, out_size, held_views, reduced_decode=False, decode_oversample=None):
+    """
+    估计处理一张图片时的内存占用
+    held_views: 同一张图片同时驻留的视角数（线程池模式下所有视角渲染后等待编码写出，为视角总数）
+    """
+    view_bytes = out_size[0] * out_size[1] * 3
+    return estimate_decoded_bytes(input_path, fov, out_size, reduced_decode, decode_oversample) \
+        + held_views * view_bytes
+
+
+class MemoryBudget:
+    """
+    内存预算：acquire 按提交顺序（先到先得）等待预算足够后占用，处理完成后 release
+    单个任务超出整个预算时，等其它任务全部完成后单独执行，不会永远等待
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit_bytes = int(limit_bytes)
+        self._in_use = 0
+        self._active = 0
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self.peak_bytes = 0
+        self.waits = 0
+        self.oversized = 0
+
+    def _fits(self, nbytes):
+        return self._active == 0 or self._in_use + nbytes <= self.limit_bytes
+
+    def _take(self, nbytes):
+        if nbytes > self.limit_bytes:
+            self.oversized += 1
+        self._in_use += nbytes
+        self._active += 1
+        self.peak_bytes = max(self.peak_bytes, self._in_use)
+
+    def acquire(self, nbytes):
+        """等待预算足够后占用 nbytes（阻塞）"""
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            if ticket != self._serving or not self._fits(nbytes):
+                self.waits += 1
+                while ticket != self._serving or not self._fits(nbytes):
+                    self._cond.wait()
+            self._take(nbytes)
+            self._serving += 1
+            self._cond.notify_all()
+
+    def try_acquire(self, nbytes, retry=False):
+        """
+        预算足够且没有排队的任务时立即占用并返回 True，否则返回 False（不阻塞）
+        retry: 同一任务再次尝试（不重复计入等待次数）
+        """
+        with self._cond:
+            if self._next_ticket != self._serving or not self._fits(nbytes):
+                if not retry:
+                    self.waits += 1
+                return False
+            self._take(nbytes)
+            return True
+
+    def release(self, nbytes):
+        with self._cond:
+            self._in_use -= nbytes
+            self._active -= 1
+            self._cond.notify_all()
+
+    def format_stats(self):
+        """返回便于打印的统计信息字符串"""
+        text = (f"峰值占用 {self.peak_bytes/1024/1024:.0f}/{self.limit_bytes/1024/1024:.0f} MB（估计值），"
+                f"等待预算 {self.waits} 次")
+        if self.oversized:
+            text += f"，{self.oversized} 张图片超出整个预算（单独处理）"
+        return text
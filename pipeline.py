@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线执行后端 - 解码 → 渲染 → 编码写出 三个阶段各自使用独立的线程，
+阶段之间通过有界队列连接，队列满时上游阶段阻塞（背压），
+从而限制同时驻留在内存中的全景图和视角数量
+"""
+
+import os
+import queue
+import threading
+import time
+
+from decoding import read_panorama
+from encoders import OutputEncoder, write_buffer
+from memory_budget import estimate_job_bytes
+from planner import describe_orientation, image_orientation, metadata_exclusion, orient_views
+from tracing import get_tracer
+from views import image_output_dir, plan_ring_views, view_output_filename
+
+# 队列结束标记
+_STOP = object()
+
+
+class _ImageState:
+    """单张图片在流水线中的状态"""
+
+    def __init__(self, input_path, img, n_views, start_ns=0, cost=0, flip_vertical=False):
+        self.input_path = input_path
+        self.flip_vertical = flip_vertical
+        self.cost = cost
+        self.start_ns = start_ns
+        self.img = img
+        self.render_remaining = n_views
+        self.write_remaining = n_views
+        self.output_paths = []
+        self.ok = True
+        self.lock = threading.Lock()
+
+
+def run_pipeline_backend(image_files, output_base_dir, fov=90, overlap=0.2, out_size=(1024,1024),
+                         exclude_angle_ranges=None, enable_angle_exclusion=False, pitch_angle=0,
+                         flip_vertical=False, map_cache=None, map_store=None,
+                         decode_workers=2, render_workers=4, write_workers=2,
+                         max_inflight_images=None, max_pending_views=None, encoder=None,
+                         reduced_decode=False, decode_oversample=None, interpolation='lanczos', manifest=None,
+                         input_root=None, view_plan=None, memory_budget=None, use_metadata=False):
+    """
+    使用 解码 → 渲染 → 编码写出 流水线批量处理图片
+    image_files: 图片路径的可迭代对象（可以是边扫描边产出的生成器）
+    decode_workers / render_workers / write_workers: 各阶段的线程数
+    max_inflight_images: 同时驻留内存的已解码全景图数量上限，默认 render_workers + decode_workers
+    max_pending_views: 已渲染、等待写出的视角数量上限，默认 4 * write_workers
+    encoder: 输出编码器（OutputEncoder），编码在写出阶段进行，默认使用配置文件中的输出设置
+    reduced_decode: 按输出所需的角分辨率降采样解码，decode_oversample 为分辨率余量
+    interpolation: 插值方式，见 equirectangular_to_perspective
+    manifest: 可选的批量处理清单（BatchManifest），图片的全部视角写出后记录
+    input_root: 输入根目录，提供时输出目录保留图片的子目录结构（见 views.image_output_dir）
+    view_plan: 预先规划的视角 (views, n_views, excluded_count)（见 views.plan_views），默认按 pitch_angle 规划一圈水平视角
+    memory_budget: 可选的内存预算（MemoryBudget），解码前按估计的全景图大小等待预算足够，所有视角渲染完成后归还；
+        已渲染的视角由写出队列限制，不计入
+    use_metadata: 根据每张图片的 GPano 元数据确定垂直翻转和水平角偏移（见 planner.image_orientation）；
+        角度排除按偏移后相对于相机的水平角进行，view_plan 应为未排除的规划
+    返回: 成功处理的图片数量
+    """
+    from batch_process import equirectangular_to_perspective
+
+    if encoder is None:
+        encoder = OutputEncoder()
+    if max_inflight_images is None:
+        max_inflight_images = render_workers + decode_workers
+    if max_pending_views is None:
+        max_pending_views = 4 * write_workers
+
+    plan_exclusion, image_exclusion = metadata_exclusion(exclude_angle_ranges, enable_angle_exclusion, use_metadata)
+    if view_plan is None:
+        view_plan = plan_ring_views(fov, overlap, pitch_angle, exclude_angle_ranges, plan_exclusion)
+    views, n_views, excluded_count = view_plan
+    print(f"流水线模式: 解码 {decode_workers} 线程，渲染 {render_workers} 线程，编码写出 {write_workers} 线程，"
+          f"最多 {max_inflight_images} 张全景图驻留内存")
+
+    image_slots = threading.BoundedSemaphore(max_inflight_images)
+    render_queue = queue.Queue(maxsize=max(1, render_workers * 2))
+    write_queue = queue.Queue(maxsize=max(1, max_pending_views))
+    paths = iter(image_files)
+    paths_lock = threading.Lock()
+    stats_lock = threading.Lock()
+    successful = [0]
+
+    def finish_image(state):
+        """所有视角写出后调用"""
+        get_tracer().record('image', state.start_ns, time.perf_counter_ns(), image=state.input_path)
+        if state.ok and manifest is not None:
+            try:
+                manifest.record(state.input_path, state.output_paths)
+            except OSError as e:
+                print(f"更新处理清单时出错: {str(e)}")
+        if state.ok:
+            with stats_lock:
+                successful[0] += 1
+            print(f"完成处理 {os.path.basename(state.input_path)}: 生成 {len(state.output_paths)} 张图")
+        else:
+            print(f"处理 {state.input_path} 时出错: 部分视角生成失败")
+
+    def release_image(cost):
+        """全景图不再需要：归还驻留名额和内存预算"""
+        image_slots.release()
+        if memory_budget is not None:
+            memory_budget.release(cost)
+
+    def decode_stage():
+        while True:
+            with paths_lock:
+                input_path = next(paths, None)
+            if input_path is None:
+                return
+            image_slots.acquire()
+            cost = 0
+            if memory_budget is not None:
+                cost = estimate_job_bytes(input_path, fov, out_size, 0, reduced_decode, decode_oversample)
+                memory_budget.acquire(cost)
+            start_ns = time.perf_counter_ns()
+            try:
+                output_dir = image_output_dir(output_base_dir, input_path, input_root)
+                os.makedirs(output_dir, exist_ok=True)
+                img = read_panorama(input_path, fov, out_size, reduced_decode, decode_oversample)
+            except Exception as e:
+                # 出错时归还驻留名额和内存预算，否则后续阶段会一直等待
+                print(f"处理 {input_path} 时出错: {str(e)}")
+                release_image(cost)
+                continue
+            if img is None:
+                print(f"错误：无法读取图片 {input_path}")
+                release_image(cost)
+                continue
+
+            print(f"处理 {os.path.basename(input_path)}: 生成 {n_views} 张图，每张 FOV={fov}°，"
+                  f"重叠={overlap*100:.1f}%，俯仰角={pitch_angle}°")
+            image_flip, yaw_offset, gpano = image_orientation(input_path, flip_vertical, use_metadata)
+            orientation = describe_orientation(image_flip, yaw_offset, gpano)
+            if orientation:
+                print(f"{os.path.basename(input_path)} 元数据: {orientation}")
+            image_views = orient_views(views, yaw_offset, image_exclusion)
+            if not image_views:
+                release_image(cost)
+                finish_image(_ImageState(input_path, None, 0, start_ns))
+                continue
+
+            state = _ImageState(input_path, img, len(image_views), start_ns, cost, image_flip)
+            for view_index, theta, phi in image_views:
+                output_path = os.path.join(output_dir, view_output_filename(input_path, view_index, encoder))
+                render_queue.put((state, theta, phi, output_path))
+
+    def render_stage():
+        while True:
+            item = render_queue.get()
+            if item is _STOP:
+                return
+            state, theta, phi, output_path = item
+            out = None
+            try:
+                out = equirectangular_to_perspective(state.img, fov, theta, phi, out_size, state.flip_vertical,
+                                                     map_cache, map_store, interpolation)
+            except Exception as e:
+                print(f"处理 {state.input_path} 时发生异常: {str(e)}")
+                state.ok = False
+            with state.lock:
+                state.render_remaining -= 1
+                all_rendered = state.render_remaining == 0
+            if all_rendered:
+                # 所有视角渲染完成，释放全景图，允许解码下一张
+                state.img = None
+                release_image(state.cost)
+            write_queue.put((state, out, output_path))
+
+    def write_stage():
+        while True:
+            item = write_queue.get()
+            if item is _STOP:
+                return
+            state, out, output_path = item
+            if out is not None:
+                try:
+                    write_buffer(output_path, encoder.encode(out))
+                except Exception as e:
+                    print(f"写出 {output_path} 时发生异常: {str(e)}")
+                    state.ok = False
+            with state.lock:
+                state.output_paths.append(output_path)
+                state.write_remaining -= 1
+                all_written = state.write_remaining == 0
+            if all_written:
+                finish_image(state)
+
+    def start(target, count):
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+        for t in threads:
+            t.start()
+        return threads
+
+    decoders = start(decode_stage, decode_workers)
+    renderers = start(render_stage, render_workers)
+    writers = start(write_stage, write_workers)
+
+    # 按阶段顺序关闭：上游全部结束后再向下游发送结束标记
+    for t in decoders:
+        t.join()
+    for _ in renderers:
+        render_queue.put(_STOP)
+    for t in renderers:
+        t.join()
+    for _ in writers:
+        write_queue.put(_STOP)
+    for t in writers:
+        t.join()
+
+    return successful[0]
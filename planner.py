@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务规划 - 处理前只读取文件头（见 probe.py），检查输入是否为完整的 2:1 等距柱状全景图，
+按像素数从大到小排列（大图先开始，避免批量处理末尾只剩一张大图在跑），
+并可根据 GPano 元数据自动确定垂直翻转和水平角偏移
+"""
+
+import os
+
+from config import is_angle_excluded
+from probe import parse_gpano, probe_image
+
+# 宽高比允许的偏差（相对 2:1）
+ASPECT_TOLERANCE = 0.01
+# |PoseRollDegrees| 超过该值时视为倒置拍摄
+UPSIDE_DOWN_ROLL = 90
+
+
+def validate_panorama(info):
+    """
+    检查探测结果（probe.probe_image 的返回值）是否为完整的等距柱状全景图
+    返回: 错误说明，有效时返回 None
+    """
+    if info is None:
+        return "无法读取文件头（格式不支持或文件损坏）"
+    width, height = info['width'], info['height']
+    if width <= 0 or height <= 0:
+        return f"尺寸无效 {width}x{height}"
+    if abs(width / height - 2) > 2 * ASPECT_TOLERANCE:
+        return f"宽高比不是 2:1（{width}x{height}）"
+    gpano = parse_gpano(info['xmp'])
+    projection = gpano.get('ProjectionType')
+    if projection is not None and projection.lower() != 'equirectangular':
+        return f"投影方式为 {projection}，不是等距柱状投影"
+    full_width = gpano.get('FullPanoWidthPixels')
+    cropped_width = gpano.get('CroppedAreaImageWidthPixels')
+    if full_width and cropped_width and cropped_width < full_width:
+        return f"局部全景图（水平覆盖 {cropped_width}/{full_width} 像素）"
+    return None
+
+
+def plan_inputs(image_files):
+    """
+    探测全部输入图片的文件头，跳过无效的图片，按像素数从大到小排列
+    image_files: 图片路径的可迭代对象（会被全部读取）
+    返回: (排列后的图片路径列表, 跳过的图片数)
+    """
+    planned = []
+    rejected = 0
+    total_pixels = 0
+    for path in image_files:
+        info = probe_image(path, read_xmp=True)
+        error = validate_panorama(info)
+        if error is not None:
+            print(f"跳过 {os.path.basename(path)}: {error}")
+            rejected += 1
+            continue
+        pixels = info['width'] * info['height']
+        total_pixels += pixels
+        planned.append((pixels, path))
+    # 稳定排序：相同尺寸的图片保持扫描顺序
+    planned.sort(key=lambda item: -item[0])
+    if planned:
+        largest, smallest = planned[0][0], planned[-1][0]
+        print(f"任务规划: {len(planned)} 张图片，共 {total_pixels/1e6:.0f} 百万像素"
+              f"（最大 {largest/1e6:.1f}，最小 {smallest/1e6:.1f}），按尺寸从大到小处理")
+    return [path for _, path in planned], rejected
+
+
+def image_orientation(input_path, flip_vertical=False, use_metadata=False):
+    """
+    确定单张图片的垂直翻转和水平角偏移
+    use_metadata: 读取 GPano 元数据：|PoseRollDegrees| > 90 时视为倒置拍摄（启用垂直翻转），
+        PoseHeadingDegrees 为图片中心的方位角，偏移后视角的水平角 0° 指向正北
+    返回: (flip_vertical, yaw_offset, gpano)，不使用元数据或没有元数据时为 (flip_vertical, 0, {})
+    """
+    if not use_metadata:
+        return flip_vertical, 0, {}
+    info = probe_image(input_path, read_xmp=True)
+    gpano = parse_gpano(info['xmp']) if info is not None else {}
+    if 'PoseRollDegrees' in gpano:
+        flip_vertical = abs(gpano['PoseRollDegrees']) > UPSIDE_DOWN_ROLL
+    yaw_offset = -gpano.get('PoseHeadingDegrees', 0) % 360
+    return flip_vertical, yaw_offset, gpano
+
+
+def orient_views(views, yaw_offset, exclude_angle_ranges=None):
+    """
+    视角 [(view_index, theta, phi), ...] 的水平角加上偏移
+    exclude_angle_ranges: 提供时按偏移后的水平角（即相对于图片中心/相机的方向）排除视角并重新编号，
+        角度排除始终相对于相机（例如拍摄者所在的后方），不随方位角转动；views 此时应为未排除的规划
+    """
+    if not yaw_offset and not exclude_angle_ranges:
+        return views
+    oriented = []
+    for _, theta, phi in views:
+        theta = (theta + yaw_offset) % 360
+        # 正对天顶/天底的视角没有水平方向，不参与角度排除
+        if exclude_angle_ranges and abs(phi) < 90 and is_angle_excluded(theta, exclude_angle_ranges):
+            continue
+        oriented.append((len(oriented), theta, phi))
+    return oriented
+
+
+def metadata_exclusion(exclude_angle_ranges, enable_angle_exclusion, use_metadata):
+    """
+    使用元数据时角度排除推迟到每张图片确定水平角偏移之后（见 orient_views）
+    返回: (规划视角时使用的 enable_angle_exclusion, 传给 orient_views 的排除范围)
+    """
+    if use_metadata and enable_angle_exclusion and exclude_angle_ranges:
+        return False, exclude_angle_ranges
+    return enable_angle_exclusion, None
+
+
+def describe_orientation(flip_vertical, yaw_offset, gpano):
+    """元数据确定的方向说明，没有元数据时返回 None"""
+    if not gpano:
+        return None
+    parts = []
+    if 'PoseHeadingDegrees' in gpano:
+        parts.append(f"方位角 {gpano['PoseHeadingDegrees']:g}°（水平角偏移 {yaw_offset:g}°）")
+    if 'PoseRollDegrees' in gpano:
+        parts.append(f"横滚角 {gpano['PoseRollDegrees']:g}°（{'倒置，垂直翻转' if flip_vertical else '正置'}）")
+    return '，'.join(parts) if parts else None
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片头信息探测 - 只读取文件头获取图片尺寸和 XMP 元数据（GPano 全景参数），无需解码整张图片
+"""
+
+import io
+import re
+import struct
+
+# JPEG 中携带图像尺寸的 SOF 标记（排除 DHT=C4、JPG=C8、DAC=CC）
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# 没有长度字段的独立标记
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+# JPEG APP1 段中 XMP 数据的标识
+_JPEG_XMP_SIGNATURE = b'http://ns.adobe.com/xap/1.0/\x00'
+# PNG iTXt 块中 XMP 数据的关键字
+_PNG_XMP_KEYWORD = b'XML:com.adobe.xmp'
+# TIFF 标签：宽、高、XMP
+_TIFF_IMAGE_WIDTH = 256
+_TIFF_IMAGE_LENGTH = 257
+_TIFF_XMP = 700
+# TIFF 各数据类型的字节数（BYTE, ASCII, SHORT, LONG, RATIONAL, ..., LONG8）
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8}
+
+# GPano 字段及类型（https://developers.google.com/streetview/spherical-metadata）
+GPANO_FIELDS = {
+    'ProjectionType': str,
+    'UsePanoramaViewer': str,
+    'PoseHeadingDegrees': float,
+    'PosePitchDegrees': float,
+    'PoseRollDegrees': float,
+    'InitialViewHeadingDegrees': float,
+    'FullPanoWidthPixels': int,
+    'FullPanoHeightPixels': int,
+    'CroppedAreaImageWidthPixels': int,
+    'CroppedAreaImageHeightPixels': int,
+    'CroppedAreaLeftPixels': int,
+    'CroppedAreaTopPixels': int,
+}
+
+
+def _read_jpeg_header(f, read_xmp):
+    """逐段读取 JPEG 头，直到 SOF（尺寸）为止；XMP 位于 SOF 之前的 APP1 段中"""
+    f.seek(2)
+    xmp = None
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None, xmp
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        # 跳过填充字节 0xFF
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None, xmp
+        code = marker[0]
+        if code in _JPEG_STANDALONE_MARKERS or code == 0x00:
+            continue
+        if code == 0xD9:  # EOI
+            return None, xmp
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None, xmp
+        length = struct.unpack('>H', length_bytes)[0]
+        if code in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None, xmp
+            height, width = struct.unpack('>HH', data[1:5])
+            return (width, height), xmp
+        if code == 0xE1 and read_xmp and xmp is None and length - 2 > len(_JPEG_XMP_SIGNATURE):
+            signature = f.read(len(_JPEG_XMP_SIGNATURE))
+            if signature == _JPEG_XMP_SIGNATURE:
+                xmp = f.read(length - 2 - len(signature))
+            else:
+                f.seek(length - 2 - len(signature), 1)
+            continue
+        f.seek(length - 2, 1)
+
+
+def _read_png_header(f, read_xmp):
+    """读取 IHDR（尺寸），需要 XMP 时继续读取 IDAT 之前的 iTXt 块"""
+    f.seek(16)
+    width, height = struct.unpack('>II', f.read(8))
+    if not read_xmp:
+        return (width, height), None
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return (width, height), None
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return (width, height), None
+        if chunk_type == b'iTXt' and length > len(_PNG_XMP_KEYWORD):
+            data = f.read(length)
+            keyword, _, rest = data.partition(b'\x00')
+            if keyword == _PNG_XMP_KEYWORD and len(rest) >= 2 and rest[0] == 0:
+                # 压缩标志(0)、压缩方法、语言标签\0、翻译关键字\0、文本
+                parts = rest[2:].split(b'\x00', 2)
+                if len(parts) == 3:
+                    return (width, height), parts[2]
+            f.seek(4, 1)
+            continue
+        f.seek(length + 4, 1)
+
+
+def _read_tiff_header(f, head, read_xmp):
+    """读取第一个 IFD 中的宽、高和 XMP 标签（支持标准 TIFF 和 BigTIFF）"""
+    endian = '<' if head[:2] == b'II' else '>'
+    magic = struct.unpack(endian + 'H', head[2:4])[0]
+    if magic == 42:
+        offset = struct.unpack(endian + 'I', head[4:8])[0]
+        count_fmt, entry_fmt, value_size = 'H', 'HHI', 4
+    elif magic == 43:
+        offset = struct.unpack(endian + 'Q', head[8:16])[0]
+        count_fmt, entry_fmt, value_size = 'Q', 'HHQ', 8
+    else:
+        return None, None
+    f.seek(offset)
+    count_size = struct.calcsize(endian + count_fmt)
+    n_entries = struct.unpack(endian + count_fmt, f.read(count_size))[0]
+    entry_size = struct.calcsize(endian + entry_fmt) + value_size
+    entries = f.read(n_entries * entry_size)
+    width = height = xmp = None
+    xmp_location = None
+    for i in range(n_entries):
+        entry = entries[i * entry_size:(i + 1) * entry_size]
+        if len(entry) < entry_size:
+            break
+        tag, value_type, count = struct.unpack(endian + entry_fmt, entry[:-value_size])
+        value = entry[-value_size:]
+        if tag in (_TIFF_IMAGE_WIDTH, _TIFF_IMAGE_LENGTH):
+            fmt = 'H' if value_type == 3 else ('Q' if value_type == 16 else 'I')
+            number = struct.unpack(endian + fmt, value[:struct.calcsize(fmt)])[0]
+            if tag == _TIFF_IMAGE_WIDTH:
+                width = number
+            else:
+                height = number
+        elif tag == _TIFF_XMP and read_xmp:
+            nbytes = count * _TIFF_TYPE_SIZES.get(value_type, 1)
+            if nbytes <= value_size:
+                xmp = value[:nbytes]
+            else:
+                xmp_location = (struct.unpack(endian + ('I' if value_size == 4 else 'Q'), value)[0], nbytes)
+    if xmp_location is not None:
+        f.seek(xmp_location[0])
+        xmp = f.read(xmp_location[1])
+    if width is None or height is None:
+        return None, xmp
+    return (width, height), xmp
+
+
+def probe_image(path, read_xmp=True):
+    """
+    读取图片的格式、尺寸和 XMP 元数据
+    支持 JPEG、PNG、TIFF（尺寸和 XMP）以及 BMP（仅尺寸），无法识别的格式或损坏的文件头返回 None
+    read_xmp: 为 False 时只读取尺寸
+    返回: {'format': 'jpeg'/'png'/'tiff'/'bmp', 'width': 宽, 'height': 高, 'xmp': XMP 字节串或 None} 或 None
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _probe_stream(f, read_xmp)
+    except OSError:
+        return None
+
+
+def probe_image_bytes(data, read_xmp=True):
+    """同 probe_image，读取内存中的图片数据（如上传的请求体）"""
+    return _probe_stream(io.BytesIO(data), read_xmp)
+
+
+def _probe_stream(f, read_xmp):
+    try:
+        head = f.read(26)
+        if head[:2] == b'\xff\xd8':
+            fmt = 'jpeg'
+            size, xmp = _read_jpeg_header(f, read_xmp)
+        elif head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            fmt = 'png'
+            size, xmp = _read_png_header(f, read_xmp)
+        elif head[:4] in (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'):
+            fmt = 'tiff'
+            size, xmp = _read_tiff_header(f, head, read_xmp)
+        elif head[:2] == b'BM' and len(head) >= 26:
+            fmt = 'bmp'
+            width, height = struct.unpack('<ii', head[18:26])
+            size, xmp = (width, abs(height)), None
+        else:
+            return None
+    except (OSError, struct.error):
+        return None
+    if size is None:
+        return None
+    return {'format': fmt, 'width': size[0], 'height': size[1], 'xmp': xmp}
+
+
+def probe_image_size(path):
+    """
+    读取图片尺寸
+    支持 JPEG、PNG、TIFF、BMP，无法识别的格式返回 None（调用方需要回退到完整解码）
+    返回: (宽, 高) 或 None
+    """
+    info = probe_image(path, read_xmp=False)
+    if info is None:
+        return None
+    return info['width'], info['height']
+
+
+def parse_gpano(xmp):
+    """
+    从 XMP 中解析 GPano 字段（属性形式 GPano:Key="..." 和元素形式 <GPano:Key>...</GPano:Key> 均可）
+    返回: {字段名: 值}，只包含存在且格式正确的字段
+    """
+    if not xmp:
+        return {}
+    text = xmp.decode('utf-8', errors='replace') if isinstance(xmp, bytes) else xmp
+    gpano = {}
+    for key, convert in GPANO_FIELDS.items():
+        match = re.search(rf'GPano:{key}\s*=\s*["\']([^"\']*)["\']', text) or \
+            re.search(rf'<GPano:{key}>([^<]*)</GPano:{key}>', text)
+        if match is None:
+            continue
+        try:
+            gpano[key] = convert(float(match.group(1)) if convert is int else match.group(1).strip())
+        except ValueError:
+            continue
+    return gpano
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程执行后端 - 解码后的全景图放入共享内存，子进程直接从共享内存渲染各个视角，
+像素数据不经过 pickle 序列化
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from decoding import read_panorama
+from encoders import OutputEncoder, write_buffer
+from memory_budget import estimate_job_bytes
+from planner import describe_orientation, image_orientation, metadata_exclusion, orient_views
+from tracing import get_tracer
+from views import image_output_dir, plan_ring_views, view_output_filename
+
+# 子进程内的状态（由 _init_worker 初始化）
+_worker_map_cache = None
+_worker_map_store = None
+
+
+def default_cv2_threads(max_workers):
+    """每个子进程的 OpenCV 线程数：CPU 核心数平均分给各进程，避免过度订阅"""
+    cpu_count = os.cpu_count() or 1
+    return max(1, cpu_count // max(1, max_workers))
+
+
+def _init_worker(cv2_threads, map_cache_max_bytes, map_store_dir, trace=False):
+    """子进程初始化：设置 OpenCV 线程数，创建进程内的网格缓存，按需开启耗时追踪"""
+    global _worker_map_cache, _worker_map_store
+    from remap_cache import RemapCache
+    from map_store import FixedPointMapStore
+
+    cv2.setNumThreads(cv2_threads)
+    _worker_map_cache = RemapCache(map_cache_max_bytes)
+    if map_store_dir:
+        _worker_map_store = FixedPointMapStore(map_store_dir)
+    if trace:
+        get_tracer().start()
+
+
+def _render_view_task(shm_name, shape, dtype, fov, theta, phi, out_size, flip_vertical, output_path, encoder,
+                      interpolation):
+    """
+    子进程任务：从共享内存中的全景图渲染一个视角并写入文件
+    返回: 本任务记录的耗时事件（未开启追踪时为空列表），由主进程合并
+    """
+    from batch_process import equirectangular_to_perspective
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = equirectangular_to_perspective(np.ndarray(shape, dtype=dtype, buffer=shm.buf),
+                                             fov, theta, phi, out_size, flip_vertical,
+                                             _worker_map_cache, _worker_map_store, interpolation)
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # 异常的 traceback 仍引用共享内存中的数组，由进程退出时释放
+            pass
+    write_buffer(output_path, encoder.encode(out))
+    return get_tracer().drain()
+
+
+def _decode_to_shared_memory(input_path, fov, out_size, reduced_decode, decode_oversample):
+    """解码图片并复制到新建的共享内存中，返回 (shm, shape, dtype)，失败返回 None"""
+    img = read_panorama(input_path, fov, out_size, reduced_decode, decode_oversample)
+    if img is None:
+        return None
+    shm = shared_memory.SharedMemory(create=True, size=img.nbytes)
+    shared = np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)
+    shared[...] = img
+    del shared
+    return shm, img.shape, img.dtype.str
+
+
+def _release_shared_memory(shm):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def run_process_backend(image_files, output_base_dir, fov=90, overlap=0.2, out_size=(1024,1024),
+                        max_workers=4, exclude_angle_ranges=None, enable_angle_exclusion=False, pitch_angle=0,
+                        flip_vertical=False, map_cache_max_bytes=512 * 1024 * 1024, map_store_dir=None,
+                        cv2_threads=None, decode_workers=2, max_inflight_images=None, encoder=None,
+                        reduced_decode=False, decode_oversample=None, interpolation='lanczos', trace=False,
+                        manifest=None, input_root=None, view_plan=None, memory_budget=None, use_metadata=False):
+    """
+    使用进程池批量处理图片
+    image_files: 图片路径的可迭代对象（可以是边扫描边产出的生成器）
+    主进程用线程池解码（cv2.imread 会释放 GIL），解码结果放入共享内存，
+    每个视角作为一个任务提交给进程池，同一张图的所有视角共享一份像素数据
+    子进程使用 spawn 方式启动，避免 fork 继承 OpenCV 内部线程池的锁状态导致死锁
+    cv2_threads: 每个子进程的 OpenCV 线程数，默认按核心数平均分配
+    max_inflight_images: 同时驻留在共享内存中的全景图数量上限，默认 max_workers + decode_workers
+    encoder: 输出编码器（OutputEncoder），在子进程中编码写出，默认使用配置文件中的输出设置
+    reduced_decode: 按输出所需的角分辨率降采样解码，decode_oversample 为分辨率余量
+    interpolation: 插值方式，见 equirectangular_to_perspective
+    trace: 在子进程中记录各阶段耗时，任务完成后合并到主进程的追踪器
+    manifest: 可选的批量处理清单（BatchManifest），图片的全部视角写出后由主进程记录
+    input_root: 输入根目录，提供时输出目录保留图片的子目录结构（见 views.image_output_dir）
+    view_plan: 预先规划的视角 (views, n_views, excluded_count)（见 views.plan_views），默认按 pitch_angle 规划一圈水平视角
+    memory_budget: 可选的内存预算（MemoryBudget），按估计的全景图大小控制驻留在共享内存中的图片，
+        预算不足时暂缓解码，有图片完成后再继续；视角在子进程中逐个渲染写出，不计入
+    use_metadata: 根据每张图片的 GPano 元数据确定垂直翻转和水平角偏移（见 planner.image_orientation）；
+        角度排除按偏移后相对于相机的水平角进行，view_plan 应为未排除的规划
+    返回: 成功处理的图片数量
+    """
+    if cv2_threads is None:
+        cv2_threads = default_cv2_threads(max_workers)
+    if max_inflight_images is None:
+        max_inflight_images = max_workers + decode_workers
+    if encoder is None:
+        encoder = OutputEncoder()
+
+    plan_exclusion, image_exclusion = metadata_exclusion(exclude_angle_ranges, enable_angle_exclusion, use_metadata)
+    if view_plan is None:
+        view_plan = plan_ring_views(fov, overlap, pitch_angle, exclude_angle_ranges, plan_exclusion)
+    views, n_views, excluded_count = view_plan
+    print(f"多进程模式: {max_workers} 个进程，每个进程 OpenCV 线程数 {cv2_threads}，"
+          f"每张图 {len(views)} 个视角（排除 {excluded_count} 个）")
+
+    successful_count = 0
+    pending_images = iter(image_files)
+    # 每张图的状态: input_path -> {'shm':..., 'remaining':..., 'ok':...}
+    image_states = {}
+    decode_futures = {}
+    render_futures = {}
+    # 因内存预算不足暂缓解码的图片 (input_path, cost)
+    deferred = []
+
+    def submit_next_decode(decoder):
+        if deferred:
+            input_path, cost = deferred.pop()
+            retry = True
+        else:
+            input_path = next(pending_images, None)
+            if input_path is None:
+                return False
+            cost = 0
+            if memory_budget is not None:
+                cost = estimate_job_bytes(input_path, fov, out_size, 0, reduced_decode, decode_oversample)
+            retry = False
+        if memory_budget is not None and not memory_budget.try_acquire(cost, retry):
+            deferred.append((input_path, cost))
+            return False
+        decode_futures[decoder.submit(_decode_to_shared_memory, input_path, fov, out_size,
+                                        reduced_decode, decode_oversample)] = (input_path, time.perf_counter_ns(), cost)
+        return True
+
+    def fill_decodes(decoder):
+        """在驻留图片数量上限和内存预算允许的范围内提交解码"""
+        while len(decode_futures) + len(image_states) < max_inflight_images:
+            if not submit_next_decode(decoder):
+                return
+
+    def release_image(cost):
+        if memory_budget is not None:
+            memory_budget.release(cost)
+
+    with ThreadPoolExecutor(max_workers=decode_workers) as decoder, \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                initializer=_init_worker, initargs=(cv2_threads, map_cache_max_bytes, map_store_dir, trace)) as pool:
+        fill_decodes(decoder)
+
+        try:
+            while decode_futures or render_futures:
+                done, _ = wait(list(decode_futures) + list(render_futures), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in decode_futures:
+                        input_path, start_ns, cost = decode_futures.pop(future)
+                        try:
+                            decoded = future.result()
+                        except Exception as e:
+                            print(f"处理 {input_path} 时出错: {str(e)}")
+                            decoded = None
+                        if decoded is None:
+                            print(f"错误：无法读取图片 {input_path}")
+                            release_image(cost)
+                            fill_decodes(decoder)
+                            continue
+                        shm, shape, dtype = decoded
+                        output_dir = image_output_dir(output_base_dir, input_path, input_root)
+                        try:
+                            os.makedirs(output_dir, exist_ok=True)
+                        except OSError as e:
+                            # 计为失败，释放共享内存和内存预算后继续处理其他图片
+                            print(f"处理 {input_path} 时出错: {str(e)}")
+                            _release_shared_memory(shm)
+                            release_image(cost)
+                            fill_decodes(decoder)
+                            continue
+                        print(f"处理 {os.path.basename(input_path)}: 生成 {n_views} 张图，每张 FOV={fov}°，"
+                              f"重叠={overlap*100:.1f}%，俯仰角={pitch_angle}°")
+                        image_flip, yaw_offset, gpano = image_orientation(input_path, flip_vertical, use_metadata)
+                        orientation = describe_orientation(image_flip, yaw_offset, gpano)
+                        if orientation:
+                            print(f"{os.path.basename(input_path)} 元数据: {orientation}")
+                        image_views = orient_views(views, yaw_offset, image_exclusion)
+                        if not image_views:
+                            _release_shared_memory(shm)
+                            release_image(cost)
+                            if manifest is not None:
+                                manifest.record(input_path, [])
+                            successful_count += 1
+                            fill_decodes(decoder)
+                            continue
+                        image_states[input_path] = {'shm': shm, 'remaining': len(image_views), 'ok': True,
+                                                    'start_ns': start_ns, 'outputs': [], 'cost': cost}
+                        for view_index, theta, phi in image_views:
+                            output_path = os.path.join(output_dir, view_output_filename(input_path, view_index, encoder))
+                            f = pool.submit(_render_view_task, shm.name, shape, dtype, fov, theta, phi,
+                                            out_size, image_flip, output_path, encoder, interpolation)
+                            render_futures[f] = (input_path, output_path)
+                    else:
+                        input_path, output_path = render_futures.pop(future)
+                        state = image_states[input_path]
+                        try:
+                            get_tracer().add_events(future.result())
+                            state['outputs'].append(output_path)
+                        except Exception as e:
+                            print(f"处理 {input_path} 时发生异常: {str(e)}")
+                            state['ok'] = False
+                        state['remaining'] -= 1
+                        if state['remaining'] == 0:
+                            # 所有视角完成后释放共享内存，并开始解码下一张
+                            _release_shared_memory(state['shm'])
+                            release_image(state['cost'])
+                            del image_states[input_path]
+                            get_tracer().record('image', state['start_ns'], time.perf_counter_ns(), image=input_path)
+                            if state['ok'] and manifest is not None:
+                                try:
+                                    manifest.record(input_path, state['outputs'])
+                                except OSError as e:
+                                    print(f"更新处理清单时出错: {str(e)}")
+                            if state['ok']:
+                                successful_count += 1
+                                print(f"完成处理 {os.path.basename(input_path)}: 生成 {len(state['outputs'])} 张图")
+                            else:
+                                print(f"处理 {input_path} 时出错: 部分视角写入失败")
+                            fill_decodes(decoder)
+        finally:
+            for future in render_futures:
+                future.cancel()
+            for state in image_states.values():
+                _release_shared_memory(state['shm'])
+            # 尚未开始的解码直接取消，正在进行的解码等待完成后释放其共享内存，避免 /dev/shm 泄漏
+            for future in decode_futures:
+                if future.cancel():
+                    continue
+                try:
+                    decoded = future.result()
+                except Exception:
+                    continue
+                if decoded is not None:
+                    _release_shared_memory(decoded[0])
+
+    return successful_count
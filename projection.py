@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+投影计算模块 - 生成 equirectangular 到透视图的重映射坐标网格
+"""
+
+import math
+import numpy as np
+
+# 分块生成采样坐标时每块的像素数（临时数组的大小上限）
+MAP_STRIP_PIXELS = 1 << 18
+
+
+def rotation_matrix(theta, phi):
+    """旋转矩阵（先绕 Y=theta，再绕 X=phi），角度单位为度"""
+    def rot_matrix(axis, angle):
+        a = math.radians(angle)
+        if axis == 'y':
+            return np.array([[ math.cos(a), 0, math.sin(a)],
+                             [0, 1, 0],
+                             [-math.sin(a), 0, math.cos(a)]])
+        if axis == 'x':
+            return np.array([[1, 0, 0],
+                             [0, math.cos(a), -math.sin(a)],
+                             [0, math.sin(a), math.cos(a)]])
+    return rot_matrix('y', theta) @ rot_matrix('x', phi)
+
+
+def compute_base_grid(fov, phi, out_size):
+    """
+    计算 theta=0 时的归一化采样网格，与输入分辨率无关
+    水平旋转只是经度加一个常数，因此同一 (fov, phi, out_size) 的所有视角共用这个网格
+    返回: (lon_frac, v_frac)，float32
+        lon_frac: 经度 / 2π + 0.5，取值 [0,1)；phi=0 时经度只与列有关，为一维数组 (w_out,)
+        v_frac: 0.5 - 纬度 / π，形状 (h_out, w_out)
+    """
+    fov_rad = math.radians(fov)
+    w_out, h_out = out_size
+
+    # 构建透视相机坐标（一维，双精度计算后转为 float32）
+    x = np.linspace(-math.tan(fov_rad/2), math.tan(fov_rad/2), w_out)
+    y = -np.linspace(-math.tan(fov_rad/2), math.tan(fov_rad/2), h_out)  # 注意 y 反向
+
+    # 相机射线 (x, y, 1) 绕 X 轴旋转 phi 后为 (x, c·y - s, s·y + c)（长度不变）:
+    #     经度 = atan2(x, s·y + c)，纬度 = atan2(c·y - s, hypot(x, s·y + c))
+    # 水平旋转在生成采样坐标时以经度偏移的形式加上
+    c, s = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+    z_rot = (s * y + c).astype(np.float32)[:, None]
+    y_rot = (c * y - s).astype(np.float32)[:, None]
+    x32 = x.astype(np.float32)
+
+    v_frac = np.empty((h_out, w_out), dtype=np.float32)
+    if phi == 0:
+        # 水平视角：经度只与列有关
+        lon_frac = np.arctan2(x, 1.0).astype(np.float32)
+    else:
+        lon_frac = np.arctan2(x32[None, :], z_rot)
+    # 按行分块计算纬度，临时数组只有一个分块大小
+    strip_rows = max(1, MAP_STRIP_PIXELS // max(1, w_out))
+    for r0 in range(0, h_out, strip_rows):
+        r1 = min(h_out, r0 + strip_rows)
+        np.arctan2(y_rot[r0:r1], np.hypot(x32[None, :], z_rot[r0:r1]), out=v_frac[r0:r1])
+
+    lon_frac *= np.float32(1 / (2 * math.pi))
+    lon_frac += np.float32(0.5)
+    v_frac *= np.float32(-1 / math.pi)
+    v_frac += np.float32(0.5)
+    return lon_frac, v_frac
+
+
+def base_grid_key(fov, phi, out_size):
+    """基础网格的缓存 key（不含水平角和输入分辨率）"""
+    return ('base', float(fov), float(phi), int(out_size[0]), int(out_size[1]))
+
+
+def get_base_grid(fov, phi, out_size, map_cache=None):
+    """获取基础网格，提供 map_cache 时同一 (fov, phi, out_size) 只计算一次"""
+    if map_cache is None:
+        return compute_base_grid(fov, phi, out_size)
+
+    def factory():
+        grid = compute_base_grid(fov, phi, out_size)
+        for g in grid:
+            g.flags.writeable = False
+        return grid
+
+    return map_cache.get_or_compute(base_grid_key(fov, phi, out_size), factory)
+
+
+def compute_perspective_maps(src_w, src_h, fov, theta, phi, out_size, base_grid=None, flip_vertical=False,
+                             rows=None):
+    """
+    计算透视图在 equirectangular 全景图上的采样坐标
+    src_w, src_h: 输入全景图尺寸
+    fov, theta, phi: 视场角、水平角、俯仰角（度）
+    out_size: 输出图像大小 (w,h)
+    base_grid: 可选，compute_base_grid 的结果；提供时不再做任何三角函数运算
+    flip_vertical: 在采样坐标中完成垂直翻转（等价于先 cv2.flip(img, 0) 再采样，但不复制全景图）
+    rows: 可选的输出行范围 (start, stop)，只计算这些行的采样坐标（分块生成时使用）
+    返回: (map_x, map_y)，float32，可直接用于 cv2.remap（配合 BORDER_WRAP）
+    """
+    if base_grid is None:
+        base_grid = compute_base_grid(fov, phi, out_size)
+    lon_frac, v_frac = base_grid
+    w_out, h_out = out_size
+    r0, r1 = rows if rows is not None else (0, h_out)
+    if lon_frac.ndim == 2:
+        lon_frac = lon_frac[r0:r1]
+    v_frac = v_frac[r0:r1]
+
+    # 水平旋转 = 经度偏移 theta/360 个图像宽度，取模后落在 [0, src_w)；全部就地计算，不产生中间数组
+    map_x = np.empty((r1 - r0, w_out), dtype=np.float32)
+    np.add(lon_frac, np.float32((theta % 360) / 360.0), out=map_x)
+    np.mod(map_x, np.float32(1.0), out=map_x)
+    map_x *= np.float32(src_w)
+
+    map_y = np.multiply(v_frac, np.float32(src_h))
+    if flip_vertical:
+        # 翻转后第 v 行对应原图第 h-1-v 行
+        np.subtract(np.float32(src_h - 1), map_y, out=map_y)
+
+    return map_x, map_y
+
+
+def required_source_width(fov, out_size):
+    """
+    输出视角所需的全景图最小宽度
+    透视图中心像素的角分辨率最低（每像素对应的角度最大），全景图每像素角度不大于它即可
+    """
+    w_out, h_out = out_size
+    step = 2 * math.tan(math.radians(fov) / 2) / max(1, max(w_out, h_out) - 1)  # 中心处每像素对应的弧度
+    return 2 * math.pi / step
+
+
+def perspective_map_params(src_w, src_h, fov, theta, phi, out_size, flip_vertical=False):
+    """影响采样坐标的全部参数（用于缓存 key）"""
+    return {'src_w': int(src_w), 'src_h': int(src_h), 'fov': float(fov), 'theta': float(theta),
+            'phi': float(phi), 'out_w': int(out_size[0]), 'out_h': int(out_size[1]),
+            'flip_vertical': bool(flip_vertical)}
+
+
+def perspective_map_key(src_w, src_h, fov, theta, phi, out_size, flip_vertical=False, fixed_point=False):
+    """缓存 key：包含所有影响采样坐标的参数"""
+    return ('persp_fixed' if fixed_point else 'persp', int(src_w), int(src_h), float(fov), float(theta),
+            float(phi), int(out_size[0]), int(out_size[1]), bool(flip_vertical))
+
+
+def get_perspective_maps(src_w, src_h, fov, theta, phi, out_size, map_cache=None, map_store=None,
+                         flip_vertical=False, cache_maps=True):
+    """
+    获取采样坐标，提供 map_cache（RemapCache）时优先从缓存读取
+    map_store: 可选的 FixedPointMapStore，提供时返回磁盘缓存的定点网格 (CV_16SC2, CV_16UC1)
+    flip_vertical: 是否垂直翻转，直接体现在采样坐标中
+    cache_maps: 为 False 时 map_cache 只用于基础网格，本视角的采样坐标不放入缓存（调用方缓存由其派生的结果时使用）
+    """
+    def compute():
+        base_grid = get_base_grid(fov, phi, out_size, map_cache)
+        return compute_perspective_maps(src_w, src_h, fov, theta, phi, out_size, base_grid, flip_vertical)
+
+    if map_store is not None:
+        params = perspective_map_params(src_w, src_h, fov, theta, phi, out_size, flip_vertical)
+        def factory():
+            return map_store.load_or_compute(params, compute)
+    else:
+        def factory():
+            maps = compute()
+            # 缓存中的数组被多个线程共享，设为只读防止被意外修改
+            for m in maps:
+                m.flags.writeable = False
+            return maps
+
+    if map_cache is None or not cache_maps:
+        return factory()
+    key = perspective_map_key(src_w, src_h, fov, theta, phi, out_size, flip_vertical,
+                              fixed_point=map_store is not None)
+    return map_cache.get_or_compute(key, factory)
@@ -205,6 +205,8 @@ def main():
         print(f"视场角: {perf_config['fov']}°")
         print(f"重叠比例: {perf_config['overlap']*100:.1f}%")
         print(f"输出尺寸: {perf_config['output_size'][0]}x{perf_config['output_size'][1]}")
+        print(f"JPEG质量: {perf_config['jpeg_quality']}")
+        print(f"插值方式: {perf_config.get('interpolation', DEFAULT_CONFIG['interpolation'])}")
         print(f"线程数: {threads}")
         print(f"俯仰角度: {pitch_angle}°")
         if flip_vertical:
@@ -236,7 +238,10 @@ def main():
             exclude_angle_ranges=exclude_angle_ranges,
             enable_angle_exclusion=enable_exclusion,
             pitch_angle=pitch_angle,
-            flip_vertical=flip_vertical
+            flip_vertical=flip_vertical,
+            output_options=perf_config,
+            reduced_decode=perf_config.get('reduced_decode', False),
+            interpolation=perf_config.get('interpolation')
         )
         
         print(f"\n处理完成！结果保存在: {output_folder}")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重映射网格缓存 - 线程安全的 LRU 缓存，按内存占用上限淘汰
+"""
+
+import threading
+from collections import OrderedDict
+
+from config import DEFAULT_CONFIG
+
+
+def _value_nbytes(value):
+    """计算缓存值（数组或数组元组）占用的字节数"""
+    if isinstance(value, (tuple, list)):
+        return sum(_value_nbytes(v) for v in value)
+    return getattr(value, 'nbytes', 0)
+
+
+class RemapCache:
+    """
+    重映射坐标网格的 LRU 缓存
+    key: 任意可哈希的参数元组，例如 (输入宽, 输入高, fov, theta, phi, 输出尺寸)
+    value: numpy 数组或数组元组（map_x, map_y）
+    max_bytes: 缓存总内存上限（字节），超出时淘汰最久未使用的条目；0 表示不缓存
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        # 正在计算中的 key，避免多个线程同时计算同一个网格
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """查找缓存，命中时返回值并更新 LRU 顺序，未命中返回 None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入缓存，超过内存上限时按 LRU 淘汰"""
+        with self._lock:
+            self._put_locked(key, value)
+
+    def _put_locked(self, key, value):
+        nbytes = _value_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._current_bytes -= _value_nbytes(old)
+        self._entries[key] = value
+        self._current_bytes += nbytes
+        while self._current_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._current_bytes -= _value_nbytes(evicted)
+            self.evictions += 1
+
+    def get_or_compute(self, key, factory):
+        """
+        获取缓存值，未命中时调用 factory() 计算并写入缓存
+        同一个 key 同时只会被计算一次，其它线程等待计算结果
+        """
+        while True:
+            with self._lock:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                event = self._pending.get(key)
+                if event is None:
+                    self.misses += 1
+                    event = threading.Event()
+                    self._pending[key] = event
+                    break
+            # 其它线程正在计算，等待完成后重新查找
+            event.wait()
+            with self._lock:
+                if key not in self._entries and key not in self._pending:
+                    # 结果未能缓存（例如超过上限），自行计算
+                    self.misses += 1
+                    break
+
+        try:
+            value = factory()
+            with self._lock:
+                self._put_locked(key, value)
+            return value
+        finally:
+            with self._lock:
+                pending = self._pending.pop(key, None)
+            if pending is not None:
+                pending.set()
+
+    def clear(self):
+        """清空缓存（统计信息保留）"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self):
+        """返回缓存统计信息字典"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'current_bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def format_stats(self):
+        """返回便于打印的统计信息字符串"""
+        s = self.stats()
+        return (f"命中 {s['hits']} 次，未命中 {s['misses']} 次，命中率 {s['hit_rate']*100:.1f}%，"
+                f"条目 {s['entries']} 个，占用 {s['current_bytes']/1024/1024:.1f}/{s['max_bytes']/1024/1024:.0f} MB，"
+                f"淘汰 {s['evictions']} 次")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_map_cache():
+    """获取进程内共享的默认重映射缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RemapCache(DEFAULT_CONFIG['map_cache_max_mb'] * 1024 * 1024)
+        return _default_cache
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按视角裁剪的重映射 - 每个视角只用到全景图的一小部分，输出按行分块，先根据每块的采样坐标计算其在全景图中的
+包围框（考虑左右边界的环绕），只对这一区域调用 cv2.remap 并直接写入输出数组的对应行，减少大尺寸全景图的
+内存访问量，采样坐标也逐块生成，不产生整幅的临时数组；
+全景图超过 cv2.remap 的尺寸限制（宽高需小于 32767）时，将分块再按列切分、按源图列分段渲染，超大全景图也能处理
+
+裁剪后的结果与对整张全景图 remap（BORDER_WRAP）一致：包围框留有插值核所需的余量，
+跨越左右边界（或上下边界）的区域按环绕方式拼接
+"""
+
+import cv2
+import numpy as np
+
+from projection import (MAP_STRIP_PIXELS, compute_perspective_maps, get_base_grid, get_perspective_maps,
+                        perspective_map_key)
+
+# cv2.remap 对源图和输出尺寸的限制（宽高需小于 SHRT_MAX）
+REMAP_MAX_SIDE = 32766
+# 包围框余量：Lanczos 插值核半径 4 像素，再加上插值所需的相邻像素
+ROI_MARGIN = 5
+# 包围框面积超过全景图的这一比例时直接对整张图 remap（裁剪收益不大）
+ROI_MAX_AREA_RATIO = 0.5
+# 包围框超出尺寸限制时的输出分块宽度和源图分段宽度
+TILE_SIZE = 256
+BAND_WIDTH = 16384
+# cv2.remap 定点坐标的小数精度（1/32 像素）
+INTER_TAB_BITS = 5
+INTER_TAB_SIZE = 1 << INTER_TAB_BITS
+
+
+def _wrapped_interval(coords, size, margin=ROI_MARGIN):
+    """
+    计算环绕坐标（0..size-1）的最小覆盖区间，即去掉最大空隙后的部分，两端各留 margin 的余量
+    返回: (起点, 长度)，起点可能使区间跨越 size 环绕回 0；长度等于 size 表示整个范围
+    """
+    occupied = np.zeros(size, dtype=bool)
+    occupied[coords] = True
+    idx = np.flatnonzero(occupied)
+    if idx.size == 0:
+        return 0, min(size, 1)
+    wrap_gap = idx[0] + size - idx[-1]
+    if idx.size > 1:
+        gaps = np.diff(idx)
+        k = int(np.argmax(gaps))
+        if gaps[k] > wrap_gap:
+            start, end = int(idx[k + 1]), int(idx[k]) + size
+        else:
+            start, end = int(idx[0]), int(idx[-1])
+    else:
+        start = end = int(idx[0])
+    length = end - start + 2 + 2 * margin
+    if length >= size:
+        return 0, size
+    return (start - margin) % size, length
+
+
+def _source_interval(coords, size):
+    """
+    视角在源图某一维上的采样区间；区间跨越边界时需要复制拼接，
+    若整个维度不超过 cv2.remap 的限制则改为使用整个维度（依靠 BORDER_WRAP 环绕，不复制）
+    """
+    start, length = _wrapped_interval(coords, size)
+    if start + length > size and size <= REMAP_MAX_SIDE:
+        return 0, size
+    return start, length
+
+
+def _integer_coords(map1, map2, src_w, src_h):
+    """采样坐标的整数部分（浮点网格向下取整，定点网格 CV_16SC2 直接取整数部分）"""
+    if map1.ndim == 3:
+        xs, ys = map1[..., 0].astype(np.int32), map1[..., 1].astype(np.int32)
+    else:
+        xs, ys = np.floor(map1).astype(np.int32), np.floor(map2).astype(np.int32)
+    return np.clip(xs, 0, src_w - 1), np.clip(ys, 0, src_h - 1)
+
+
+def _coordinate_mode(interpolation):
+    """
+    浮点网格平移后的表示方式，与 cv2.remap 内部对该插值方式的处理保持一致:
+    最近邻直接四舍五入到整数；Lanczos 先量化到 1/32 像素（与定点网格相同）；其余插值直接使用浮点坐标
+    """
+    if interpolation == cv2.INTER_NEAREST:
+        return 'nearest'
+    if interpolation == cv2.INTER_LANCZOS4:
+        return 'fixed'
+    return 'float'
+
+
+def _shift_maps(map1, map2, x0, y0, src_w, src_h, mode):
+    """
+    将采样坐标平移到裁剪区域的坐标系（环绕取模）
+    定点网格（以及按 mode 转换为定点的浮点网格）在整数部分上平移，采样位置与原坐标完全一致；
+    其余浮点网格以双精度计算后转回 float32，误差在 float32 精度以内
+    """
+    if map1.ndim == 2 and mode == 'float':
+        mx = np.mod(map1.astype(np.float64) - x0, src_w).astype(np.float32) if x0 else map1
+        my = np.mod(map2.astype(np.float64) - y0, src_h).astype(np.float32) if y0 else map2
+        return mx, my
+
+    if map1.ndim == 3:
+        xi, yi, frac = map1[..., 0].astype(np.int32), map1[..., 1].astype(np.int32), map2
+    elif mode == 'nearest':
+        xi, yi, frac = np.rint(map1).astype(np.int32), np.rint(map2).astype(np.int32), None
+    else:
+        fx = np.rint(map1 * np.float32(INTER_TAB_SIZE)).astype(np.int32)
+        fy = np.rint(map2 * np.float32(INTER_TAB_SIZE)).astype(np.int32)
+        xi, yi = fx >> INTER_TAB_BITS, fy >> INTER_TAB_BITS
+        frac = ((fy & (INTER_TAB_SIZE - 1)) * INTER_TAB_SIZE + (fx & (INTER_TAB_SIZE - 1))).astype(np.uint16)
+    shifted = np.empty(xi.shape + (2,), dtype=np.int16)
+    shifted[..., 0] = np.mod(xi - x0, src_w)
+    shifted[..., 1] = np.mod(yi - y0, src_h)
+    return shifted, frac
+
+
+def _make_task(out_rect, map1, map2, xs, ys, src_w, src_h, mode, mask=None):
+    x0, width = _source_interval(xs, src_w)
+    y0, height = _source_interval(ys, src_h)
+    if width > REMAP_MAX_SIDE or height > REMAP_MAX_SIDE:
+        return None
+    mx, my = _shift_maps(map1, map2, x0, y0, src_w, src_h, mode)
+    return (out_rect, (x0, width, y0, height), mx, my, mask)
+
+
+def _strip_tasks(y, map1, map2, src_w, src_h, mode):
+    """为一个输出行分块生成任务"""
+    rows, out_w = map1.shape[:2]
+    rect = (0, y, out_w, rows)
+    xs, ys = _integer_coords(map1, map2, src_w, src_h)
+    x0, width = _source_interval(xs, src_w)
+    y0, height = _source_interval(ys, src_h)
+    if src_w <= REMAP_MAX_SIDE and src_h <= REMAP_MAX_SIDE and width * height >= ROI_MAX_AREA_RATIO * src_w * src_h:
+        return [(rect, None, map1, map2, None)]
+    task = _make_task(rect, map1, map2, xs, ys, src_w, src_h, mode)
+    if task is not None:
+        return [task]
+
+    # 包围框超出 cv2.remap 的尺寸限制：分块再按列切分，仍超出的（如包含极点）再按源图列分段，用掩码合成
+    tasks = []
+    for tx in range(0, out_w, TILE_SIZE):
+        cols = slice(tx, min(out_w, tx + TILE_SIZE))
+        rect = (tx, y, cols.stop - tx, rows)
+        m1, m2 = map1[:, cols], map2[:, cols]
+        txs, tys = xs[:, cols], ys[:, cols]
+        task = _make_task(rect, m1, m2, txs, tys, src_w, src_h, mode)
+        if task is not None:
+            tasks.append(task)
+            continue
+        for band_start in range(0, src_w, BAND_WIDTH):
+            mask = (txs >= band_start) & (txs < band_start + BAND_WIDTH)
+            if not mask.any():
+                continue
+            task = _make_task(rect, m1, m2, txs[mask], tys[mask], src_w, src_h, mode, mask)
+            if task is None:
+                raise ValueError(f"全景图尺寸 {src_w}x{src_h} 超出支持范围")
+            tasks.append(task)
+    return tasks
+
+
+def build_remap_plan(strip_maps, out_size, src_w, src_h, interpolation=cv2.INTER_LANCZOS4):
+    """
+    按输出行分块生成渲染计划，每个分块只对其采样的源图区域 remap
+    strip_maps: strip_maps(start, stop) 返回输出第 start 到 stop 行的采样坐标 (map1, map2)
+        采样坐标逐块生成、逐块转换，临时数组只有一个分块大小
+    interpolation: 计划所用的 cv2 插值标志（决定平移后采样坐标的表示方式）
+    返回: (输出尺寸 (w, h), 任务列表)
+        任务为 (输出区域 (x, y, w, h), 源图裁剪区域 (x0, 宽, y0, 高) 或 None, map1, map2, 掩码或 None)
+        源图裁剪区域为 None 表示直接对整张全景图 remap
+    """
+    out_w, out_h = out_size
+    mode = _coordinate_mode(interpolation)
+    strip_rows = max(1, MAP_STRIP_PIXELS // out_w)
+    tasks = []
+    for y in range(0, out_h, strip_rows):
+        map1, map2 = strip_maps(y, min(out_h, y + strip_rows))
+        tasks.extend(_strip_tasks(y, map1, map2, src_w, src_h, mode))
+    return (out_w, out_h), tasks
+
+
+def _crop(img, x0, width, y0, height):
+    """裁剪源图区域，跨越边界时按环绕方式拼接（不跨越边界时返回视图，不复制）"""
+    src_h, src_w = img.shape[:2]
+    if x0 + width <= src_w and y0 + height <= src_h:
+        return img[y0:y0 + height, x0:x0 + width]
+    rows = np.arange(y0, y0 + height) % src_h
+    cols = np.arange(x0, x0 + width) % src_w
+    return img[np.ix_(rows, cols)]
+
+
+def remap_with_plan(img, plan, interpolation, dst=None):
+    """按渲染计划重映射，dst 为可选的输出数组"""
+    (out_w, out_h), tasks = plan
+    if len(tasks) == 1 and tasks[0][4] is None:
+        _, crop, map1, map2, _ = tasks[0]
+        src = img if crop is None else _crop(img, *crop)
+        # 裁剪区域留有插值余量，不会访问到边界之外；未裁剪的维度仍需左右环绕
+        return cv2.remap(src, map1, map2, dst=dst, interpolation=interpolation, borderMode=cv2.BORDER_WRAP)
+
+    if dst is None:
+        dst = np.empty((out_h, out_w) + img.shape[2:], dtype=img.dtype)
+    for (x, y, w, h), crop, map1, map2, mask in tasks:
+        src = img if crop is None else _crop(img, *crop)
+        target = dst[y:y + h, x:x + w]
+        if mask is None and target.flags.c_contiguous:
+            # 整行分块在输出中是连续的，直接渲染到输出数组中
+            cv2.remap(src, map1, map2, dst=target, interpolation=interpolation, borderMode=cv2.BORDER_WRAP)
+            continue
+        out = cv2.remap(src, map1, map2, interpolation=interpolation, borderMode=cv2.BORDER_WRAP)
+        if mask is None:
+            target[...] = out
+        else:
+            np.copyto(target, out, where=mask[..., None] if out.ndim == 3 else mask)
+    return dst
+
+
+def get_remap_plan(src_w, src_h, fov, theta, phi, out_size, map_cache=None, map_store=None, flip_vertical=False,
+                   interpolation=cv2.INTER_LANCZOS4):
+    """
+    获取视角的渲染计划，提供 map_cache（RemapCache）时同一视角只计算一次
+    计划中已包含（平移后的）采样坐标，原始采样坐标不再单独缓存；采样坐标按行分块生成，
+    峰值内存约为计划本身加一个分块的临时数组
+    interpolation: 渲染时使用的 cv2 插值标志
+    全景图超过定点网格的表示范围时忽略 map_store，使用浮点网格
+    """
+    if map_store is not None and max(src_w, src_h) > REMAP_MAX_SIDE:
+        map_store = None
+
+    def factory():
+        if map_store is not None:
+            # 定点网格整体从磁盘缓存内存映射加载，按分块切片
+            map1, map2 = get_perspective_maps(src_w, src_h, fov, theta, phi, out_size, map_cache, map_store,
+                                              flip_vertical, cache_maps=False)
+            def strip_maps(start, stop):
+                return map1[start:stop], map2[start:stop]
+        else:
+            base_grid = get_base_grid(fov, phi, out_size, map_cache)
+            def strip_maps(start, stop):
+                return compute_perspective_maps(src_w, src_h, fov, theta, phi, out_size, base_grid,
+                                                flip_vertical, rows=(start, stop))
+        plan = build_remap_plan(strip_maps, out_size, src_w, src_h, interpolation)
+        # 缓存中的数组被多个线程共享，设为只读防止被意外修改
+        for task in plan[1]:
+            for m in task[2:]:
+                if m is not None and m.flags.writeable:
+                    m.flags.writeable = False
+        return plan
+
+    if map_cache is None:
+        return factory()
+    key = ('remap_plan',) + perspective_map_key(src_w, src_h, fov, theta, phi, out_size, flip_vertical,
+                                                fixed_point=map_store is not None) + (_coordinate_mode(interpolation),)
+    return map_cache.get_or_compute(key, factory)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+输入图片扫描 - 以生成器方式逐个产出图片路径（可递归子目录），边扫描边处理，
+无需先列出全部文件；支持包含/排除通配符，以及按路径哈希分片，多台机器可各自处理同一目录树的一部分
+"""
+
+import fnmatch
+import hashlib
+import os
+
+# 支持的图片格式
+SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
+
+
+def parse_shard(text):
+    """
+    解析分片参数 "INDEX/COUNT"（INDEX 从 0 开始）
+    返回: (index, count)，格式错误时抛出 ValueError
+    """
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"分片参数格式应为 INDEX/COUNT，例如 0/4，实际为 {text}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片编号必须在 0 到 COUNT-1 之间，实际为 {text}")
+    return index, count
+
+
+def shard_of(relative_path, count):
+    """
+    按相对路径的哈希计算所属分片
+    使用相对于输入目录的路径（统一为 / 分隔），不同机器上挂载位置不同也能得到相同的划分
+    """
+    digest = hashlib.sha1(relative_path.replace(os.sep, '/').encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def _matches(relative_path, patterns):
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(relative_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def is_image_candidate(relative_path, include_patterns=None, exclude_patterns=None, shard=None):
+    """
+    判断文件是否应当处理：扩展名受支持、未被排除、匹配包含通配符（如有）且属于指定分片
+    relative_path: 相对于输入目录的路径（/ 分隔）
+    """
+    if os.path.splitext(relative_path)[1].lower() not in SUPPORTED_FORMATS:
+        return False
+    if exclude_patterns and _matches(relative_path, exclude_patterns):
+        return False
+    if include_patterns and not _matches(relative_path, include_patterns):
+        return False
+    if shard is not None and shard_of(relative_path, shard[1]) != shard[0]:
+        return False
+    return True
+
+
+def iter_image_files(input_folder, recursive=False, include_patterns=None, exclude_patterns=None, shard=None,
+                     ignore_dirs=None):
+    """
+    逐个产出输入目录中的图片路径
+    recursive: 是否递归子目录
+    include_patterns: 包含的通配符列表（如 '*.jpg'、'2024-*/*'），匹配相对路径或文件名，默认全部包含
+    exclude_patterns: 排除的通配符列表，匹配的文件和目录（不再进入）都会跳过
+    shard: (index, count)，只产出按路径哈希属于第 index 个分片的文件
+    ignore_dirs: 不进入的目录（例如位于输入目录内的输出目录，避免把生成的视角当作输入）
+    同一目录中的条目按名称排序，多次运行的顺序一致
+    """
+    include_patterns = include_patterns or []
+    exclude_patterns = exclude_patterns or []
+    ignore_dirs = {os.path.abspath(d) for d in (ignore_dirs or [])}
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(input_folder, relative_dir)) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"无法读取目录 {os.path.join(input_folder, relative_dir)}: {str(e)}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            if exclude_patterns and _matches(relative_path, exclude_patterns):
+                continue
+            if entry.is_dir():
+                if recursive and os.path.abspath(entry.path) not in ignore_dirs:
+                    subdirs.append(relative_path)
+                continue
+            if entry.is_file() and is_image_candidate(relative_path, include_patterns, None, shard):
+                yield entry.path
+        # 倒序压栈，按名称顺序处理子目录
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻渲染服务 - 在本地启动 HTTP 服务（标准库 http.server，监听 TCP 端口或 Unix 套接字），
+以任务接口提供 generate_views_for_image 的功能
+
+每次调用 batch_process.py 都要启动 Python、导入 numpy/cv2 并重新计算采样网格；服务常驻后这些只发生一次，
+重映射网格缓存、定点网格磁盘缓存、渲染线程池和编码线程池在各次请求之间复用
+
+接口:
+    POST /render   渲染一张全景图
+        请求体为 JSON: {"input_path": 全景图路径, "output_dir": 输出目录（可选）, 以及渲染参数}
+        或请求体直接为图片字节（Content-Type: image/*），渲染参数放在查询字符串中（值按 JSON 解析，
+        例如 ?fov=90&size=[512,512]&name=room.jpg）
+        提供 output_dir 时写出视角图并返回输出路径；否则在响应中返回各视角的编码结果（base64）
+    GET /stats     队列深度、正在执行的任务数、任务计数、排队等待和总延迟的分布、网格缓存命中率
+    GET /health    存活检查
+
+渲染参数: fov, overlap, size [w, h], pitch_angle, flip_vertical, layout, ring_pitches, poses [[theta, phi], ...],
+    exclude_angles [[start, end], ...], interpolation, reduced_decode, format, quality, name（图片字节的文件名，
+    用于生成输出文件名）
+"""
+
+import argparse
+import base64
+import collections
+import json
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from batch_process import equirectangular_to_perspective, generate_views_for_image
+from config import DEFAULT_CONFIG, validate_angle_ranges
+from decoding import decode_panorama, read_panorama
+from encoders import OutputEncoder, EncoderPool
+from interpolation import INTERPOLATION_CHOICES
+from map_store import FixedPointMapStore
+from remap_cache import RemapCache, get_default_map_cache
+from views import VIEW_LAYOUTS, plan_views, view_output_filename
+
+# 任务参数及默认值
+JOB_DEFAULTS = {
+    'input_path': None,
+    'output_dir': None,
+    'name': None,
+    'fov': 90,
+    'overlap': 0.2,
+    'size': [1024, 1024],
+    'pitch_angle': 0,
+    'flip_vertical': False,
+    'layout': 'ring',
+    'ring_pitches': None,
+    'poses': None,
+    'exclude_angles': None,
+    'interpolation': None,
+    'reduced_decode': DEFAULT_CONFIG['reduced_decode'],
+    'format': None,
+    'quality': None,
+}
+
+# 延迟统计保留的最近任务数
+LATENCY_WINDOW = 1024
+
+
+class ServiceBusy(Exception):
+    """排队的任务数已达上限"""
+
+
+def _number(value, name):
+    """参数必须是数值（JSON 数字），返回 float，否则抛出 ValueError"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name}必须是数值，收到 {value!r}")
+    return float(value)
+
+
+def _number_list(value, name, length=None):
+    """参数必须是数值列表（length 指定时长度固定），返回 float 列表，否则抛出 ValueError"""
+    if not isinstance(value, (list, tuple)) or (length is not None and len(value) != length):
+        expected = f"包含 {length} 个数值的列表" if length is not None else "数值列表"
+        raise ValueError(f"{name}应为{expected}，收到 {value!r}")
+    return [_number(v, name) for v in value]
+
+
+def parse_job(params):
+    """
+    校验任务参数并补全默认值
+    返回: 任务字典（附加 view_plan 和 output_options），参数无效时抛出 ValueError
+    """
+    unknown = set(params) - set(JOB_DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知参数: {', '.join(sorted(unknown))}")
+    job = dict(JOB_DEFAULTS, **params)
+
+    job['fov'] = _number(job['fov'], "视场角")
+    if not 0 < job['fov'] < 180:
+        raise ValueError("视场角必须在0到180度之间")
+    job['overlap'] = _number(job['overlap'], "重叠比例")
+    if not 0 <= job['overlap'] < 1:
+        raise ValueError("重叠比例必须在0到1之间")
+    job['pitch_angle'] = _number(job['pitch_angle'], "俯仰角度")
+    if not -90 <= job['pitch_angle'] <= 90:
+        raise ValueError("俯仰角度必须在-90到90度之间")
+    if job['ring_pitches'] is not None:
+        job['ring_pitches'] = _number_list(job['ring_pitches'], "各圈俯仰角")
+        if any(p < -90 or p > 90 for p in job['ring_pitches']):
+            raise ValueError("各圈俯仰角必须在-90到90度之间")
+    size = _number_list(job['size'], "输出尺寸 [宽, 高]", 2)
+    if min(size) < 1:
+        raise ValueError("输出尺寸必须大于0")
+    job['size'] = (int(size[0]), int(size[1]))
+    if job['quality'] is not None:
+        job['quality'] = int(_number(job['quality'], "质量"))
+    if job['interpolation'] is None:
+        job['interpolation'] = DEFAULT_CONFIG['interpolation']
+    if job['interpolation'] not in INTERPOLATION_CHOICES:
+        raise ValueError(f"不支持的插值方式 {job['interpolation']}，可选: {', '.join(INTERPOLATION_CHOICES)}")
+    if job['layout'] not in VIEW_LAYOUTS:
+        raise ValueError(f"不支持的视角布局 {job['layout']}，可选: {', '.join(VIEW_LAYOUTS)}")
+
+    exclude_angle_ranges = job['exclude_angles'] or []
+    if not isinstance(exclude_angle_ranges, (list, tuple)):
+        raise ValueError(f"排除角度应为 [[起始, 结束], ...]，收到 {exclude_angle_ranges!r}")
+    exclude_angle_ranges = [tuple(_number_list(r, "排除角度范围", 2)) for r in exclude_angle_ranges]
+    if exclude_angle_ranges:
+        is_valid, error_msg = validate_angle_ranges(exclude_angle_ranges)
+        if not is_valid:
+            raise ValueError(error_msg)
+    job['exclude_angles'] = exclude_angle_ranges
+    if job['poses'] is not None:
+        if not isinstance(job['poses'], (list, tuple)):
+            raise ValueError(f"视角列表应为 [[水平角, 俯仰角], ...]，收到 {job['poses']!r}")
+        job['poses'] = [tuple(_number_list(pose, "视角 [水平角, 俯仰角]", 2)) for pose in job['poses']]
+    if job['layout'] == 'cubemap':
+        job['fov'] = 90
+    job['view_plan'] = plan_views(job['layout'], job['fov'], job['overlap'], job['pitch_angle'],
+                                  exclude_angle_ranges, bool(exclude_angle_ranges), job['ring_pitches'], job['poses'])
+
+    output_options = {}
+    if job['format'] is not None:
+        output_options['output_format'] = job['format']
+    if job['quality'] is not None:
+        output_options['jpeg_quality'] = job['quality']
+        output_options['webp_quality'] = job['quality']
+    job['output_options'] = output_options
+    return job
+
+
+def _latency_summary(values):
+    """延迟分布（毫秒）"""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def percentile(q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': values[-1] * 1000,
+    }
+
+
+class RenderService:
+    """
+    渲染任务执行器：固定数量的渲染线程从队列中取任务执行，网格缓存和编码线程池在任务之间复用
+    max_workers: 渲染线程数
+    encoder_workers: 每种输出编码设置的编码线程数
+    max_queue: 排队（尚未开始执行）的任务数上限，超出时拒绝新任务
+    map_cache: 重映射网格缓存（RemapCache），默认使用进程内共享缓存
+    map_store_dir: 定点采样网格的磁盘缓存目录，默认不使用
+    """
+
+    def __init__(self, max_workers=4, encoder_workers=2, max_queue=64, map_cache=None, map_store_dir=None):
+        self.max_workers = max_workers
+        self.encoder_workers = encoder_workers
+        self.max_queue = max_queue
+        self.map_cache = map_cache if map_cache is not None else get_default_map_cache()
+        self.map_store = FixedPointMapStore(map_store_dir) if map_store_dir else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._encoder_pools = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._queue_waits = collections.deque(maxlen=LATENCY_WINDOW)
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._started = time.time()
+
+    def _encoder_pool(self, output_options):
+        """按输出编码设置复用编码线程池"""
+        key = tuple(sorted(output_options.items()))
+        with self._lock:
+            pool = self._encoder_pools.get(key)
+            if pool is None:
+                pool = EncoderPool(OutputEncoder(output_options), self.encoder_workers)
+                self._encoder_pools[key] = pool
+            return pool
+
+    def submit(self, job, data=None):
+        """
+        提交任务（job 为 parse_job 的结果，data 为可选的图片字节）
+        返回: Future，结果为响应字典；队列已满时抛出 ServiceBusy
+        """
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ServiceBusy(f"排队任务数已达上限 {self.max_queue}")
+            self._queued += 1
+        return self._executor.submit(self._run, job, data, time.perf_counter())
+
+    def _run(self, job, data, enqueued):
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        ok = False
+        try:
+            result = self._render(job, data)
+            ok = True
+            return result
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._active -= 1
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                self._queue_waits.append(started - enqueued)
+                self._latencies.append(finished - enqueued)
+
+    def _render(self, job, data):
+        pool = self._encoder_pool(job['output_options'])
+        views = job['view_plan'][0]
+        input_path = job['input_path']
+        img = None
+        if data is not None:
+            img = decode_panorama(data, job['fov'], job['size'], job['reduced_decode'])
+            if img is None:
+                raise ValueError("无法解码图片数据")
+            input_path = job['name'] or 'panorama.jpg'
+        elif not input_path:
+            raise ValueError("需要提供 input_path 或图片数据")
+        elif not os.path.isfile(input_path):
+            raise ValueError(f"输入图片 {input_path} 不存在")
+
+        if job['output_dir']:
+            # 写出到磁盘：直接使用批量处理的单图流程
+            ok = generate_views_for_image(
+                input_path, job['output_dir'], job['fov'], job['overlap'], job['size'],
+                job['exclude_angles'], bool(job['exclude_angles']), job['pitch_angle'], job['flip_vertical'],
+                self.map_cache, self.map_store, encoder_pool=pool, reduced_decode=job['reduced_decode'],
+                interpolation=job['interpolation'], view_plan=job['view_plan'], image=img)
+            if not ok:
+                raise RuntimeError(f"处理 {input_path} 失败")
+            return {'outputs': [{'view_index': view_index, 'theta': theta, 'phi': phi,
+                                 'path': os.path.join(job['output_dir'],
+                                                      view_output_filename(input_path, view_index, pool.encoder))}
+                                for view_index, theta, phi in views]}
+
+        # 不写文件：编码结果随响应返回
+        if img is None:
+            img = read_panorama(input_path, job['fov'], job['size'], job['reduced_decode'])
+            if img is None:
+                raise ValueError(f"无法读取图片 {input_path}")
+        encoded = []
+        for view_index, theta, phi in views:
+            out = equirectangular_to_perspective(img, job['fov'], theta, phi, job['size'], job['flip_vertical'],
+                                                 self.map_cache, self.map_store, job['interpolation'])
+            encoded.append((view_index, theta, phi, pool.encode_async(out)))
+        return {'format': pool.encoder.format,
+                'views': [{'view_index': view_index, 'theta': theta, 'phi': phi,
+                           'data': base64.b64encode(future.result().tobytes()).decode('ascii')}
+                          for view_index, theta, phi, future in encoded]}
+
+    def stats(self):
+        """返回服务统计信息字典"""
+        with self._lock:
+            queue_waits = list(self._queue_waits)
+            latencies = list(self._latencies)
+            stats = {
+                'uptime_s': time.time() - self._started,
+                'workers': self.max_workers,
+                'queue_depth': self._queued,
+                'max_queue': self.max_queue,
+                'active': self._active,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+            }
+        stats['queue_wait'] = _latency_summary(queue_waits)
+        stats['latency'] = _latency_summary(latencies)
+        stats['map_cache'] = self.map_cache.stats()
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        for pool in self._encoder_pools.values():
+            pool.shutdown()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'PanoramaRenderService/1.0'
+
+    def address_string(self):
+        # Unix 套接字的客户端地址为空字符串
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return 'unix'
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/stats':
+            self._send_json(200, self.server.service.stats())
+        else:
+            self._send_json(404, {'error': f"未知路径 {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/render':
+            self._send_json(404, {'error': f"未知路径 {url.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        try:
+            if content_type == 'application/json':
+                params, data = json.loads(body.decode('utf-8') or '{}'), None
+            else:
+                params, data = _query_params(url.query), body
+            job = parse_job(params)
+            result = self.server.service.submit(job, data).result()
+        except ServiceBusy as e:
+            self._send_json(503, {'error': str(e)})
+        except (ValueError, TypeError, KeyError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+        else:
+            self._send_json(200, result)
+
+
+def _query_params(query):
+    """解析查询字符串，值按 JSON 解析（失败时保留为字符串）"""
+    params = {}
+    for key, values in parse_qs(query).items():
+        try:
+            params[key] = json.loads(values[-1])
+        except ValueError:
+            params[key] = values[-1]
+    return params
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host='127.0.0.1', port=8765, unix_socket=None):
+    """创建 HTTP 服务（提供 unix_socket 时监听 Unix 套接字，否则监听 host:port）"""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = _UnixHTTPServer(unix_socket, _RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全景图渲染常驻服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口，默认8765')
+    parser.add_argument('--unix-socket', default=None, metavar='PATH', help='监听 Unix 套接字（代替 TCP 端口）')
+    parser.add_argument('--threads', type=int, default=4, help='渲染线程数，默认4')
+    parser.add_argument('--encoder-workers', type=int, default=DEFAULT_CONFIG['encoder_workers'],
+                       help='编码线程数，默认2')
+    parser.add_argument('--max-queue', type=int, default=64, help='排队任务数上限，超出时返回 503，默认64')
+    parser.add_argument('--map-cache-mb', type=int, default=None,
+                       help='重映射网格缓存上限（MB），默认使用配置文件中的值')
+    parser.add_argument('--map-store', default=DEFAULT_CONFIG['map_store_dir'], metavar='DIR',
+                       help='定点采样网格的磁盘缓存目录，默认使用配置文件中的值')
+    args = parser.parse_args()
+
+    if args.threads < 1 or args.encoder_workers < 1:
+        print("错误：渲染和编码线程数必须大于0")
+        return
+    if args.max_queue < 1:
+        print("错误：排队任务数上限必须大于0")
+        return
+
+    map_cache = None
+    if args.map_cache_mb is not None:
+        if args.map_cache_mb < 0:
+            print("错误：网格缓存上限不能为负数")
+            return
+        map_cache = RemapCache(args.map_cache_mb * 1024 * 1024)
+
+    service = RenderService(args.threads, args.encoder_workers, args.max_queue, map_cache, args.map_store)
+    server = create_server(service, args.host, args.port, args.unix_socket)
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"渲染服务已启动: {address}（{args.threads} 个渲染线程，排队上限 {args.max_queue}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止渲染服务...")
+    finally:
+        server.server_close()
+        service.shutdown()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
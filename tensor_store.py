@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+张量输出 - 将视角图以 uint8 数组直接写入内存映射的 .npy 文件，供训练时直接读取，
+省去 JPEG 编码和数据加载时的解码
+
+视角数量事先未知（输入边扫描边处理），数据按固定行数分块保存:
+    tensor_00000.npy, tensor_00001.npy, ...   形状 (行数, 高, 宽, 3)，BGR 顺序
+    tensor_index.jsonl                        每行一条记录: 全局行号、所在分块和偏移、来源图片、视角编号和角度
+    tensor_meta.json                          分块大小、视角尺寸、总行数（处理结束时写入）
+渲染时 cv2.remap 通过 dst 参数直接写入内存映射中对应的行，没有中间复制
+"""
+
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+
+from encoders import write_buffer
+
+TENSOR_STORE_VERSION = 1
+TENSOR_INDEX_FILENAME = 'tensor_index.jsonl'
+TENSOR_META_FILENAME = 'tensor_meta.json'
+
+
+def _chunk_filename(chunk):
+    return f"tensor_{chunk:05d}.npy"
+
+
+class TensorStore:
+    """
+    分块的内存映射张量存储
+    output_dir: 输出目录（已有的张量输出会被覆盖）
+    out_size: 视角尺寸 (w, h)
+    chunk_rows: 每个分块的行数（视角数）
+    """
+
+    def __init__(self, output_dir, out_size, chunk_rows=1024):
+        self.output_dir = output_dir
+        self.out_w, self.out_h = out_size
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._next_row = 0
+        self._committed = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(output_dir, 'tensor_*.npy')):
+            os.remove(path)
+        for name in (TENSOR_INDEX_FILENAME, TENSOR_META_FILENAME):
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+        self._index_file = open(os.path.join(output_dir, TENSOR_INDEX_FILENAME), 'a', encoding='utf-8')
+
+    def _open_chunk(self, chunk):
+        path = os.path.join(self.output_dir, _chunk_filename(chunk))
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                         shape=(self.chunk_rows, self.out_h, self.out_w, 3))
+
+    def reserve(self):
+        """
+        分配一行，返回 (全局行号, 该行的数组视图)
+        数组视图直接指向内存映射文件，可作为 cv2.remap 的 dst
+        """
+        with self._lock:
+            row = self._next_row
+            self._next_row += 1
+            chunk, offset = divmod(row, self.chunk_rows)
+            while len(self._chunks) <= chunk:
+                self._chunks.append(self._open_chunk(len(self._chunks)))
+            return row, self._chunks[chunk][offset]
+
+    def commit(self, row, source, view_index, theta, phi):
+        """记录一行已写入完成及其来源（未提交的行为全零，不出现在索引中）"""
+        chunk, offset = divmod(row, self.chunk_rows)
+        record = {'row': row, 'chunk': chunk, 'offset': offset, 'source': source,
+                  'view_index': view_index, 'theta': theta, 'phi': phi}
+        with self._lock:
+            self._index_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._index_file.flush()
+            self._committed += 1
+
+    def close(self):
+        """
+        刷新所有分块；最后一个分块按实际使用的行数截短，写入元数据
+        返回: 提交的行数
+        """
+        with self._lock:
+            self._index_file.close()
+            for m in self._chunks:
+                m.flush()
+            used_in_last = self._next_row - (len(self._chunks) - 1) * self.chunk_rows
+            if self._chunks and used_in_last < self.chunk_rows:
+                last = len(self._chunks) - 1
+                path = os.path.join(self.output_dir, _chunk_filename(last))
+                tmp_path = path + '.tmp.npy'
+                np.save(tmp_path, np.asarray(self._chunks[last][:used_in_last]))
+                self._chunks[last] = None
+                os.replace(tmp_path, path)
+            self._chunks = []
+            meta = {
+                'version': TENSOR_STORE_VERSION,
+                'dtype': 'uint8',
+                'channel_order': 'BGR',
+                'view_width': self.out_w,
+                'view_height': self.out_h,
+                'chunk_rows': self.chunk_rows,
+                'chunks': [_chunk_filename(i) for i in range((self._next_row + self.chunk_rows - 1) // self.chunk_rows)],
+                'rows': self._next_row,
+                'committed_rows': self._committed,
+            }
+            write_buffer(os.path.join(self.output_dir, TENSOR_META_FILENAME),
+                         json.dumps(meta, ensure_ascii=False, indent=2).encode('utf-8'))
+            return self._committed
+
+
+class TensorDataset:
+    """
+    读取张量输出：按索引中的记录顺序访问各视角，数据以只读方式内存映射，不会整体读入内存
+    dataset[i] 返回 (视角数组, 记录字典)
+    """
+
+    def __init__(self, output_dir):
+        with open(os.path.join(output_dir, TENSOR_META_FILENAME), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != TENSOR_STORE_VERSION:
+            raise ValueError(f"不支持的张量输出版本 {self.meta.get('version')}")
+        self._chunks = [np.load(os.path.join(output_dir, name), mmap_mode='r') for name in self.meta['chunks']]
+        with open(os.path.join(output_dir, TENSOR_INDEX_FILENAME), 'r', encoding='utf-8') as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self.records.sort(key=lambda r: r['row'])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        record = self.records[i]
+        return self._chunks[record['chunk']][record['offset']], record
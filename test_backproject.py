@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+反投影测试 - 立方体贴图的 6 个面互不重叠，贴回时面与面的接缝处不能透出原全景图
+可直接运行，也可以用 pytest 运行
+"""
+
+import numpy as np
+
+from backproject import paste_views
+from batch_process import equirectangular_to_perspective
+from views import plan_views
+
+SRC_W, SRC_H = 1024, 512
+FACE_SIZE = (256, 256)
+
+
+def _cubemap_views():
+    return plan_views('cubemap', 90, 0.2, 0, [], False, None, None)[0]
+
+
+def _seam_columns():
+    """水平方向四个面的接缝（水平角 ±45°、±135°）所在的全景图列"""
+    return [int(round(SRC_W * (0.5 + lon / 360))) % SRC_W for lon in (-135, -45, 45, 135)]
+
+
+def test_cubemap_constant_views_cover_seams():
+    """把全部为 200 的视角贴回全暗的全景图，结果处处为 200（包括接缝）"""
+    panorama = np.full((SRC_H, SRC_W, 3), 10, dtype=np.uint8)
+    views = [(theta, phi, np.full((FACE_SIZE[1], FACE_SIZE[0], 3), 200, dtype=np.uint8))
+             for _, theta, phi in _cubemap_views()]
+    result = paste_views(panorama, views, 90)
+    assert result.min() >= 199, f"最小值 {result.min()}"
+    horizon = result[SRC_H // 4:SRC_H * 3 // 4]
+    for col in _seam_columns():
+        seam = horizon[:, max(0, col - 2):col + 3]
+        assert seam.min() >= 199, f"第 {col} 列接缝最小值 {seam.min()}"
+
+
+def test_cubemap_round_trip_seams():
+    """渲染立方体贴图后原样贴回，接缝处与原全景图一致"""
+    x = np.linspace(0, 4 * np.pi, SRC_W, dtype=np.float32)
+    y = np.linspace(0, 2 * np.pi, SRC_H, dtype=np.float32)
+    base = 127 + 60 * np.sin(x)[None, :] + 60 * np.cos(y)[:, None]
+    panorama = np.repeat(base[:, :, None], 3, axis=2).astype(np.uint8)
+    views = [(theta, phi, equirectangular_to_perspective(panorama, 90, theta, phi, FACE_SIZE,
+                                                         interpolation='linear'))
+             for _, theta, phi in _cubemap_views()]
+    # 贴到全黑的图上：透出底图的像素会明显偏暗
+    result = paste_views(np.zeros_like(panorama), views, 90)
+    diff = np.abs(result.astype(np.int16) - panorama.astype(np.int16))
+    horizon = diff[SRC_H // 4:SRC_H * 3 // 4]
+    for col in _seam_columns():
+        seam = horizon[:, max(0, col - 2):col + 3]
+        assert seam.max() <= 8, f"第 {col} 列接缝最大误差 {seam.max()}"
+    assert diff.mean() < 2, f"平均误差 {diff.mean():.2f}"
+
+
+if __name__ == "__main__":
+    test_cubemap_constant_views_cover_seams()
+    test_cubemap_round_trip_seams()
+    print("反投影测试通过")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+立方体贴图测试 - 全景图顶部（天空）应出现在 'up' 面，底部（地面）应出现在 'down' 面
+可直接运行，也可以用 pytest 运行
+"""
+
+import numpy as np
+
+from batch_process import equirectangular_to_perspective
+from views import CUBEMAP_FACES
+
+SRC_W, SRC_H = 1024, 512
+FACE_SIZE = (64, 64)
+
+
+def _render_faces(panorama):
+    return {name: equirectangular_to_perspective(panorama, 90, theta, phi, FACE_SIZE)
+            for name, theta, phi in CUBEMAP_FACES}
+
+
+def test_cubemap_up_face_sees_top_band():
+    """全景图顶部 1/8 为红色、底部 1/8 为蓝色：红色只出现在 up 面，蓝色只出现在 down 面"""
+    panorama = np.zeros((SRC_H, SRC_W, 3), dtype=np.uint8)
+    panorama[:SRC_H // 8] = (0, 0, 255)
+    panorama[-SRC_H // 8:] = (255, 0, 0)
+    faces = _render_faces(panorama)
+    # up 面的中心正对天顶
+    assert faces['up'][FACE_SIZE[1] // 2, FACE_SIZE[0] // 2].tolist() == [0, 0, 255]
+    assert faces['down'][FACE_SIZE[1] // 2, FACE_SIZE[0] // 2].tolist() == [255, 0, 0]
+    assert faces['up'][:, :, 0].max() == 0, "up 面不应包含地面"
+    assert faces['down'][:, :, 2].max() == 0, "down 面不应包含天空"
+    for name in ('front', 'right', 'back', 'left'):
+        # 水平方向的面最多看到纬度约 ±55° 以内，不包含两个色带（纬度 ±67.5° 以外）
+        assert faces[name].max() == 0, name
+
+
+if __name__ == "__main__":
+    test_cubemap_up_face_sees_top_band()
+    print("立方体贴图测试通过")
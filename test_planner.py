@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务规划测试 - 使用 GPano 元数据时，角度排除始终相对于相机（图片中心），不随方位角转动
+可直接运行，也可以用 pytest 运行
+"""
+
+from config import is_angle_excluded
+from planner import metadata_exclusion, orient_views
+from views import plan_views
+
+# 拍摄者位于相机后方
+EXCLUDE = [(150, 210)]
+
+
+def _oriented(heading, layout='ring'):
+    enable, image_exclusion = metadata_exclusion(EXCLUDE, True, True)
+    views = plan_views(layout, 90, 0.2, 0, EXCLUDE, enable, None, None)[0]
+    return orient_views(views, -heading % 360, image_exclusion)
+
+
+def test_exclusion_is_camera_relative_with_heading():
+    """方位角非零时，实际采样的水平角（相对于图片中心）仍然避开排除范围"""
+    for heading in (0, 37.5, 90, 200):
+        views = _oriented(heading)
+        assert views, heading
+        for _, theta, phi in views:
+            assert not is_angle_excluded(theta, EXCLUDE), (heading, theta)
+
+
+def test_excluded_views_are_renumbered():
+    """排除后的视角连续编号，与实际写出的视角一一对应"""
+    views = _oriented(90)
+    assert [view_index for view_index, _, _ in views] == list(range(len(views)))
+
+
+def test_poles_are_not_excluded():
+    """正对天顶、天底的视角没有水平方向，不参与角度排除"""
+    views = _oriented(90, 'cubemap')
+    assert sum(1 for _, _, phi in views if abs(phi) >= 90) == 2
+
+
+def test_without_metadata_plan_is_unchanged():
+    enable, image_exclusion = metadata_exclusion(EXCLUDE, True, False)
+    assert enable and image_exclusion is None
+    views = plan_views('ring', 90, 0.2, 0, EXCLUDE, enable, None, None)[0]
+    assert orient_views(views, 0, image_exclusion) is views
+
+
+if __name__ == "__main__":
+    test_exclusion_is_camera_relative_with_heading()
+    test_excluded_views_are_renumbered()
+    test_poles_are_not_excluded()
+    test_without_metadata_plan_is_unchanged()
+    print("任务规划测试通过")
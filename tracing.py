@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量级性能追踪 - 记录每张图片、每个视角各阶段（解码、网格、重映射、编码、写出）的耗时，
+可导出为 Chrome trace JSON（在 Perfetto / chrome://tracing 中查看）或按阶段汇总的耗时分布
+未启用时 span() 直接返回一个空的上下文管理器，几乎没有额外开销
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    """未启用追踪时使用的空上下文管理器"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.name, self.start_ns, time.perf_counter_ns(), **self.args)
+        return False
+
+
+class Tracer:
+    """
+    耗时记录器
+    每条记录为 (阶段名, 开始时间 ns, 结束时间 ns, 进程 id, 线程 id, 线程名, 附加参数)
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._events = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """清空已有记录并开始追踪"""
+        self.clear()
+        self.enabled = True
+
+    def stop(self):
+        """停止追踪，已有记录保留用于导出"""
+        self.enabled = False
+
+    def span(self, name, **args):
+        """记录一个代码块的耗时：with tracer.span('remap', view=3): ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, **args):
+        """直接记录一段已知起止时间的耗时"""
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        event = (name, start_ns, end_ns, os.getpid(), thread.ident, thread.name, args)
+        with self._lock:
+            self._events.append(event)
+
+    def add_events(self, events):
+        """合并其它进程记录的事件（多进程模式下由子进程返回）"""
+        if events:
+            with self._lock:
+                self._events.extend(events)
+
+    def drain(self):
+        """取出并清空已记录的事件"""
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+
+    def to_chrome_trace(self):
+        """转换为 Chrome trace 事件格式（时间单位为微秒）"""
+        events = self.events()
+        if not events:
+            return {'traceEvents': [], 'displayTimeUnit': 'ms'}
+        origin = min(e[1] for e in events)
+        trace_events = []
+        thread_names = {}
+        for name, start_ns, end_ns, pid, tid, thread_name, args in events:
+            trace_events.append({
+                'name': name, 'cat': 'panorama', 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': (start_ns - origin) / 1000.0, 'dur': (end_ns - start_ns) / 1000.0,
+                'args': {k: str(v) for k, v in args.items()},
+            })
+            thread_names[(pid, tid)] = thread_name
+        for (pid, tid), thread_name in thread_names.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                                 'args': {'name': f"{thread_name} (pid {pid})"}})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        """导出 Chrome trace JSON 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+    def stage_summary(self):
+        """
+        按阶段汇总耗时分布
+        返回: {阶段名: {'count', 'total_ms', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'histogram'}}
+            histogram 为按 2 的幂划分的毫秒区间计数，例如 {'<1': 10, '1-2': 5, '2-4': 3}
+        """
+        durations = {}
+        for name, start_ns, end_ns, *_ in self.events():
+            durations.setdefault(name, []).append((end_ns - start_ns) / 1e6)
+
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            histogram = {}
+            for v in values:
+                if v < 1:
+                    bucket = '<1'
+                else:
+                    low = 1
+                    while v >= low * 2:
+                        low *= 2
+                    bucket = f"{low}-{low * 2}"
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            summary[name] = {
+                'count': len(values),
+                'total_ms': sum(values),
+                'mean_ms': sum(values) / len(values),
+                'p50_ms': percentile(values, 0.5),
+                'p90_ms': percentile(values, 0.9),
+                'p99_ms': percentile(values, 0.99),
+                'max_ms': values[-1],
+                'histogram': histogram,
+            }
+        return summary
+
+    def format_summary(self):
+        """返回便于打印的阶段耗时汇总，每个阶段后附耗时分布（毫秒区间: 次数）"""
+        summary = self.stage_summary()
+        lines = [f"{'阶段':<10}{'次数':>8}{'总计(s)':>10}{'平均(ms)':>10}{'P50':>9}{'P90':>9}{'P99':>9}{'最大':>9}"]
+        for name, s in sorted(summary.items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<10}{s['count']:>8}{s['total_ms']/1000:>10.2f}{s['mean_ms']:>10.2f}"
+                         f"{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}")
+            buckets = sorted(s['histogram'].items(), key=lambda item: 0 if item[0] == '<1' else int(item[0].split('-')[0]))
+            lines.append("    分布: " + '  '.join(f"{bucket}ms:{count}" for bucket, count in buckets))
+        return '\n'.join(lines)
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    """获取进程内的全局追踪器"""
+    return _tracer
+
+
+def span(name, **args):
+    """使用全局追踪器记录一个代码块的耗时"""
+    if not _tracer.enabled:
+        return _NULL_SPAN
+    return _Span(_tracer, name, args)
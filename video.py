@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+360° 全景视频处理 - 用 cv2.VideoCapture 逐帧解码，按帧间隔和时间范围抽帧，
+每一帧按视角布局生成透视图，输出为图片序列或每个视角一个视频文件
+
+同一视频所有帧的尺寸相同，各视角的采样网格只计算一次（转换为定点格式，remap 更快）后在整段视频中复用；
+解码在独立线程中预读，与渲染、编码并行进行
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from config import DEFAULT_CONFIG
+from encoders import OutputEncoder, EncoderPool, write_buffer
+from interpolation import INTERPOLATION_CHOICES, resolve_interpolation
+from projection import get_perspective_maps
+from remap_cache import get_default_map_cache
+from views import VIEW_LAYOUTS, load_pose_list, plan_views
+
+VIDEO_OUTPUT_MODES = ('frames', 'video')
+
+# 预读结束标记
+_END = object()
+
+
+def _decode_ahead(cap, frame_queue, stride, start_frame, end_frame, stop_event):
+    """
+    预读线程：按帧间隔读取帧放入队列，队列满时阻塞
+    跳过的帧只调用 grab()（不做颜色转换和复制）
+    """
+    frame_index = start_frame
+    try:
+        while not stop_event.is_set() and (end_frame is None or frame_index < end_frame):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frame_queue.put((frame_index, frame))
+            frame_index += 1
+            for _ in range(stride - 1):
+                if end_frame is not None and frame_index >= end_frame:
+                    break
+                if not cap.grab():
+                    return
+                frame_index += 1
+    finally:
+        frame_queue.put(_END)
+
+
+def _fixed_point_view_maps(src_w, src_h, fov, views, out_size, flip_vertical, map_cache):
+    """计算各视角的采样网格并转换为定点格式，整段视频复用"""
+    maps = []
+    for view_index, theta, phi in views:
+        map_x, map_y = get_perspective_maps(src_w, src_h, fov, theta, phi, out_size, map_cache,
+                                            flip_vertical=flip_vertical)
+        maps.append(cv2.convertMaps(map_x, map_y, cv2.CV_16SC2))
+    return maps
+
+
+def process_video(input_path, output_dir, fov=90, overlap=0.2, out_size=(1024, 1024), pitch_angle=0,
+                  exclude_angle_ranges=None, enable_angle_exclusion=False, flip_vertical=False,
+                  layout='ring', ring_pitches=None, poses=None, stride=1, start_time=None, end_time=None,
+                  output_mode='frames', output_options=None, interpolation=None, render_workers=4,
+                  encoder_workers=None, prefetch_frames=4, map_cache=None):
+    """
+    处理一段 360° 全景视频
+    stride: 帧间隔，每 stride 帧处理一帧
+    start_time / end_time: 处理的时间范围（秒），默认整段视频
+    output_mode: 'frames'（每个视角一个目录，保存为图片序列）或 'video'（每个视角一个 mp4 文件，帧率为原帧率 / stride）
+    output_options: 图片序列的编码设置，见 encoders.OutputEncoder
+    render_workers: 渲染线程数（同一帧的各视角并行渲染）
+    prefetch_frames: 预读队列长度
+    其余参数同 batch_process.batch_process_images
+    返回: 处理的帧数，失败返回 None
+    """
+    if output_mode not in VIDEO_OUTPUT_MODES:
+        print(f"错误：不支持的视频输出模式 {output_mode}，可选: {', '.join(VIDEO_OUTPUT_MODES)}")
+        return None
+    if stride < 1:
+        print("错误：帧间隔必须大于0")
+        return None
+    if interpolation is None:
+        interpolation = DEFAULT_CONFIG['interpolation']
+    if map_cache is None:
+        map_cache = get_default_map_cache()
+    if layout == 'cubemap':
+        fov = 90
+    try:
+        views, n_views, excluded_count = plan_views(layout, fov, overlap, pitch_angle, exclude_angle_ranges,
+                                                    enable_angle_exclusion, ring_pitches, poses)
+        encoder = OutputEncoder(output_options)
+    except ValueError as e:
+        print(f"错误：{str(e)}")
+        return None
+
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        print(f"错误：无法打开视频 {input_path}")
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    src_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    src_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    start_frame = int(round(start_time * fps)) if start_time else 0
+    end_frame = int(round(end_time * fps)) if end_time is not None else None
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        # 部分容器无法精确定位，以实际位置为准
+        start_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    print(f"视频 {os.path.basename(input_path)}: {src_w}x{src_h}，{fps:.2f} fps，共 {total_frames} 帧")
+    print(f"处理范围: 第 {start_frame} 帧起{f'至第 {end_frame} 帧' if end_frame is not None else ''}，"
+          f"每 {stride} 帧取 1 帧，每帧 {len(views)} 个视角（排除 {excluded_count} 个）")
+
+    # 网格在整段视频中复用
+    view_maps = _fixed_point_view_maps(src_w, src_h, fov, views, out_size, flip_vertical, map_cache)
+    interpolation_flag = resolve_interpolation(interpolation, src_w, fov, out_size)
+
+    base_name = Path(input_path).stem
+    os.makedirs(output_dir, exist_ok=True)
+    writers = []
+    if output_mode == 'video':
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        for view_index, _, _ in views:
+            path = os.path.join(output_dir, f"{base_name}_view_{view_index:03d}.mp4")
+            writer = cv2.VideoWriter(path, fourcc, fps / stride, tuple(out_size))
+            if not writer.isOpened():
+                print(f"错误：无法创建视频文件 {path}")
+                for w in writers:
+                    w.release()
+                cap.release()
+                return None
+            writers.append(writer)
+    else:
+        for view_index, _, _ in views:
+            os.makedirs(os.path.join(output_dir, f"{base_name}_view_{view_index:03d}"), exist_ok=True)
+
+    frame_queue = queue.Queue(maxsize=max(1, prefetch_frames))
+    stop_event = threading.Event()
+    reader = threading.Thread(target=_decode_ahead, daemon=True,
+                              args=(cap, frame_queue, stride, start_frame, end_frame, stop_event))
+    reader.start()
+
+    def render(frame, maps):
+        return cv2.remap(frame, maps[0], maps[1], interpolation=interpolation_flag, borderMode=cv2.BORDER_WRAP)
+
+    if encoder_workers is None:
+        encoder_workers = DEFAULT_CONFIG['encoder_workers']
+    processed = 0
+    start = time.time()
+    pending_writes = []
+    try:
+        with ThreadPoolExecutor(max_workers=render_workers) as renderer, \
+                EncoderPool(encoder, encoder_workers) as encoder_pool:
+            while True:
+                item = frame_queue.get()
+                if item is _END:
+                    break
+                frame_index, frame = item
+                outputs = list(renderer.map(lambda m: render(frame, m), view_maps))
+                if output_mode == 'video':
+                    # 同一视角的帧必须按顺序写入
+                    for writer, out in zip(writers, outputs):
+                        writer.write(out)
+                else:
+                    for (view_index, _, _), out in zip(views, outputs):
+                        path = os.path.join(output_dir, f"{base_name}_view_{view_index:03d}",
+                                            f"frame_{frame_index:06d}{encoder.extension}")
+                        pending_writes.append((path, encoder_pool.encode_async(out)))
+                    # 写出已完成编码的帧，限制等待写出的数量
+                    while pending_writes and (pending_writes[0][1].done() or len(pending_writes) > 4 * len(views)):
+                        path, future = pending_writes.pop(0)
+                        write_buffer(path, future.result())
+                processed += 1
+                if processed % 100 == 0:
+                    print(f"已处理 {processed} 帧（{processed / (time.time() - start):.1f} 帧/秒）")
+            for path, future in pending_writes:
+                write_buffer(path, future.result())
+    finally:
+        stop_event.set()
+        # 让预读线程从阻塞的 put 中退出
+        while reader.is_alive():
+            try:
+                frame_queue.get_nowait()
+            except queue.Empty:
+                reader.join(0.1)
+        cap.release()
+        for writer in writers:
+            writer.release()
+
+    total_time = time.time() - start
+    print(f"\n视频处理完成！处理 {processed} 帧，生成 {processed * len(views)} 张视角图")
+    if processed:
+        print(f"总耗时: {total_time:.2f} 秒，平均 {processed / total_time:.2f} 帧/秒")
+    print(f"输出目录: {output_dir}")
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='360° 全景视频转透视图')
+    parser.add_argument('input_video', help='输入视频文件路径')
+    parser.add_argument('output_folder', help='输出文件夹路径')
+    parser.add_argument('--fov', type=int, default=90, help='视场角（度），默认90')
+    parser.add_argument('--overlap', type=float, default=0.2, help='重叠比例（0-1），默认0.2')
+    parser.add_argument('--size', type=int, nargs=2, default=[1024, 1024],
+                       metavar=('WIDTH', 'HEIGHT'), help='输出尺寸，默认1024x1024')
+    parser.add_argument('--pitch-angle', type=float, default=0, help='俯仰角度（度），默认0')
+    parser.add_argument('--exclude-angles', type=float, nargs=2, action='append',
+                       metavar=('START', 'END'), help='排除的角度范围，格式: START END，可多次使用')
+    parser.add_argument('--flip-vertical', action='store_true', help='启用垂直翻转功能')
+    parser.add_argument('--layout', choices=VIEW_LAYOUTS, default='ring', help='视角布局，默认ring')
+    parser.add_argument('--ring-pitches', type=float, nargs='+', default=None, metavar='PITCH',
+                       help='rings 布局各圈的俯仰角')
+    parser.add_argument('--poses', default=None, metavar='FILE',
+                       help='poses 布局的视角列表文件（JSON [[theta, phi], ...] 或每行 "theta phi"）')
+    parser.add_argument('--stride', type=int, default=1, help='帧间隔，每N帧处理1帧，默认1')
+    parser.add_argument('--start', type=float, default=None, help='开始时间（秒）')
+    parser.add_argument('--end', type=float, default=None, help='结束时间（秒）')
+    parser.add_argument('--output-mode', choices=VIDEO_OUTPUT_MODES, default='frames',
+                       help='frames（每个视角一个图片序列目录）或 video（每个视角一个 mp4 文件），默认frames')
+    parser.add_argument('--format', choices=['jpg', 'webp', 'png'], default=DEFAULT_CONFIG['output_format'],
+                       help='图片序列格式，默认jpg')
+    parser.add_argument('--quality', type=int, default=None, help='JPEG/WebP 质量（0-100）')
+    parser.add_argument('--interpolation', choices=INTERPOLATION_CHOICES, default=DEFAULT_CONFIG['interpolation'],
+                       help='插值方式，默认lanczos')
+    parser.add_argument('--threads', type=int, default=4, help='渲染线程数，默认4')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_video):
+        print(f"错误：输入视频 {args.input_video} 不存在")
+        return
+    if args.threads < 1:
+        print("错误：线程数必须大于0")
+        return
+    if args.overlap < 0 or args.overlap >= 1:
+        print("错误：重叠比例必须在0到1之间")
+        return
+    if args.pitch_angle < -90 or args.pitch_angle > 90:
+        print("错误：俯仰角度必须在-90到90度之间")
+        return
+    if args.start is not None and args.end is not None and args.end <= args.start:
+        print("错误：结束时间必须大于开始时间")
+        return
+
+    exclude_angle_ranges = []
+    if args.exclude_angles:
+        from config import validate_angle_ranges
+        is_valid, error_msg = validate_angle_ranges(args.exclude_angles)
+        if not is_valid:
+            print(f"错误：{error_msg}")
+            return
+        exclude_angle_ranges = args.exclude_angles
+
+    poses = None
+    if args.layout == 'poses':
+        if not args.poses:
+            print("错误：poses 布局需要使用 --poses 指定视角列表文件")
+            return
+        try:
+            poses = load_pose_list(args.poses)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print(f"错误：无法读取视角列表 {args.poses}: {str(e)}")
+            return
+
+    output_options = {'output_format': args.format}
+    if args.quality is not None:
+        output_options['jpeg_quality'] = args.quality
+        output_options['webp_quality'] = args.quality
+
+    process_video(args.input_video, args.output_folder, fov=args.fov, overlap=args.overlap,
+                  out_size=tuple(args.size), pitch_angle=args.pitch_angle,
+                  exclude_angle_ranges=exclude_angle_ranges, enable_angle_exclusion=bool(exclude_angle_ranges),
+                  flip_vertical=args.flip_vertical, layout=args.layout, ring_pitches=args.ring_pitches,
+                  poses=poses, stride=args.stride, start_time=args.start, end_time=args.end,
+                  output_mode=args.output_mode,
+                  output_options=output_options, interpolation=args.interpolation, render_workers=args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视角规划 - 计算每张全景图需要生成的视角及输出文件名
+支持的布局: 单圈水平视角（ring）、多圈不同俯仰角（rings）、6 面立方体贴图（cubemap）、自定义视角列表（poses）
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+
+from config import is_angle_excluded
+
+# 视角布局
+VIEW_LAYOUTS = ('ring', 'rings', 'cubemap', 'poses')
+
+# 立方体贴图各面的 (名称, theta, phi)，依次为前、右、后、左、上、下
+# 俯仰角为正时视角向下（phi=90 正对天底，phi=-90 正对天顶）
+CUBEMAP_FACES = (
+    ('front', 0, 0),
+    ('right', 90, 0),
+    ('back', 180, 0),
+    ('left', 270, 0),
+    ('up', 0, -90),
+    ('down', 0, 90),
+)
+
+
+def plan_ring_views(fov, overlap, pitch_angle=0, exclude_angle_ranges=None, enable_angle_exclusion=False):
+    """
+    规划一圈水平视角
+    返回: (views, n_views, excluded_count)
+        views: [(view_index, theta, phi), ...]，view_index 为输出文件编号（跳过被排除的视角）
+        n_views: 排除前的视角总数
+        excluded_count: 被排除的视角数
+    """
+    # 计算步进角度（比如 fov=90, overlap=0.2 → step=72）
+    step = fov * (1 - overlap)
+    n_views = int(math.ceil(360 / step))
+
+    views = []
+    excluded_count = 0
+    for i in range(n_views):
+        theta = i * step  # 水平角
+        phi = pitch_angle  # 垂直方向俯仰角
+
+        # 检查是否应该排除这个角度
+        if enable_angle_exclusion and exclude_angle_ranges:
+            if is_angle_excluded(theta, exclude_angle_ranges):
+                excluded_count += 1
+                continue
+
+        views.append((len(views), theta, phi))
+    return views, n_views, excluded_count
+
+
+def default_ring_pitches(fov, overlap):
+    """
+    多圈布局的默认俯仰角：以 0° 为中心，按 fov × (1 - overlap) 的间隔向上下扩展，直到覆盖天顶和天底
+    """
+    step = fov * (1 - overlap)
+    n = int(math.ceil(max(0, 90 - fov / 2) / step))
+    return [max(-90, min(90, k * step)) for k in range(-n, n + 1)]
+
+
+def ring_view_count(fov, overlap, pitch):
+    """单圈视角数：按俯仰角的余弦缩放，高纬度的圈周长更短，所需视角更少（至少 1 个）"""
+    step = fov * (1 - overlap)
+    return max(1, int(math.ceil(360 * math.cos(math.radians(abs(pitch))) / step - 1e-9)))
+
+
+def _is_pole(phi):
+    # 正对天顶/天底的视角没有水平方向，不参与角度排除
+    return abs(phi) >= 90
+
+
+def plan_multi_ring_views(fov, overlap, ring_pitches=None, exclude_angle_ranges=None, enable_angle_exclusion=False):
+    """
+    规划多圈视角，每圈的视角数按 cos(俯仰角) 缩放，角度排除分别应用于每一圈
+    ring_pitches: 各圈俯仰角列表，默认见 default_ring_pitches
+    返回: (views, n_views, excluded_count)，含义同 plan_ring_views
+    """
+    if not ring_pitches:
+        ring_pitches = default_ring_pitches(fov, overlap)
+    views = []
+    n_views = 0
+    excluded_count = 0
+    for pitch in ring_pitches:
+        count = ring_view_count(fov, overlap, pitch)
+        n_views += count
+        for i in range(count):
+            theta = i * 360 / count
+            if enable_angle_exclusion and exclude_angle_ranges and not _is_pole(pitch):
+                if is_angle_excluded(theta, exclude_angle_ranges):
+                    excluded_count += 1
+                    continue
+            views.append((len(views), theta, pitch))
+    return views, n_views, excluded_count
+
+
+def plan_cubemap_views(exclude_angle_ranges=None, enable_angle_exclusion=False):
+    """
+    规划 6 面立方体贴图视角（需使用 90° 视场角和正方形输出），顺序见 CUBEMAP_FACES
+    角度排除只应用于水平的 4 个面
+    返回: (views, n_views, excluded_count)
+    """
+    return plan_pose_views([(theta, phi) for _, theta, phi in CUBEMAP_FACES],
+                           exclude_angle_ranges, enable_angle_exclusion)
+
+
+def plan_pose_views(poses, exclude_angle_ranges=None, enable_angle_exclusion=False):
+    """
+    按自定义视角列表规划
+    poses: [(theta, phi), ...]
+    返回: (views, n_views, excluded_count)
+    """
+    views = []
+    excluded_count = 0
+    for theta, phi in poses:
+        if enable_angle_exclusion and exclude_angle_ranges and not _is_pole(phi):
+            if is_angle_excluded(theta, exclude_angle_ranges):
+                excluded_count += 1
+                continue
+        views.append((len(views), theta, phi))
+    return views, len(poses), excluded_count
+
+
+def load_pose_list(path):
+    """
+    读取自定义视角列表
+    支持 JSON（[[theta, phi], ...] 或 [{"theta": .., "phi": ..}, ...]）
+    或文本文件（每行 "theta phi"，# 开头为注释）
+    返回: [(theta, phi), ...]，格式错误时抛出 ValueError
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    poses = []
+    if text.lstrip().startswith('['):
+        for item in json.loads(text):
+            if isinstance(item, dict):
+                poses.append((float(item['theta']), float(item.get('phi', 0))))
+            else:
+                poses.append((float(item[0]), float(item[1])))
+    else:
+        for line in text.splitlines():
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(',', ' ').split()
+            if len(parts) != 2:
+                raise ValueError(f"视角列表格式错误（每行应为 \"theta phi\"）: {line}")
+            poses.append((float(parts[0]), float(parts[1])))
+    for theta, phi in poses:
+        if not -90 <= phi <= 90:
+            raise ValueError(f"视角俯仰角必须在-90到90度之间: {phi}")
+    if not poses:
+        raise ValueError(f"视角列表 {path} 为空")
+    return poses
+
+
+def plan_views(layout, fov, overlap, pitch_angle=0, exclude_angle_ranges=None, enable_angle_exclusion=False,
+               ring_pitches=None, poses=None):
+    """
+    按布局规划视角
+    layout: 'ring'（单圈，俯仰角 pitch_angle）、'rings'（多圈，俯仰角 ring_pitches）、
+            'cubemap'（6 面立方体贴图）或 'poses'（自定义视角列表 poses）
+    返回: (views, n_views, excluded_count)
+    """
+    if layout == 'ring':
+        return plan_ring_views(fov, overlap, pitch_angle, exclude_angle_ranges, enable_angle_exclusion)
+    if layout == 'rings':
+        return plan_multi_ring_views(fov, overlap, ring_pitches, exclude_angle_ranges, enable_angle_exclusion)
+    if layout == 'cubemap':
+        return plan_cubemap_views(exclude_angle_ranges, enable_angle_exclusion)
+    if layout == 'poses':
+        if not poses:
+            raise ValueError("poses 布局需要提供视角列表")
+        return plan_pose_views(poses, exclude_angle_ranges, enable_angle_exclusion)
+    raise ValueError(f"不支持的视角布局 {layout}，可选: {', '.join(VIEW_LAYOUTS)}")
+
+
+def view_output_filename(input_path, view_index, encoder=None):
+    """生成输出文件名，提供 encoder（OutputEncoder）时使用其命名格式和扩展名"""
+    base_name = Path(input_path).stem
+    if encoder is not None:
+        return encoder.output_filename(base_name, view_index)
+    return f"{base_name}_view_{view_index:03d}.jpg"
+
+
+def image_output_dir(output_base_dir, input_path, input_root=None):
+    """
+    每张图片的输出目录：output_base_dir/图片名
+    提供 input_root 时保留图片相对于输入目录的子目录结构（递归扫描时不同子目录中的同名图片不会冲突）
+    """
+    stem = Path(input_path).stem
+    if input_root is not None:
+        relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(input_path)), os.path.abspath(input_root))
+        if relative_dir != '.':
+            return os.path.join(output_base_dir, relative_dir, stem)
+    return os.path.join(output_base_dir, stem)
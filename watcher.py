@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视输入目录 - 持续产出新到达（或被替换）且已写完的图片路径，用于连续处理相机不断写入的目录
+
+Linux 上使用 inotify（通过 ctypes 调用 libc，无额外依赖）接收文件事件；不支持 inotify 的平台、
+网络文件系统（NFS/SMB 上其他机器写入的文件不会产生 inotify 事件）或指定 poll=True 时改为轮询：
+每次只 stat 已知的目录，目录的修改时间变化时才重新列出该目录，默认不做整个目录树的重复扫描；
+原地改写已有文件不会改变目录的修改时间，需要发现这类改写时可指定 rescan_interval 定期重新列出全部目录
+
+写入中的文件通过去抖判断：文件的大小和修改时间在 debounce 秒内保持不变才视为写完
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from scanner import _matches, is_image_candidate
+
+# inotify 事件标志（见 inotify(7)）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """inotify 文件描述符的最小封装"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read_events(self, timeout):
+        """等待最多 timeout 秒，返回 [(wd, mask, name), ...]"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def inotify_available():
+    """当前平台是否可以使用 inotify"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        _Inotify().close()
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+class FolderWatcher:
+    """
+    监视输入目录，iter_ready() 逐个产出已写完的图片路径
+    recursive / include_patterns / exclude_patterns / shard: 同 scanner.iter_image_files
+    debounce: 文件大小和修改时间保持不变的秒数，达到后才视为写完
+    poll_interval: 轮询模式下检查目录的间隔（秒）
+    rescan_interval: 轮询模式下重新列出全部目录（并 stat 其中所有文件）的间隔（秒），默认不重新列出；
+        原地改写文件不会改变目录的修改时间，只有指定该参数时轮询模式才能发现
+    poll: 强制使用轮询（网络文件系统上使用）；默认 inotify 可用时使用 inotify
+    ignore_dirs: 不监视的目录（例如位于输入目录内的输出目录）
+    is_processed: 可选的回调 is_processed(path)，文件当前内容已处理完成时返回 True（通常为处理清单的 is_complete）；
+        提供时已产出的文件处理完成后不再保留记录，长时间运行时内存不随处理的文件数增长
+    """
+
+    def __init__(self, input_folder, recursive=False, include_patterns=None, exclude_patterns=None, shard=None,
+                 debounce=2.0, poll_interval=1.0, poll=False, ignore_dirs=None, is_processed=None,
+                 rescan_interval=None):
+        self.input_folder = os.path.abspath(input_folder)
+        self.recursive = recursive
+        self.include_patterns = include_patterns or []
+        self.exclude_patterns = exclude_patterns or []
+        self.shard = shard
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self._last_rescan = time.monotonic()
+        self.ignore_dirs = {os.path.abspath(d) for d in (ignore_dirs or [])}
+        self.is_processed = is_processed
+        # 目录 -> 修改时间（轮询模式据此判断是否需要重新列出）
+        self._dirs = {}
+        # 等待写完的文件: 路径 -> [(大小, 修改时间), 最近一次变化的时间]
+        self._pending = {}
+        # 已产出的文件: 路径 -> (大小, 修改时间)，内容未变化时不重复产出；
+        # 提供 is_processed 时只保留尚未处理完成的文件，之后由 is_processed 判断
+        self._yielded = {}
+        self._inotify = None
+        self._wd_dirs = {}
+        if not poll and inotify_available():
+            self._inotify = _Inotify()
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify is not None else 'poll'
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.input_folder).replace(os.sep, '/')
+
+    def _watch_dir(self, path):
+        if self._inotify is None:
+            return
+        try:
+            self._wd_dirs[self._inotify.add_watch(path)] = path
+        except OSError as e:
+            # 通常是 fs.inotify.max_user_watches 不足，整体改为轮询
+            print(f"无法监视目录 {path}: {str(e)}，改为轮询")
+            self._inotify.close()
+            self._inotify = None
+            self._wd_dirs = {}
+
+    def _scan_dir(self, path):
+        """列出一个目录：登记子目录（递归时），登记其中的图片文件"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            self._dirs.pop(path, None)
+            return
+        if path not in self._dirs:
+            # 先开始监视再处理列出的条目，列出之后到达的文件也不会遗漏
+            self._watch_dir(path)
+        self._dirs[path] = mtime
+        for entry in entries:
+            relative_path = self._relative(entry.path)
+            if entry.is_dir():
+                if (self.recursive and entry.path not in self._dirs and entry.path not in self.ignore_dirs
+                        and not (self.exclude_patterns and _matches(relative_path, self.exclude_patterns))):
+                    self._scan_dir(entry.path)
+            elif entry.is_file() and is_image_candidate(relative_path, self.include_patterns,
+                                                        self.exclude_patterns, self.shard):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                self._touch(entry.path, (st.st_size, st.st_mtime_ns))
+
+    def _touch(self, path, signature=None):
+        """文件有变化：登记或更新等待写完的状态"""
+        if signature is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._pending.pop(path, None)
+                return
+            signature = (st.st_size, st.st_mtime_ns)
+        entry = self._pending.get(path)
+        if entry is None:
+            if self._yielded.get(path) == signature:
+                return
+            if self.is_processed is not None and path not in self._yielded and self.is_processed(path):
+                return
+            now = time.monotonic()
+            # 修改时间已超过去抖时间的文件（如原子重命名进来的文件）无需再等待
+            settled = time.time() - signature[1] / 1e9 >= self.debounce
+            self._pending[path] = [signature, now - self.debounce if settled else now]
+        elif entry[0] != signature:
+            entry[0] = signature
+            entry[1] = time.monotonic()
+
+    def _prune_yielded(self):
+        """移除已处理完成的文件的记录"""
+        if self.is_processed is None:
+            return
+        for path in list(self._yielded):
+            if self.is_processed(path):
+                del self._yielded[path]
+
+    def _pop_ready(self):
+        """返回已写完的文件（按路径排序）"""
+        self._prune_yielded()
+        now = time.monotonic()
+        ready = []
+        for path, entry in list(self._pending.items()):
+            if now - entry[1] < self.debounce:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if signature != entry[0]:
+                entry[0], entry[1] = signature, now
+                continue
+            del self._pending[path]
+            self._yielded[path] = signature
+            ready.append(path)
+        return sorted(ready)
+
+    def _next_timeout(self):
+        """距离下一个文件可能写完的时间，最长 poll_interval"""
+        timeout = self.poll_interval
+        now = time.monotonic()
+        for _, last in self._pending.values():
+            timeout = min(timeout, max(0.0, last + self.debounce - now))
+        return timeout
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出，部分事件已丢失，只能重新列出所有已知目录
+            print("inotify 事件队列溢出，重新检查所有目录")
+            for path in list(self._dirs):
+                self._scan_dir(path)
+            return
+        directory = self._wd_dirs.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            # 目录已被删除或移走
+            del self._wd_dirs[wd]
+            self._dirs.pop(directory, None)
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive and path not in self.ignore_dirs \
+                    and not (self.exclude_patterns and _matches(self._relative(path), self.exclude_patterns)):
+                self._scan_dir(path)
+            return
+        if not is_image_candidate(self._relative(path), self.include_patterns, self.exclude_patterns, self.shard):
+            return
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self._pending.pop(path, None)
+            self._yielded.pop(path, None)
+        else:
+            self._touch(path)
+
+    def _poll_dirs(self):
+        """轮询：只重新列出修改时间变化的目录；指定 rescan_interval 时每隔该时间重新列出全部目录"""
+        now = time.monotonic()
+        if self.rescan_interval is not None and now - self._last_rescan >= self.rescan_interval:
+            self._last_rescan = now
+            for path in list(self._dirs):
+                self._scan_dir(path)
+            return
+        for path, mtime in list(self._dirs.items()):
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                self._dirs.pop(path, None)
+                continue
+            if current != mtime:
+                self._scan_dir(path)
+
+    def iter_ready(self, stop_event=None):
+        """
+        先产出目录中已有的图片，之后持续产出新到达或被替换的图片，直到 stop_event 被设置
+        同一文件内容未变化时不会重复产出
+        """
+        self._scan_dir(self.input_folder)
+        try:
+            while stop_event is None or not stop_event.is_set():
+                for path in self._pop_ready():
+                    yield path
+                timeout = self._next_timeout()
+                if self._inotify is not None:
+                    for wd, mask, name in self._inotify.read_events(timeout):
+                        self._handle_event(wd, mask, name)
+                else:
+                    time.sleep(timeout)
+                    self._poll_dirs()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None